@@ -12,6 +12,7 @@ import { createClient } from '@supabase/supabase-js'
  * Query Parameters:
  * - hoursBeforeExpiry (optional): Refresh tokens expiring within this many hours (default: 24)
  * - provider (optional): OAuth provider, defaults to 'google'
+ * - userId (optional): only refresh this user's token
  * 
  * Usage from n8n cron:
  * POST /api/auth/refresh-tokens?hoursBeforeExpiry=24&provider=google
@@ -64,6 +65,7 @@ export async function POST(request: NextRequest) {
     const { searchParams } = new URL(request.url)
     const hoursBeforeExpiry = parseInt(searchParams.get('hoursBeforeExpiry') || '24', 10)
     const provider = searchParams.get('provider') || 'google'
+    const userId = searchParams.get('userId')
 
     // Get Google OAuth credentials
     const googleClientId = process.env.GOOGLE_CLIENT_ID || process.env.NEXT_PUBLIC_GOOGLE_CLIENT_ID
@@ -80,12 +82,16 @@ export async function POST(request: NextRequest) {
     const expiryThreshold = new Date(Date.now() + hoursBeforeExpiry * 60 * 60 * 1000)
 
     // Find tokens that are expiring soon and have refresh tokens
-    const { data: expiringTokens, error: queryError } = await supabaseAdmin
+    let tokensQuery = supabaseAdmin
       .from('oauth_tokens')
       .select('*')
       .eq('provider', provider)
       .not('refresh_token', 'is', null)
       .or(`expires_at.is.null,expires_at.lte.${expiryThreshold.toISOString()}`)
+    if (userId) {
+      tokensQuery = tokensQuery.eq('user_id', userId)
+    }
+    const { data: expiringTokens, error: queryError } = await tokensQuery
 
     if (queryError) {
       console.error('Error querying expiring tokens:', queryError)
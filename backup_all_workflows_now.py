@@ -1,90 +1,61 @@
 #!/usr/bin/env python3
 """
 Backup all n8n workflows to local filesystem.
-This script uses the n8n MCP tools via subprocess calls.
+Lists workflows and fetches every full workflow through the n8n REST API
+(see n8n_backup.py) instead of spawning an MCP subprocess per page.
+Only workflows changed since the last run are fetched; pass --full to
+refetch everything.
 """
 
-import json
-import subprocess
-import re
+import os
+import sys
 from pathlib import Path
-from datetime import datetime
 
-def sanitize_filename(name):
-    """Convert workflow name to safe filename."""
-    # Replace spaces with hyphens, lowercase, remove special chars
-    name = name.lower()
-    name = re.sub(r'[^\w\s-]', '', name)
-    name = re.sub(r'[-\s]+', '-', name)
-    return name.strip('-')
+from n8n_backup import DEFAULT_URL, N8nApiError, N8nClient, print_report, run_backup
+from workflow_io import MANIFEST_NAME
 
-def get_all_workflows():
-    """Get all workflows from n8n using MCP."""
-    workflows = []
-    cursor = None
-    
-    while True:
-        cmd = ['npx', '-y', '@modelcontextprotocol/cli', 'mcp_n8n-mcp_n8n_list_workflows', '--limit', '100']
-        if cursor:
-            cmd.extend(['--cursor', cursor])
-        
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            data = json.loads(result.stdout)
-            
-            if 'workflows' in data:
-                workflows.extend(data['workflows'])
-            
-            if not data.get('hasMore', False):
-                break
-            
-            cursor = data.get('nextCursor')
-        except subprocess.CalledProcessError as e:
-            print(f"Error fetching workflows: {e.stderr}")
-            break
-        except json.JSONDecodeError:
-            print(f"Error parsing JSON: {result.stdout}")
-            break
-    
-    return workflows
+def get_client():
+    """Create a REST API client from N8N_URL / N8N_API_KEY."""
+    api_key = os.environ.get('N8N_API_KEY')
+    if not api_key:
+        raise SystemExit("Error: N8N_API_KEY is not set")
+    return N8nClient(os.environ.get('N8N_URL', DEFAULT_URL), api_key)
+
+def get_all_workflows(client):
+    """Get all workflow summaries from n8n, following every page."""
+    try:
+        return list(client.list_workflows())
+    except N8nApiError as e:
+        print(f"Error fetching workflows: {e}")
+        return []
 
-def fetch_workflow(workflow_id):
+def fetch_workflow(client, workflow_id):
     """Fetch full workflow JSON by ID."""
-    # Note: This is a simplified version - in practice you'd use the MCP tool
-    # For now, we'll need to use the actual MCP interface
-    return None
+    try:
+        return client.get_workflow(workflow_id)
+    except N8nApiError as e:
+        print(f"Error fetching workflow {workflow_id}: {e}")
+        return None
 
 def main():
     workflows_dir = Path(__file__).parent / 'workflows'
     workflows_dir.mkdir(exist_ok=True)
+    # Incremental by default: only changed workflows are fetched and rewritten
+    incremental = '--full' not in sys.argv[1:]
     
+    client = get_client()
     print("Fetching all workflows...")
-    workflows = get_all_workflows()
-    print(f"Found {len(workflows)} workflows")
-    
-    # Save workflow list
-    workflow_list = []
-    for wf in workflows:
-        workflow_list.append({
-            'id': wf['id'],
-            'name': wf['name'],
-            'active': wf.get('active', False),
-            'isArchived': wf.get('isArchived', False),
-            'nodeCount': wf.get('nodeCount', 0),
-            'updatedAt': wf.get('updatedAt', '')
-        })
-    
-    list_file = workflows_dir / '.workflow_list_backup.json'
-    with open(list_file, 'w') as f:
-        json.dump({
-            'backup_date': datetime.now().isoformat(),
-            'total_workflows': len(workflows),
-            'workflows': workflow_list
-        }, f, indent=2)
+    try:
+        stats = run_backup(client, workflows_dir, incremental=incremental)
+    except N8nApiError as e:
+        print(f"Error fetching workflows: {e}")
+        sys.exit(1)
+    finally:
+        client.close()
     
-    print(f"Saved workflow list to {list_file}")
-    print(f"\nTo backup individual workflows, use:")
-    print(f"  mcp_n8n-mcp_n8n_get_workflow id=<workflow_id> mode=full")
+    print(f"Found {stats['listed']} workflows")
+    print(f"Saved workflow list to {workflows_dir / MANIFEST_NAME}")
+    print_report(stats)
 
 if __name__ == '__main__':
     main()
@@ -4,46 +4,18 @@ Backup all n8n workflows to local git repository.
 This script will be called with workflow data from n8n MCP.
 """
 
-import json
-import os
-import re
-import sys
-from pathlib import Path
+from workflow_io import WORKFLOWS_DIR, WorkflowWriter
 
-def sanitize_filename(name):
-    """Sanitize workflow name for filename: lowercase, replace spaces with hyphens"""
-    # Convert to lowercase
-    name = name.lower()
-    # Replace spaces, underscores, and special chars with hyphens
-    name = re.sub(r'[\s_]+', '-', name)
-    # Remove special characters except hyphens
-    name = re.sub(r'[^a-z0-9\-]', '', name)
-    # Remove multiple consecutive hyphens
-    name = re.sub(r'-+', '-', name)
-    # Remove leading/trailing hyphens
-    name = name.strip('-')
-    return name or 'unnamed-workflow'
-
-def save_workflow(workflow_data, workflows_dir):
+def save_workflow(workflow_data, workflows_dir=WORKFLOWS_DIR):
     """Save a single workflow to JSON file"""
-    workflow_id = workflow_data.get('id')
-    workflow_name = workflow_data.get('name', 'Unnamed Workflow')
-    
-    # Sanitize filename
-    filename = sanitize_filename(workflow_name)
-    filepath = workflows_dir / f"{filename}.json"
-    
-    # Write workflow JSON
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(workflow_data, f, indent=2, ensure_ascii=False)
-    
+    with WorkflowWriter(workflows_dir) as writer:
+        filepath, _ = writer.save(workflow_data)
     return filepath
 
 if __name__ == '__main__':
-    workflows_dir = Path(__file__).parent / 'workflows'
-    workflows_dir.mkdir(exist_ok=True)
+    WORKFLOWS_DIR.mkdir(exist_ok=True)
     
     # This script expects workflow JSON to be passed via stdin or as argument
     # For now, it's a placeholder - actual saving will be done via write tool
-    print(f"Workflows directory: {workflows_dir}")
+    print(f"Workflows directory: {WORKFLOWS_DIR}")
     print("Ready to save workflows...")
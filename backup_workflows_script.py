@@ -3,17 +3,9 @@
 Backup all n8n workflows.
 This script will be run to fetch and save workflows.
 """
-import json
-import re
-from pathlib import Path
 from datetime import datetime
 
-def sanitize_filename(name):
-    """Convert workflow name to safe filename."""
-    name = name.lower()
-    name = re.sub(r'[^\w\s-]', '', name)
-    name = re.sub(r'[-\s]+', '-', name)
-    return name.strip('-')
+from workflow_io import WORKFLOWS_DIR, atomic_write_json
 
 # List of important workflows to backup
 important_workflows = [
@@ -28,14 +20,14 @@ important_workflows = [
     {'id': 'HwRvoNIeRyF8W0NG', 'name': '[ARCHIVED] Google Auth Supabase Powered Onboarding'},
 ]
 
-workflows_dir = Path('workflows')
+workflows_dir = WORKFLOWS_DIR
 workflows_dir.mkdir(exist_ok=True)
 
 print(f"Backing up {len(important_workflows)} important workflows...")
 print(f"Workflows directory: {workflows_dir.absolute()}")
 print("\nTo backup these workflows, use MCP tools:")
 print("  mcp_n8n-mcp_n8n_get_workflow id=<workflow_id> mode=full")
-print("\nThen save each workflow JSON to workflows/<sanitized-name>.json")
+print("\nThen pipe each workflow JSON to: python3 save_workflow.py")
 
 # Save workflow list
 backup_info = {
@@ -43,7 +35,6 @@ backup_info = {
     'workflows': important_workflows
 }
 
-with open(workflows_dir / '.backup_info.json', 'w') as f:
-    json.dump(backup_info, f, indent=2)
+atomic_write_json(workflows_dir / '.backup_info.json', backup_info)
 
 print(f"\nSaved backup info to {workflows_dir / '.backup_info.json'}")
@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""
+Onboarding email scoring and selection.
+
+Python port of the "Filter and Score Emails" and "Select 60 Emails" code
+nodes in parallelized-onboarding-supabase.json, with the same rules and
+output. EmailScorer.filter_and_score():
+
+  1. original sender per thread (earliest message)
+  2. thread dedupe: prefer non-forwards, then the earliest message
+  3. fuzzy dedupe: same sender and >= 80% subject word overlap keeps the
+     earliest message
+  4. score: +200 high-value keyword, -150 low-value keyword, +100 STARRED,
+     +50 IMPORTANT, +80 platform original sender, +50 forward, +1 per week
+     of internalDate
+  5. sender limit (4, relaxed up to 20) until TARGET_COUNT are selected
+
+Instead of scanning every keyword against every subject, each keyword list
+is compiled into one trie-shaped regex and run over all subjects of a batch
+joined into a single string; platform domains are a suffix hash set. The
+fuzzy dedupe only compares messages from the same sender. Score components
+are NumPy arrays when NumPy is installed (plain lists otherwise).
+
+select_emails() then picks TARGET_COUNT messages by score with the
+smallest per-sender cap (4..20) that reaches the target, and shuffles
+them. The node rescans the sorted list once per cap tried; here the cap is
+binary-searched over per-sender message counts, so the sorted list is
+walked at most twice however far the cap has to be relaxed. Pass seed= for
+a reproducible shuffle.
+
+Usage:
+  python3 email_scoring.py messages.json [--target 60] [--select [--seed N]]
+  python3 email_scoring.py --benchmark [--messages 10000] [--parity WORKFLOW]
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from bisect import bisect_right
+from collections import Counter
+from itertools import accumulate
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+PLATFORM_DOMAINS = (
+    'parentsquare.com', 'konstella.com', 'schooladmin.com', 'bloomz.com',
+    'remind.com', 'classdojo.com', 'seesaw.me', 'brightwheel.com',
+    'schoolloop.com', 'infinitecampus.com', 'teamsnap.com', 'sportsengine.com',
+    # School district domains
+    'brssd.org',
+)
+
+HIGH_VALUE_KEYWORDS = (
+    'assignment', 'assignments', 'assigned',
+    'homeroom assignment', 'room assignment', 'class assignment', 'classroom assignment',
+    'team assignment', 'grade assignment', 'teacher assignment',
+    'placement', 'placements', 'placed',
+    'grade placement', 'class placement', 'room placement',
+    'classroom', 'homeroom', 'class room', 'home room',
+    'class list', 'class roster', 'grade roster', 'team roster',
+    'enrolled', 'enrollment', 'enroll', 'enrolling',
+    'registered', 'registration', 'register',
+    'signed up', 'sign up', 'signup',
+    'confirmed', 'confirmation', 'confirm',
+    'successfully enrolled', 'successfully registered',
+    'welcome to grade', 'welcome to class', 'welcome to team',
+    'you have been assigned', 'your child has been assigned',
+    'your child is in', 'your student is in',
+    'schedule', 'class schedule', 'school schedule', 'your schedule for',
+)
+
+LOW_VALUE_KEYWORDS = (
+    'newsletter', 'weekly newsletter', 'monthly newsletter',
+    'weekly update', 'monthly update', 'school update',
+    'digest', 'weekly digest', 'daily digest',
+    'announcement', 'announcements',
+    'reminder', 'reminders', 'friendly reminder',
+    'upcoming events', 'this week at', 'next week at',
+    'save the date', 'important dates',
+    'volunteer', 'volunteers needed',
+    'fundraiser', 'fundraising', 'donate', 'donation',
+    'pta meeting', 'pto meeting', 'board meeting',
+    'school closure', 'school closed', 'no school',
+    'holiday', 'break', 'vacation',
+    'spirit week', 'spirit day', 'picture day', 'photo day',
+    'box tops', 'labels for education',
+    'yearbook', 'lunch menu', 'menu for', 'cafeteria',
+    'traffic', 'parking', 'carpool',
+    'weather', 'inclement weather', 'snow day',
+    'testing', 'state testing', 'standardized test',
+)
+
+# Weight of each EmailScorer.components() flag; internalDate weeks add 1 each
+WEIGHTS = {'high': 200, 'low': -150, 'starred': 100, 'important': 50, 'platform': 80, 'forward': 50}
+WEEK_MS = 1000 * 60 * 60 * 24 * 7
+SIMILARITY_THRESHOLD = 80
+TARGET_COUNT = 60
+INITIAL_SENDER_LIMIT = 4
+MAX_SENDER_LIMIT = 20
+# Fields "Select 60 Emails" passes on
+SELECT_FIELDS = ('id', 'threadId', '_source', 'from', 'subject')
+
+_FORWARD = re.compile(r'(?:fwd|fw):', re.I)
+_REPLY_PREFIX = re.compile(r'^(?:re|fwd|fw):\s*', re.I)
+_WHITESPACE = re.compile(r'\s+')
+_LEADING_INT = re.compile(r'\s*([+-]?\d+)')
+# Joins subjects into one string; no keyword contains it
+_SEPARATOR = '\x00'
+# Thread key of a message without threadId (JS keeps undefined apart from null)
+_UNDEFINED = object()
+
+
+def keyword_pattern(keywords):
+    """One regex matching any keyword as a substring, shaped as a trie
+
+    Only whether some keyword occurs matters, so keywords containing a
+    shorter keyword ('class assignment' contains 'assignment') are dropped
+    first; what is left has no keyword that is a prefix of another.
+    """
+    words = sorted({k.lower() for k in keywords if k}, key=len)
+    kept = []
+    for word in words:
+        if not any(shorter in word for shorter in kept):
+            kept.append(word)
+    trie = {}
+    for word in kept:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+
+    def emit(node):
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items())]
+        if len(branches) <= 1:
+            return ''.join(branches)
+        return f"(?:{'|'.join(branches)})"
+
+    return re.compile(emit(trie) if kept else r'(?!)')
+
+
+def _int(value):
+    """JS parseInt(value) || 0"""
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
+    if isinstance(value, bool) or value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value) if value == value else 0
+    match = _LEADING_INT.match(str(value))
+    return int(match.group(1)) if match else 0
+
+
+def _number(value):
+    """JS `value || 0` for a numeric field"""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)) and value == value:
+        return value
+    return 0
+
+
+def sender_cap(counts, target, initial=INITIAL_SENDER_LIMIT, maximum=MAX_SENDER_LIMIT):
+    """Smallest per-sender cap in [initial, maximum] letting `target` messages through
+
+    `counts` are messages per sender. sum(min(count, cap)) only grows with
+    the cap, so the cap is binary-searched on sorted counts with prefix
+    sums. Returns maximum when no cap reaches the target, and None when
+    initial > maximum (the node then selects nothing).
+    """
+    if initial > maximum:
+        return None
+    ordered = sorted(counts)
+    prefix = list(accumulate(ordered, initial=0))
+
+    def reachable(cap):
+        below = bisect_right(ordered, cap)
+        return prefix[below] + cap * (len(ordered) - below)
+
+    low, high = initial, maximum
+    while low < high:
+        middle = (low + high) // 2
+        if reachable(middle) >= target:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def shuffled(items, rng):
+    """Fisher-Yates shuffle drawing rng.random() exactly like the node's shuffleArray"""
+    items = list(items)
+    for i in range(len(items) - 1, 0, -1):
+        j = int(rng.random() * (i + 1))
+        items[i], items[j] = items[j], items[i]
+    return items
+
+
+def select_emails(messages, target=TARGET_COUNT, initial_limit=INITIAL_SENDER_LIMIT,
+                  max_limit=MAX_SENDER_LIMIT, seed=None):
+    """What "Select 60 Emails" outputs for `messages` (filter_and_score's result)
+
+    Messages without a string id are dropped. If at most `target` remain
+    they are all returned in order; otherwise the `target` best-scored
+    messages under the smallest sufficient sender cap, shuffled.
+    """
+    valid = [m for m in messages if isinstance(m, dict) and isinstance(m.get('id'), str) and m['id']]
+    if len(valid) > target:
+        scores = [_number(m.get('score')) for m in valid]
+        # reverse=True keeps ties in input order, like the node's stable sort
+        order = sorted(range(len(valid)), key=scores.__getitem__, reverse=True)
+        chosen, counts = _take_capped(valid, order, initial_limit, target)
+        if initial_limit > max_limit:
+            chosen = []
+        elif len(chosen) < target:
+            # The first walk didn't stop early, so counts cover every sender
+            cap = sender_cap(counts.values(), target, initial_limit, max_limit)
+            chosen, _ = _take_capped(valid, order, cap, target)
+        valid = [valid[i] for i in shuffled(chosen, random.Random(seed))]
+    return [{field: msg[field] for field in SELECT_FIELDS if field in msg} for msg in valid]
+
+
+def _take_capped(messages, order, cap, target):
+    """Walk `order` taking up to `cap` messages per sender until `target` are taken
+
+    Returns (taken indices, messages seen per sender).
+    """
+    counts, taken = Counter(), []
+    for i in order:
+        sender = (messages[i].get('from') or '').lower()
+        seen = counts[sender]
+        counts[sender] = seen + 1
+        if seen < cap:
+            taken.append(i)
+            if len(taken) >= target:
+                break
+    return taken, counts
+
+
+def relaxed_select(messages, target=TARGET_COUNT, initial_limit=INITIAL_SENDER_LIMIT,
+                   max_limit=MAX_SENDER_LIMIT):
+    """Reference: the node's relaxation loop (one rescan per cap), unshuffled"""
+    valid = [m for m in messages if isinstance(m, dict) and isinstance(m.get('id'), str) and m['id']]
+    ordered = sorted(valid, key=lambda m: -_number(m.get('score')))
+    limit, selected = initial_limit, []
+    while len(selected) < target and limit <= max_limit:
+        counts, selected = {}, []
+        for msg in ordered:
+            sender = (msg.get('from') or '').lower()
+            if counts.get(sender, 0) < limit:
+                selected.append(msg)
+                counts[sender] = counts.get(sender, 0) + 1
+                if len(selected) >= target:
+                    break
+        if len(selected) < target:
+            limit += 1
+    return selected
+
+
+def is_forward(subject):
+    return bool(subject) and bool(_FORWARD.match(subject.strip()))
+
+
+def normalize_subject(subject):
+    if not subject:
+        return ''
+    return _WHITESPACE.sub(' ', _REPLY_PREFIX.sub('', subject.lower(), count=1).strip())
+
+
+def subject_similarity(subject1, subject2):
+    """Word-set Jaccard similarity (0-100) of two subjects after normalizing"""
+    norm1, norm2 = normalize_subject(subject1), normalize_subject(subject2)
+    if norm1 == norm2:
+        return 100
+    words1, words2 = set(norm1.split(' ')), set(norm2.split(' '))
+    return len(words1 & words2) / len(words1 | words2) * 100
+
+
+class EmailScorer:
+    """Compiled scoring rules; filter_and_score() does what the code node does"""
+
+    def __init__(self, high_keywords=HIGH_VALUE_KEYWORDS, low_keywords=LOW_VALUE_KEYWORDS,
+                 platform_domains=PLATFORM_DOMAINS):
+        self.high = keyword_pattern(high_keywords)
+        self.low = keyword_pattern(low_keywords)
+        self.domains = frozenset(d.lower() for d in platform_domains)
+
+    def is_platform_sender(self, address):
+        """Domain (after the first '@') is a platform domain or a subdomain of one"""
+        if not address:
+            return False
+        parts = str(address).split('@')
+        domain = parts[1].lower() if len(parts) > 1 else ''
+        if not domain:
+            return False
+        if domain in self.domains:
+            return True
+        dot = domain.find('.')
+        while dot != -1:
+            if domain[dot + 1:] in self.domains:
+                return True
+            dot = domain.find('.', dot + 1)
+        return False
+
+    @staticmethod
+    def keyword_flags(pattern, texts):
+        """[pattern occurs in text] for every text, in one scan of the joined batch"""
+        flags = [False] * len(texts)
+        starts, pos = [], 0
+        for text in texts:
+            starts.append(pos)
+            pos += len(text) + 1
+        joined = _SEPARATOR.join(texts)
+        search, pos = pattern.search, 0
+        while True:
+            match = search(joined, pos)
+            if match is None:
+                return flags
+            index = bisect_right(starts, match.start()) - 1
+            flags[index] = True
+            # Skip the rest of this text: one hit is enough
+            pos = starts[index + 1] if index + 1 < len(starts) else len(joined)
+
+    def components(self, messages, original_senders=None):
+        """Score components for every message: {name: array}, plus 'weeks'"""
+        subjects = [(m.get('subject') or '').replace(_SEPARATOR, '\x01').lower() for m in messages]
+        labels = [m.get('labels') or () for m in messages]
+        senders = original_senders or [m.get('from') for m in messages]
+        platform = {s: self.is_platform_sender(s) for s in set(senders)}
+        columns = {
+            'high': self.keyword_flags(self.high, subjects),
+            'low': self.keyword_flags(self.low, subjects),
+            'starred': ['STARRED' in l for l in labels],
+            'important': ['IMPORTANT' in l for l in labels],
+            'platform': [platform[s] for s in senders],
+            'forward': [m['_isForward'] if '_isForward' in m else is_forward(m.get('subject'))
+                        for m in messages],
+            'weeks': [_int(m.get('internalDate')) // WEEK_MS if m.get('internalDate') else 0
+                      for m in messages],
+        }
+        if np is not None:
+            columns = {name: np.asarray(values, dtype=np.int64) for name, values in columns.items()}
+        return columns
+
+    def scores(self, messages, original_senders=None):
+        """Score of every message (no dedupe or selection)"""
+        columns = self.components(messages, original_senders)
+        if np is not None:
+            total = columns['weeks'].copy()
+            for name, weight in WEIGHTS.items():
+                total += weight * columns[name]
+            return total.tolist()
+        return [weeks + sum(weight for name, weight in WEIGHTS.items() if columns[name][i])
+                for i, weeks in enumerate(columns['weeks'])]
+
+    def filter_and_score(self, messages, target=TARGET_COUNT):
+        """Dedupe, score and sender-limit messages; returns the selected messages"""
+        dates = [_int(m.get('internalDate')) for m in messages]
+
+        # Step 1: original sender per thread (earliest, first seen on ties)
+        earliest = {}
+        for msg, date in zip(messages, dates):
+            thread_id = msg.get('threadId', _UNDEFINED)
+            if thread_id not in earliest or date < earliest[thread_id][0]:
+                earliest[thread_id] = (date, msg.get('from') or '')
+
+        # Step 2: one message per thread, non-forwards first, then earliest
+        threads = {}
+        for msg, date in zip(messages, dates):
+            thread_id, forward = msg.get('threadId', _UNDEFINED), is_forward(msg.get('subject'))
+            existing = threads.get(thread_id)
+            if (existing is None
+                    or (existing[0]['_isForward'] and not forward)
+                    or (existing[0]['_isForward'] == forward and date < existing[1])):
+                threads[thread_id] = ({**msg, '_isForward': forward}, date)
+
+        # Step 3: fuzzy subject dedupe within each sender, keeping the earliest.
+        # `kept` mirrors the node's Map (insertion order, delete + set moves
+        # an entry to the end); by_sender indexes its keys per sender.
+        kept, by_sender = {}, {}
+        threshold = SIMILARITY_THRESHOLD
+        for msg, date in threads.values():
+            sender, subject = (msg.get('from') or '').lower(), msg.get('subject') or ''
+            norm = normalize_subject(subject)
+            words = frozenset(norm.split(' '))
+            size = len(words)
+            keys = by_sender.setdefault(sender, [])
+            for key in keys:
+                _, other_date, other_norm, other_words = kept[key]
+                if norm != other_norm:
+                    # Jaccard can't exceed the ratio of the set sizes
+                    other_size = len(other_words)
+                    if min(size, other_size) * 100 < threshold * max(size, other_size):
+                        continue
+                    if len(words & other_words) / len(words | other_words) * 100 < threshold:
+                        continue
+                if date < other_date:
+                    del kept[key]
+                    keys.remove(key)
+                    self._keep(kept, keys, f"{sender}|||{subject}", (msg, date, norm, words))
+                break
+            else:
+                self._keep(kept, keys, f"{sender}|||{subject}", (msg, date, norm, words))
+        survivors = [entry[0] for entry in kept.values()]
+        survivor_dates = [entry[1] for entry in kept.values()]
+
+        # Step 4: score on the thread's original sender
+        originals = [earliest.get(m.get('threadId', _UNDEFINED), (0, ''))[1] or m.get('from', _UNDEFINED)
+                     for m in survivors]
+        senders = [None if original is _UNDEFINED else original for original in originals]
+        for msg, score, original in zip(survivors, self.scores(survivors, senders), originals):
+            msg['score'] = score
+            if original is not _UNDEFINED:
+                msg['_originalSender'] = original
+        order = _by_score([m['score'] for m in survivors], survivor_dates)
+
+        # Step 5: sender limit, the smallest one (4..20) reaching the target
+        by_from = {}
+        for i in order:
+            by_from.setdefault((survivors[i].get('from') or '').lower(), []).append(i)
+        cap = sender_cap([len(group) for group in by_from.values()], target)
+        selected = [i for group in by_from.values() for i in group[:cap or 0]]
+        selected = [selected[i] for i in _by_score([survivors[i]['score'] for i in selected],
+                                                   [survivor_dates[i] for i in selected])]
+        return [survivors[i] for i in selected]
+
+    @staticmethod
+    def _keep(kept, keys, key, entry):
+        if key not in kept:
+            keys.append(key)
+        kept[key] = entry
+
+
+def _by_score(scores, dates):
+    """Indices in stable order of score, then internalDate, both descending"""
+    if np is not None and scores:
+        return np.lexsort((-np.asarray(dates, dtype=np.int64), -np.asarray(scores, dtype=np.int64))).tolist()
+    return sorted(range(len(scores)), key=lambda i: (-scores[i], -dates[i]))
+
+
+def linear_scores(messages):
+    """Reference scoring that scans every keyword and domain per message, like the node"""
+    def platform(address):
+        parts = (address or '').split('@')
+        domain = parts[1].lower() if len(parts) > 1 else ''
+        return bool(domain) and any(domain == d or domain.endswith('.' + d) for d in PLATFORM_DOMAINS)
+
+    scores = []
+    for msg in messages:
+        subject, labels = (msg.get('subject') or '').lower(), msg.get('labels') or []
+        score = 0
+        if any(k in subject for k in HIGH_VALUE_KEYWORDS):
+            score += 200
+        if any(k in subject for k in LOW_VALUE_KEYWORDS):
+            score -= 150
+        score += 100 * ('STARRED' in labels) + 50 * ('IMPORTANT' in labels)
+        score += 80 * platform(msg.get('from')) + 50 * is_forward(msg.get('subject'))
+        if msg.get('internalDate'):
+            score += _int(msg['internalDate']) // WEEK_MS
+        scores.append(score)
+    return scores
+
+
+def sample_mailbox(count, seed=0):
+    """Synthetic Gmail metadata shaped like the "Aggregate Metadata" output"""
+    rng = random.Random(seed)
+    senders = ([f"noreply@{d}" for d in PLATFORM_DOMAINS] + ['office@mail.brssd.org']
+               + [f"person{i}@example{i % 40}.com" for i in range(400)])
+    words = ['lunch', 'permission', 'slip', 'game', 'practice', 'recital', 'field', 'trip',
+             'invoice', 'order', 'shipped', 'photos', 'meeting', 'notes', 'update', 'form']
+    keywords = HIGH_VALUE_KEYWORDS + LOW_VALUE_KEYWORDS
+    now = 1768000000000
+    messages = []
+    for i in range(count):
+        parts = rng.sample(words, rng.randint(2, 6))
+        if rng.random() < 0.35:
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(keywords))
+        subject = ' '.join(parts).capitalize()
+        roll = rng.random()
+        if roll < 0.08:
+            subject = f"Fwd: {subject}"
+        elif roll < 0.2:
+            subject = f"Re: {subject}"
+        labels = ['INBOX'] + (['STARRED'] if rng.random() < 0.03 else []) + \
+                 (['IMPORTANT'] if rng.random() < 0.2 else [])
+        messages.append({
+            'id': f"m{i:06x}", 'threadId': f"t{rng.randrange(int(count * 0.8)):06x}", '_source': 'period',
+            'internalDate': str(now - rng.randrange(90 * 86400) * 1000),
+            'from': rng.choice(senders), 'subject': subject, 'labels': labels,
+            'sizeEstimate': rng.randint(2000, 80000),
+        })
+    return messages
+
+
+def node_code(workflow_path, node_name='Filter and Score Emails'):
+    from workflow_io import unwrap_envelope
+
+    with open(workflow_path) as f:
+        workflow = unwrap_envelope(json.load(f))
+    for node in workflow.get('nodes', []):
+        if node.get('name') == node_name:
+            return node['parameters']['jsCode']
+    raise ValueError(f"{workflow_path} has no '{node_name}' node")
+
+
+def benchmark(count=10000, parity=None):
+    """Linear keyword scans and the relaxation loop vs this module on a synthetic mailbox"""
+    messages = sample_mailbox(count)
+    scorer = EmailScorer()
+
+    started = time.perf_counter()
+    expected = linear_scores(messages)
+    linear = time.perf_counter() - started
+    started = time.perf_counter()
+    actual = scorer.scores(messages)
+    compiled = time.perf_counter() - started
+    assert actual == expected, 'compiled scores differ from the linear scan'
+    started = time.perf_counter()
+    selected = scorer.filter_and_score(messages)
+    pipeline = time.perf_counter() - started
+
+    print(f"{count} messages (NumPy {'on' if np is not None else 'off'}):")
+    print(f"  linear keyword scan     {linear * 1000:8.1f} ms")
+    print(f"  compiled scoring        {compiled * 1000:8.1f} ms  ({linear / compiled:.1f}x)")
+    print(f"  full filter_and_score   {pipeline * 1000:8.1f} ms  ({len(selected)} selected)")
+
+    # Selection over the whole scored mailbox, widening the target until
+    # the sender cap has to be relaxed
+    scored = [{**m, 'score': score} for m, score in zip(messages, actual)]
+    senders = {}
+    for msg in scored:
+        senders[msg['from'].lower()] = senders.get(msg['from'].lower(), 0) + 1
+    print('  select: relaxation loop vs cap search')
+    for target in (TARGET_COUNT, count // 10, count // 2, count * 3 // 4):
+        started = time.perf_counter()
+        reference = relaxed_select(scored, target)
+        relaxed = time.perf_counter() - started
+        started = time.perf_counter()
+        picked = select_emails(scored, target, seed=0)
+        single = time.perf_counter() - started
+        assert sorted(m['id'] for m in picked) == sorted(m['id'] for m in reference)
+        print(f"    target {target:>6} (cap {sender_cap(senders.values(), target):>2})  "
+              f"{relaxed * 1000:8.1f} ms -> {single * 1000:6.1f} ms")
+
+    if parity:
+        from workflow_sim import JsRuntime
+
+        with JsRuntime() as runtime:
+            started = time.perf_counter()
+            result = runtime.call('code', node_code(parity), items=[{'messages': messages}], index=0,
+                                  timeout=600000)
+            elapsed = time.perf_counter() - started
+            node_messages = result[0]['json']['messages']
+            same = [(m['id'], m['score']) for m in node_messages] == [(m['id'], m['score']) for m in selected]
+            print(f"  Filter and Score node   {elapsed * 1000:8.1f} ms  "
+                  f"({'identical output' if same else 'OUTPUT DIFFERS'})")
+
+            # Feed the node's Math.random the draws select_emails(seed=0) makes
+            rng = random.Random(0)
+            draws = json.dumps([rng.random() for _ in range(TARGET_COUNT)])
+            code = f"const draws = {draws}; Math.random = () => draws.shift();\n"
+            result = runtime.call('code', code + node_code(parity, 'Select 60 Emails'),
+                                  items=[{'messages': selected}], index=0)
+            picked = [item['json'] for item in result]
+            select_same = picked == select_emails(selected, seed=0)
+            print(f"  Select 60 Emails node   {len(picked):5d} picked  "
+                  f"({'identical output' if select_same else 'OUTPUT DIFFERS'})")
+        if not (same and select_same):
+            sys.exit(1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score and select onboarding emails')
+    parser.add_argument('file', nargs='?', help='{"messages": [...]} or a list of messages (- for stdin)')
+    parser.add_argument('--target', type=int, default=TARGET_COUNT)
+    parser.add_argument('--select', action='store_true', help='also apply "Select 60 Emails"')
+    parser.add_argument('--seed', type=int, help='seed for the --select shuffle')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--messages', type=int, default=10000, help='benchmark mailbox size')
+    parser.add_argument('--parity', metavar='WORKFLOW',
+                        help='also run the workflow\'s code node on the benchmark mailbox and compare')
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.messages, args.parity)
+        return
+    if not args.file:
+        parser.error('a messages file is required (or --benchmark)')
+    payload = json.load(sys.stdin if args.file == '-' else open(args.file))
+    messages = payload.get('messages', []) if isinstance(payload, dict) else payload
+    selected = EmailScorer().filter_and_score(messages, args.target)
+    if args.select:
+        json.dump(select_emails(selected, args.target, seed=args.seed), sys.stdout, indent=2)
+    else:
+        json.dump({'messages': selected, 'resultSizeEstimate': len(selected)}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Event-driven dispatch of newly ingested emails to the AI processor.
+
+Bippity-Scheduled-Email-Check ingests on a 0,5,10,... cron and the AI
+Email Processor polls on 2,7,12,..., so every email waits two to seven
+minutes before analysis and both crons wake up whether or not anything
+arrived. Dispatcher LISTENs on unified_events_pending (migration 009)
+and starts processing as soon as ingestion commits:
+
+  - bursts are coalesced into micro-batches: a batch goes out once
+    notifications have been quiet for `window` seconds, `max_delay`
+    after the first one, or as soon as `max_batch` rows are waiting
+  - a batch either wakes an in-process event_queue.WorkerPool (leased
+    claims from migration 008, each event POSTed to an n8n webhook) or
+    POSTs {"pending": n} once to a trigger webhook (the AI Email
+    Processor with a Webhook trigger in place of its cron)
+  - the queue is only polled on (re)connect, for rows committed while
+    nobody was listening; idle, neither the dispatcher nor the pool runs
+    a query
+  - notify(count) feeds the same batching from writers in this process
+
+Usage:
+  DATABASE_URL=... python3 event_dispatcher.py --webhook https://.../webhook/process-email [--workers 8]
+  DATABASE_URL=... python3 event_dispatcher.py --trigger https://.../webhook/ai-email-processor
+  DATABASE_URL=... python3 event_dispatcher.py --benchmark [--bursts 40] [--workers 8]
+"""
+import argparse
+import json
+import os
+import random
+import select
+import sys
+import threading
+import time
+from pathlib import Path
+
+from event_queue import EventQueue, WorkerPool, webhook_handler
+from mailbox_sync import percentiles
+from unified_events_writer import UnifiedEventsWriter, connect
+
+CHANNEL = 'unified_events_pending'
+# Quiet period that ends a burst
+WINDOW = 0.25
+# Longest a notified row waits for its batch to be dispatched
+MAX_DELAY = 2.0
+MAX_BATCH = 50
+RECONNECT_DELAY = 5
+MIGRATIONS = Path(__file__).resolve().parent / 'migrations'
+
+
+class Dispatcher:
+    """LISTEN for new pending rows and call on_batch(count) once per coalesced burst"""
+
+    def __init__(self, database_url, on_batch, window=WINDOW, max_delay=MAX_DELAY, max_batch=MAX_BATCH,
+                 table='unified_events', reconnect_delay=RECONNECT_DELAY):
+        self.database_url = database_url
+        self.on_batch = on_batch
+        self.window = window
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.table = table
+        self.reconnect_delay = reconnect_delay
+        self.cond = threading.Condition()
+        self.pending = 0
+        self.first_at = self.last_at = None
+        self.listening = False
+        self.listener_pid = None
+        self.stats = {'notifications': 0, 'batches': 0, 'events': 0, 'catch_ups': 0, 'connects': 0,
+                      'queries': 0, 'dispatch_errors': 0}
+        self.batch_sizes = []
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def notify(self, count=1):
+        """count new pending rows (a NOTIFY, or a writer in this process)"""
+        with self.cond:
+            now = time.monotonic()
+            self.stats['notifications'] += 1
+            self.pending += count
+            self.first_at = self.first_at or now
+            self.last_at = now
+            self.cond.notify_all()
+
+    def _next_batch(self):
+        """Block until a burst is complete; returns its row count (None once stopped)"""
+        with self.cond:
+            while not self.pending and not self.stopped.is_set():
+                self.cond.wait()
+            while not self.stopped.is_set() and self.pending < self.max_batch:
+                now = time.monotonic()
+                deadline = min(self.last_at + self.window, self.first_at + self.max_delay)
+                if now >= deadline:
+                    break
+                self.cond.wait(deadline - now)
+            if self.stopped.is_set():
+                return None
+            count, self.pending, self.first_at = self.pending, 0, None
+            self.stats['batches'] += 1
+            self.stats['events'] += count
+            self.batch_sizes.append(count)
+            return count
+
+    def _dispatch_loop(self):
+        while True:
+            count = self._next_batch()
+            if count is None:
+                return
+            try:
+                self.on_batch(count)
+            except Exception as e:
+                with self.cond:
+                    self.stats['dispatch_errors'] += 1
+                print(f"⚠️  Dispatch of {count} event(s) failed: {e}", file=sys.stderr)
+
+    def _listen(self):
+        while not self.stopped.is_set():
+            conn = None
+            try:
+                conn = connect(self.database_url)
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {CHANNEL}")
+                cur.close()
+                self.listener_pid = conn.get_backend_pid()
+                # Rows committed while nobody was listening
+                queued = EventQueue(conn, table=self.table).depth().get('pending', (0, 0))[0]
+                with self.cond:
+                    self.listening = True
+                    self.stats['connects'] += 1
+                    self.stats['queries'] += 2
+                if queued:
+                    with self.cond:
+                        self.stats['catch_ups'] += 1
+                    self.notify(queued)
+                while not self.stopped.is_set():
+                    # Local wait on the socket; no query is sent while idle
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            payload = conn.notifies.pop(0).payload
+                            self.notify(int(payload) if payload.isdigit() else 1)
+            except Exception as e:
+                if not self.stopped.is_set():
+                    print(f"⚠️  {CHANNEL} listener disconnected: {e}", file=sys.stderr)
+            finally:
+                with self.cond:
+                    self.listening = False
+                if conn is not None:
+                    conn.close()
+            self.stopped.wait(self.reconnect_delay)
+
+    def start(self):
+        self.threads = [threading.Thread(target=self._listen, daemon=True),
+                        threading.Thread(target=self._dispatch_loop, daemon=True)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def close(self):
+        self.stopped.set()
+        with self.cond:
+            self.cond.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def summary(self):
+        with self.cond:
+            return {**self.stats, 'listening': self.listening, 'batch_size': percentiles(self.batch_sizes)}
+
+
+def trigger_handler(url, api_key=None):
+    """on_batch that starts one n8n workflow run per batch"""
+    from http_pool import JsonClient
+
+    client = JsonClient(url, {'Authorization': f"Bearer {api_key}"} if api_key else {}, size=2)
+    return lambda count: client.request('POST', '', body={'pending': count})
+
+
+def benchmark(database_url, bursts=40, workers=8, work=0.02, idle=5.0, seed=0):
+    """Bursty ingestion into a scratch schema with migrations 008/009/011 applied; measures insert-to-done latency"""
+    schema = 'dispatch_bench'
+    table = f"{schema}.unified_events"
+    rng = random.Random(seed)
+    conn = connect(database_url)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cur.execute(f"CREATE SCHEMA {schema}")
+    cur.execute(f"SET search_path TO {schema}, public")
+    cur.execute("""CREATE TABLE unified_events (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(), user_id uuid NOT NULL, channel text NOT NULL,
+        source_id text NOT NULL, source_thread_id text, event_type text, subject text,
+        snippet text, body_text text, from_email text, received_at timestamptz,
+        is_processed boolean DEFAULT false, processing_status text DEFAULT 'pending',
+        processed_at timestamptz, ai_output text, created_at timestamptz DEFAULT NOW(),
+        UNIQUE (user_id, channel, source_id))""")
+    for migration in ('008_add_unified_events_queue.sql', '009_add_unified_events_notify.sql',
+                      '011_reap_in_claim_unified_events.sql'):
+        cur.execute((MIGRATIONS / migration).read_text())
+
+    def handler(event):
+        time.sleep(work)
+        return 'completed', 'ok'
+
+    pool = WorkerPool(database_url, handler, workers, poll=None, table=table).start()
+    dispatcher = Dispatcher(database_url, lambda count: pool.wake(), table=table, reconnect_delay=0.5).start()
+    while not dispatcher.listening:
+        time.sleep(0.05)
+
+    ingest = connect(database_url)
+    writer = UnifiedEventsWriter(ingest, table=table)
+    sent = 0
+
+    def ingest_burst(size):
+        nonlocal sent
+        writer.insert([{
+            'user_id': f"00000000-0000-4000-8000-{rng.randrange(50):012d}", 'channel': 'gmail',
+            'source_id': f"msg{sent + i:06d}", 'subject': 'Practice moved to Thursday 5pm',
+            'from_email': 'coach@cityyouthsoccer.org', 'is_processed': False, 'processing_status': 'pending',
+        } for i in range(size)])
+        sent += size
+
+    def wait_done():
+        while True:
+            cur.execute(f"SELECT COUNT(*) FROM {table} WHERE processing_status = 'completed'")
+            if cur.fetchone()[0] >= sent:
+                return
+            time.sleep(0.05)
+
+    for _ in range(bursts):
+        ingest_burst(rng.choice((1, 1, 2, 3, 5, 8, 20)))
+        time.sleep(rng.expovariate(1 / 0.4))
+    wait_done()
+
+    # Drop the listener: rows committed before it reconnects are found by the catch-up poll
+    cur.execute("SELECT pg_terminate_backend(%s)", (dispatcher.listener_pid,))
+    time.sleep(0.05)
+    ingest_burst(30)
+    wait_done()
+
+    # Idle: no rows, no queries
+    time.sleep(1)
+    before = pool.summary()['queries'] + dispatcher.summary()['queries']
+    time.sleep(idle)
+    idle_queries = pool.summary()['queries'] + dispatcher.summary()['queries'] - before
+
+    cur.execute(f"SELECT EXTRACT(EPOCH FROM processed_at - created_at) FROM {table}")
+    latency = percentiles([float(r[0]) for r in cur.fetchall()])
+    dispatcher.close()
+    pool.stop()
+    pool.join()
+    ingest.close()
+    cur.execute(f"DROP SCHEMA {schema} CASCADE")
+    conn.close()
+
+    stats = dispatcher.summary()
+    print(f"{sent} emails in {bursts + 1} bursts, {workers} workers, {work * 1000:.0f} ms per email:")
+    print("  cron (modelled)   insert->processed >= 120 s (processor runs 2 min after ingestion); "
+          "288 processor runs/day, idle or not")
+    print(f"  dispatcher        insert->processed " + '  '.join(f"{k} {v:.2f}s" for k, v in latency.items()))
+    print(f"  {stats['notifications']} notifications -> {stats['batches']} batches "
+          f"(sizes {json.dumps(stats['batch_size'])}), {stats['connects']} connects, "
+          f"{stats['catch_ups']} catch-up poll(s)")
+    status = '✅' if not idle_queries else '❌'
+    print(f"  {status} {idle_queries} queries in {idle:.0f}s idle")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Start AI processing when new unified_events rows land')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--webhook', help='n8n webhook that processes one event (runs a leased worker pool)')
+    target.add_argument('--trigger', help='n8n webhook that starts one AI Email Processor run per batch')
+    target.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--window', type=float, default=WINDOW, help='quiet seconds that end a burst')
+    parser.add_argument('--max-delay', type=float, default=MAX_DELAY)
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--bursts', type=int, default=40)
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        parser.error('--database-url (or DATABASE_URL) is required')
+    if args.benchmark:
+        benchmark(args.database_url, args.bursts, args.workers)
+        return
+    if not (args.webhook or args.trigger):
+        parser.error('one of --webhook, --trigger or --benchmark is required')
+
+    api_key = os.environ.get('N8N_API_KEY')
+    pool = None
+    if args.webhook:
+        pool = WorkerPool(args.database_url, webhook_handler(args.webhook, api_key, args.workers), args.workers,
+                          poll=None).start()
+        on_batch = lambda count: pool.wake()
+    else:
+        on_batch = trigger_handler(args.trigger, api_key)
+    dispatcher = Dispatcher(args.database_url, on_batch, args.window, args.max_delay, args.max_batch).start()
+    print(f"Listening on {CHANNEL} -> {args.webhook or args.trigger}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        dispatcher.close()
+        summary = {'dispatcher': dispatcher.summary()}
+        if pool:
+            pool.stop()
+            summary['workers'] = pool.join()
+        print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Work-queue claims over unified_events for parallel AI processor workers.
+
+The AI Email Processor used to read "pending" rows with a plain SELECT
+every five minutes and walk them one at a time, so a second runner would
+process the same rows, and a run that dies halfway left nothing to say
+which rows were in flight. EventQueue gives each row a lease instead
+(migration 008):
+
+  - claim:    oldest claimable rows, leased with FOR UPDATE SKIP LOCKED;
+              concurrent workers never block on or share a row
+  - complete: final status + ai_output, keyed on the event id, and only
+              while this worker still holds the lease
+  - fail:     back to 'pending' with an exponential retry delay, or
+              'error' once max_attempts claims are used up
+  - expired leases (worker crashed or hung) become claimable again;
+              the ones out of attempts are marked 'error' by every claim
+              (migration 011) and by reap()
+
+WorkerPool runs N workers, each with its own connection, and reports
+throughput, retries, lost leases and end-to-end lag (created_at to
+completion). `run` hands each claimed event to an n8n webhook (POSTed as
+JSON, answered with {processing_status, ai_output}):
+workflows/Bippity-AI-Email-Processor-Webhook.json, served at
+/webhook/process-email. The webhook is called once per claim. A failed
+call goes through fail() and its retry delay, and is not resent on the
+spot, since the AI stages create calendar events and tasks.
+
+The cron-driven AI Email Processor claims through claim_unified_events()
+as worker 'n8n-<execution id>' with a 30 minute lease. Mark Completed only
+applies while that run still holds the lease, so the cron can stay on
+next to `run`. Rows a crashed run had claimed come back after the lease
+expires.
+
+Usage:
+  DATABASE_URL=postgres://... python3 event_queue.py run --webhook https://.../webhook/process-email [--workers 8]
+  DATABASE_URL=postgres://... python3 event_queue.py stats
+  DATABASE_URL=postgres://... python3 event_queue.py --benchmark [--events 10000] [--workers 16]
+"""
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+from mailbox_sync import percentiles
+from unified_events_writer import UnifiedEventsWriter, connect
+
+LEASE = 300
+MAX_ATTEMPTS = 3
+# Events claimed per round trip
+BATCH = 5
+# Seconds before the first retry; doubled per attempt
+RETRY_DELAY = 30
+POLL_INTERVAL = 5
+QUEUED = ('pending', 'processing')
+
+
+class EventQueue:
+    """Lease-based claims on one connection (autocommit, one worker)"""
+
+    def __init__(self, conn, worker=None, table='unified_events', lease=LEASE, max_attempts=MAX_ATTEMPTS,
+                 retry_delay=RETRY_DELAY):
+        conn.autocommit = True
+        self.conn = conn
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.table = table
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.queries = 0
+
+    def _execute(self, sql, params=None):
+        self.queries += 1
+        cur = self.conn.cursor()
+        try:
+            cur.execute(sql, params)
+            if cur.description is None:
+                return cur.rowcount, []
+            columns = [c[0] for c in cur.description]
+            return cur.rowcount, [dict(zip(columns, row)) for row in cur.fetchall()]
+        finally:
+            cur.close()
+
+    def claim(self, limit=BATCH):
+        """Lease up to limit events (the same statement as claim_unified_events())"""
+        _, rows = self._execute(f"""
+            WITH reaped AS (
+              UPDATE {self.table}
+              SET processing_status = 'error', locked_until = NULL, locked_by = NULL,
+                  last_error = COALESCE(last_error, 'lease expired')
+              WHERE id IN (
+                SELECT id FROM {self.table}
+                WHERE processing_status IN ('pending', 'processing') AND attempts >= %(max_attempts)s
+                  AND locked_until <= NOW()
+                FOR UPDATE SKIP LOCKED)
+              RETURNING id
+            ),
+            next AS (
+              SELECT id FROM {self.table}
+              WHERE processing_status IN ('pending', 'processing')
+                AND (locked_until IS NULL OR locked_until <= NOW())
+                AND attempts < %(max_attempts)s
+              ORDER BY created_at
+              LIMIT %(limit)s
+              FOR UPDATE SKIP LOCKED
+            )
+            UPDATE {self.table} e
+            SET processing_status = 'processing', locked_by = %(worker)s,
+                locked_until = NOW() + %(lease)s * INTERVAL '1 second', attempts = e.attempts + 1
+            FROM next WHERE e.id = next.id
+            RETURNING e.*""", {'max_attempts': self.max_attempts, 'limit': limit,
+                               'worker': self.worker, 'lease': self.lease})
+        return sorted(rows, key=lambda r: r['created_at'])
+
+    def extend(self, event_ids):
+        """Renew the lease on events still being worked on; returns how many are still held"""
+        if not event_ids:
+            return 0
+        count, _ = self._execute(f"""
+            UPDATE {self.table} SET locked_until = NOW() + %s * INTERVAL '1 second'
+            WHERE id = ANY(%s::uuid[]) AND locked_by = %s AND processing_status = 'processing'""",
+                                 (self.lease, list(event_ids), self.worker))
+        return count
+
+    def complete(self, event_id, status='completed', ai_output=None):
+        """Record the result; False if the lease was lost (another worker owns the event now)"""
+        count, _ = self._execute(f"""
+            UPDATE {self.table}
+            SET processing_status = %s, is_processed = true, processed_at = NOW(), ai_output = %s,
+                locked_until = NULL, locked_by = NULL, last_error = NULL
+            WHERE id = %s AND locked_by = %s AND processing_status = 'processing'""",
+                                 (status, ai_output, event_id, self.worker))
+        return count == 1
+
+    def fail(self, event_id, error):
+        """Release the event for a later retry; returns its new status, or None if the lease was lost"""
+        _, rows = self._execute(f"""
+            UPDATE {self.table}
+            SET processing_status = CASE WHEN attempts >= %(max_attempts)s THEN 'error' ELSE 'pending' END,
+                locked_until = CASE WHEN attempts >= %(max_attempts)s THEN NULL
+                               ELSE NOW() + %(delay)s * power(2, attempts - 1) * INTERVAL '1 second' END,
+                locked_by = NULL, last_error = %(error)s
+            WHERE id = %(id)s AND locked_by = %(worker)s AND processing_status = 'processing'
+            RETURNING processing_status""", {'max_attempts': self.max_attempts, 'delay': self.retry_delay,
+                                             'error': str(error)[:2000], 'id': event_id, 'worker': self.worker})
+        return rows[0]['processing_status'] if rows else None
+
+    def reap(self):
+        """Mark expired leases with no attempts left as 'error'; returns how many"""
+        count, _ = self._execute(f"""
+            UPDATE {self.table}
+            SET processing_status = 'error', locked_until = NULL, locked_by = NULL,
+                last_error = COALESCE(last_error, 'lease expired')
+            WHERE id IN (
+              SELECT id FROM {self.table}
+              WHERE processing_status IN ('pending', 'processing') AND attempts >= %s
+                AND locked_until <= NOW()
+              FOR UPDATE SKIP LOCKED)""", (self.max_attempts,))
+        return count
+
+    def next_due(self):
+        """Seconds until the earliest retry delay or lease runs out (<= 0: claimable now), None if nothing is queued"""
+        _, rows = self._execute(f"""
+            SELECT EXTRACT(EPOCH FROM MIN(COALESCE(locked_until, NOW())) - NOW()) AS due
+            FROM {self.table}
+            WHERE processing_status IN ('pending', 'processing') AND attempts < %s""", (self.max_attempts,))
+        due = rows[0]['due'] if rows else None
+        return None if due is None else float(due)
+
+    def depth(self):
+        """{status: (count, age of the oldest row in seconds)} for queued rows"""
+        _, rows = self._execute(f"""
+            SELECT processing_status AS status, COUNT(*) AS count,
+                   EXTRACT(EPOCH FROM NOW() - MIN(created_at)) AS oldest
+            FROM {self.table} WHERE processing_status IN ('pending', 'processing')
+            GROUP BY processing_status""")
+        return {r['status']: (r['count'], float(r['oldest'] or 0)) for r in rows}
+
+
+class WorkerPool:
+    """N queue workers sharing one handler; handler(event) -> (status, ai_output)
+
+    Idle workers re-check the queue every `poll` seconds. With poll=None
+    they sleep until wake() (or the next retry / lease expiry) instead, so
+    an empty queue costs no queries.
+    """
+
+    def __init__(self, database_url, handler, workers=8, batch=BATCH, drain=False, poll=POLL_INTERVAL,
+                 **queue_options):
+        self.database_url = database_url
+        self.handler = handler
+        self.workers = workers
+        self.batch = batch
+        self.drain = drain
+        self.poll = poll
+        self.queue_options = queue_options
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.wakeup = threading.Condition()
+        self.generation = 0
+        self.stats = {'claims': 0, 'claimed': 0, 'completed': 0, 'retried': 0, 'failed': 0,
+                      'lost_leases': 0, 'reaped': 0}
+        self.lag = []
+        self.queues = []
+        self.threads = []
+        self.started = self.finished = None
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def wake(self):
+        """New events are queued: idle workers claim again now"""
+        with self.wakeup:
+            self.generation += 1
+            self.wakeup.notify_all()
+
+    def _idle(self, queue, seen):
+        timeout = self.poll
+        if timeout is None:
+            due = queue.next_due()
+            timeout = None if due is None else max(due, 0.05)
+        with self.wakeup:
+            if self.generation == seen and not self.stopped.is_set():
+                self.wakeup.wait(timeout)
+
+    def _work(self, index):
+        queue = EventQueue(connect(self.database_url), f"{socket.gethostname()}-{os.getpid()}-{index}",
+                           **self.queue_options)
+        with self.lock:
+            self.queues.append(queue)
+        try:
+            while not self.stopped.is_set():
+                with self.wakeup:
+                    seen = self.generation
+                events = queue.claim(self.batch)
+                if not events:
+                    self._count('reaped', queue.reap())
+                    if self.drain and not queue.depth():
+                        return
+                    self._idle(queue, seen)
+                    continue
+                self._count('claims')
+                self._count('claimed', len(events))
+                leased_at = time.monotonic()
+                for n, event in enumerate(events):
+                    if time.monotonic() - leased_at > queue.lease / 2:
+                        queue.extend([e['id'] for e in events[n:]])
+                        leased_at = time.monotonic()
+                    try:
+                        status, ai_output = self.handler(event)
+                    except Exception as e:
+                        outcome = queue.fail(event['id'], e)
+                        self._count({'pending': 'retried', 'error': 'failed'}.get(outcome, 'lost_leases'))
+                        continue
+                    if not queue.complete(event['id'], status, ai_output):
+                        self._count('lost_leases')
+                        continue
+                    lag = (datetime.now(timezone.utc) - event['created_at']).total_seconds()
+                    with self.lock:
+                        self.stats['completed'] += 1
+                        self.lag.append(lag)
+        finally:
+            queue.conn.close()
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.threads = [threading.Thread(target=self._work, args=(i,), daemon=True) for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def join(self):
+        """Wait for the workers to exit (stop(), or with drain an empty queue)"""
+        try:
+            for thread in self.threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        finally:
+            self.stop()
+            self.finished = time.perf_counter()
+        return self.summary()
+
+    def run(self):
+        """Run the workers until stop() (or, with drain, until the queue is empty)"""
+        return self.start().join()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake()
+
+    def summary(self):
+        with self.lock:
+            elapsed = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+            return {
+                **self.stats, 'workers': self.workers, 'elapsed_s': round(elapsed, 2),
+                'queries': sum(q.queries for q in self.queues),
+                'throughput_per_s': round(self.stats['completed'] / elapsed, 1) if elapsed > 0 else None,
+                'lag_s': {k: round(v, 2) for k, v in percentiles(self.lag).items()},
+            }
+
+
+def webhook_handler(url, api_key=None, size=8, timeout=300):
+    """Handler POSTing each event to an n8n webhook that answers {processing_status, ai_output}"""
+    from http_pool import JsonClient
+
+    client = JsonClient(url, {'Authorization': f"Bearer {api_key}"} if api_key else {}, size, max_retries=0,
+                        timeout=timeout)
+
+    def handle(event):
+        body = json.loads(json.dumps(event, default=str))
+        result = client.request('POST', '', body=body) or {}
+        output = result.get('ai_output')
+        return (result.get('processing_status') or 'completed',
+                output if output is None or isinstance(output, str) else json.dumps(output))
+    return handle
+
+
+def benchmark(database_url, events=10000, workers=16, work=0.002, failure_rate=0.02, abandoned=50):
+    """Drain a synthetic backlog: the workflow's sequential SELECT, naive parallel SELECTs, leased claims"""
+    table = 'unified_events_queue_bench'
+    conn = connect(database_url)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"DROP TABLE IF EXISTS {table}")
+    cur.execute(f"""CREATE TABLE {table} (
+        id uuid PRIMARY KEY DEFAULT gen_random_uuid(), user_id uuid NOT NULL, channel text NOT NULL,
+        source_id text NOT NULL, source_thread_id text, event_type text, subject text,
+        snippet text, body_text text, from_email text, received_at timestamptz,
+        is_processed boolean DEFAULT false, processing_status text DEFAULT 'pending',
+        processed_at timestamptz, ai_output text, created_at timestamptz DEFAULT NOW(),
+        attempts integer NOT NULL DEFAULT 0, locked_until timestamptz, locked_by text, last_error text,
+        UNIQUE (user_id, channel, source_id))""")
+    cur.execute(f"CREATE INDEX ON {table} (created_at) WHERE processing_status IN ('pending', 'processing')")
+    sample = [{
+        'user_id': f"00000000-0000-4000-8000-{i % 200:012d}", 'channel': 'gmail', 'source_id': f"msg{i:06d}",
+        'subject': f"Field trip permission slip #{i}", 'from_email': 'teacher@school.org',
+        'received_at': '2026-01-15T08:00:00Z', 'is_processed': False, 'processing_status': 'pending',
+    } for i in range(events)]
+    handled = {}
+    handled_lock = threading.Lock()
+
+    def reset(count):
+        cur.execute(f"TRUNCATE {table}")
+        conn.autocommit = False
+        UnifiedEventsWriter(conn, table=table).insert(sample[:count])
+        conn.autocommit = True
+        handled.clear()
+
+    def handler(event):
+        time.sleep(work)
+        with handled_lock:
+            handled[event['id']] = handled.get(event['id'], 0) + 1
+        # Deterministic transient failures on the first attempt
+        if event.get('attempts', 1) == 1 and zlib.crc32(str(event['id']).encode()) % 1000 < failure_rate * 1000:
+            raise RuntimeError('OpenAI 503')
+        return 'completed', 'ok'
+
+    def naive(worker_count, count):
+        """The workflow's loop: SELECT 10 pending rows, process each, UPDATE by id"""
+        def loop():
+            c = connect(database_url)
+            c.autocommit = True
+            q = c.cursor()
+            while True:
+                q.execute(f"SELECT id FROM {table} WHERE processing_status = 'pending' "
+                          f"ORDER BY created_at LIMIT 10")
+                rows = q.fetchall()
+                if not rows:
+                    break
+                for (event_id,) in rows:
+                    time.sleep(work)
+                    with handled_lock:
+                        handled[event_id] = handled.get(event_id, 0) + 1
+                    q.execute(f"UPDATE {table} SET processing_status = 'completed', is_processed = true, "
+                              f"processed_at = NOW() WHERE id = %s", (event_id,))
+            c.close()
+
+        reset(count)
+        started = time.perf_counter()
+        threads = [threading.Thread(target=loop) for _ in range(worker_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return elapsed, sum(n - 1 for n in handled.values())
+
+    # The SELECT loops are slow (that's the point); time them on a slice
+    results = []
+    baseline_events = min(events, 2000)
+    elapsed, duplicates = naive(1, baseline_events)
+    results.append(('sequential SELECT (n8n)', 1, baseline_events / elapsed, duplicates, ''))
+    elapsed, duplicates = naive(workers, baseline_events)
+    results.append(('parallel plain SELECT', workers, baseline_events / elapsed, duplicates, ''))
+
+    summaries = []
+    for worker_count in sorted({1, workers // 4 or 1, workers}):
+        if worker_count == 1 and events > baseline_events:
+            continue
+        reset(events)
+        # A worker that claims a batch and dies: its leases expire and the events come back
+        crashed = EventQueue(connect(database_url), 'crashed-worker', table, lease=2)
+        crashed.claim(abandoned)
+        crashed.conn.close()
+        pool = WorkerPool(database_url, handler, worker_count, drain=True, poll=0.2, table=table, lease=2,
+                          retry_delay=0.2)
+        summary = pool.run()
+        cur.execute(f"SELECT processing_status, COUNT(*) FROM {table} GROUP BY 1")
+        statuses = dict(cur.fetchall())
+        redelivered = sum(n - 1 for n in handled.values())
+        note = f"{statuses.get('completed', 0)} completed, {summary['retried']} retried, " \
+               f"{redelivered} redelivered, {len(handled)} distinct"
+        results.append(('SKIP LOCKED claims', worker_count, summary['throughput_per_s'], 0, note))
+        summaries.append(summary)
+    cur.execute(f"DROP TABLE {table}")
+    conn.close()
+
+    print(f"{events} events ({baseline_events} for the SELECT loops), {work * 1000:.0f} ms per event, "
+          f"{failure_rate:.0%} transient failures, {abandoned} abandoned by a crashed worker:")
+    for name, worker_count, throughput, duplicates, note in results:
+        status = '✅' if not duplicates else f"❌ {duplicates} processed twice"
+        print(f"  {name:24s} {worker_count:3d} workers  {throughput:7.0f} events/s  {status}  {note}")
+    print(f"  {json.dumps(summaries[-1])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Drain unified_events with leased parallel workers')
+    parser.add_argument('command', nargs='?', choices=('run', 'stats'))
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--webhook', help='n8n webhook URL that processes one event')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--batch', type=int, default=BATCH, help='events claimed per round trip')
+    parser.add_argument('--lease', type=int, default=LEASE, help='seconds before an unfinished claim expires')
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+    parser.add_argument('--drain', action='store_true', help='exit once the queue is empty')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--events', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        parser.error('--database-url (or DATABASE_URL) is required')
+    if args.benchmark:
+        benchmark(args.database_url, args.events, args.workers)
+        return
+    if args.command == 'stats':
+        conn = connect(args.database_url)
+        depth = EventQueue(conn).depth()
+        conn.close()
+        for status in QUEUED:
+            count, oldest = depth.get(status, (0, 0))
+            print(f"  {status:10s} {count:6d}  oldest {oldest:8.0f}s")
+        return
+    if args.command != 'run':
+        parser.error('a command is required (or --benchmark)')
+    if not args.webhook:
+        parser.error('run needs --webhook')
+
+    pool = WorkerPool(args.database_url, webhook_handler(args.webhook, os.environ.get('N8N_API_KEY'), args.workers),
+                      args.workers, args.batch, args.drain, lease=args.lease, max_attempts=args.max_attempts)
+    print(f"Draining unified_events with {args.workers} workers -> {args.webhook}")
+    try:
+        summary = pool.run()
+    except KeyboardInterrupt:
+        pool.stop()
+        summary = pool.summary()
+    print(f"✅ {summary['completed']} completed, {summary['retried']} retried, {summary['failed']} failed, "
+          f"{summary['lost_leases']} lost leases ({summary['throughput_per_s']} events/s)")
+    print(json.dumps(summary))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Per-user family-facts context cache for the AI Email Processor.
+
+For every email, "Get Family Facts" queries family_facts for that user
+and "Prepare Email + Context" joins the fact_text values into
+family_context, although a family's facts change only when onboarding is
+finalized or a command adds one. FactsContextCache keeps the rendered
+block per user (LRU, `capacity` users) together with its token count and
+the user's family_facts_versions.version (migration 007 bumps it on
+every family_facts insert/update/delete):
+
+  - listening mode (--database-url, needs psycopg2) is the one to deploy:
+    LISTEN on the family_facts_versions channel; a NOTIFY drops that
+    user's entry, so lookups for unchanged users don't touch the database
+    at all. After a listener (re)connect every entry is re-verified once,
+    since notifications sent while disconnected are lost
+  - polling mode (no psycopg2 or --database-url) is the fallback: an entry
+    verified less than `trust` seconds ago (--trust, default 10) is served
+    as is; older ones cost one batched version lookup per get_many() call,
+    and facts are re-read only for users whose version moved. A fact
+    written inside the window can be missed for up to `trust` seconds
+  - the block is rendered exactly like Prepare Email + Context
+    (non-empty fact_text values joined with a space), and counted with
+    prompt_packer.Tokenizer so callers can budget prompts without
+    re-tokenizing
+
+`serve` exposes GET /facts-context?userId=... answering {user_id,
+family_context, tokens, version, facts}; point "Get Family Facts" at it
+as an HTTP Request node (split out `facts` to keep Prepare Email +
+Context unchanged, or read family_context directly). GET /stats reports
+hits, version checks and facts queries. Callers send the N8N_API_KEY
+bearer token.
+
+Usage:
+  N8N_API_KEY=... python3 facts_context.py serve [--port 8792] [--database-url postgres://...]
+                                                 [--trust 10]
+  python3 facts_context.py --benchmark [--users 200] [--emails 3000] [--writes 30] [--trust 10]
+"""
+import argparse
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from http_pool import HttpError, JsonClient
+from prompt_packer import Tokenizer
+
+SUPABASE_URL = 'https://fvjmzvvcyxsvstlhenwj.supabase.co'
+CHANNEL = 'family_facts_versions'
+CAPACITY = 1000
+# Same cap as the Get Family Facts query
+FACTS_LIMIT = 100
+# Users per version lookup (keeps the in.(...) filter well inside URL limits)
+VERSION_BATCH = 100
+RECONNECT_DELAY = 5
+# Seconds a version check is trusted for in polling mode
+TRUST_SECONDS = 10
+
+Context = namedtuple('Context', 'user_id version family_context tokens facts')
+
+
+def render(facts):
+    """family_context as Prepare Email + Context builds it"""
+    return ' '.join(f.get('fact_text') or f.get('factText') or '' for f in facts
+                    if f.get('fact_text') or f.get('factText'))
+
+
+class FactsContextCache:
+    """LRU of rendered family_context blocks keyed by user, validated by version (thread-safe)"""
+
+    def __init__(self, client, capacity=CAPACITY, tokenizer=None, trust=TRUST_SECONDS):
+        self.client = client
+        self.capacity = capacity
+        self.trust = trust
+        self.tokenizer = tokenizer or Tokenizer()
+        self.lock = threading.Lock()
+        # user_id -> [Context, epoch it was last verified in, monotonic time of that check]
+        self.entries = OrderedDict()
+        # Highest notified version per user with a lookup in flight
+        self.pending = {}
+        self.listening = False
+        self.epoch = 0
+        self.stats = {'hits': 0, 'misses': 0, 'version_checks': 0, 'facts_queries': 0,
+                      'notifications': 0, 'invalidated': 0, 'evictions': 0, 'reconnects': 0}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def get(self, user_id):
+        return self.get_many([user_id])[user_id]
+
+    def get_many(self, user_ids):
+        """{user_id: Context} for user_ids, querying only what changed
+
+        Raises HttpError like the underlying client for failed requests.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        found = {}
+        now = time.monotonic()
+        with self.lock:
+            for user_id in user_ids:
+                entry = self.entries.get(user_id)
+                # Listening trusts the epoch (notifications); polling trusts recent checks
+                if entry and (entry[1] == self.epoch if self.listening
+                              else now - entry[2] < self.trust):
+                    self.entries.move_to_end(user_id)
+                    found[user_id] = entry[0]
+                else:
+                    self.pending.setdefault(user_id, 0)
+            epoch = self.epoch
+            self.stats['hits'] += len(found)
+        unverified = [u for u in user_ids if u not in found]
+        try:
+            if unverified:
+                found.update(self._verify(unverified, epoch))
+        finally:
+            with self.lock:
+                for user_id in unverified:
+                    self.pending.pop(user_id, None)
+        return found
+
+    def _verify(self, user_ids, epoch):
+        checked = time.monotonic()
+        versions = {}
+        for start in range(0, len(user_ids), VERSION_BATCH):
+            batch = user_ids[start:start + VERSION_BATCH]
+            rows = self.client.get('/rest/v1/family_facts_versions', {
+                'user_id': f"in.({','.join(batch)})", 'select': 'user_id,version',
+            })
+            versions.update((r['user_id'], r['version']) for r in rows or [])
+        with self.lock:
+            self.stats['version_checks'] += 1
+            hits = {}
+            for user_id in user_ids:
+                entry = self.entries.get(user_id)
+                if entry and entry[0].version == versions.get(user_id, 0):
+                    entry[1:] = [epoch, checked]
+                    self.entries.move_to_end(user_id)
+                    hits[user_id] = entry[0]
+            self.stats['hits'] += len(hits)
+            self.stats['misses'] += len(user_ids) - len(hits)
+
+        found = dict(hits)
+        for user_id in user_ids:
+            if user_id not in hits:
+                found[user_id] = self._load(user_id, versions.get(user_id, 0), epoch, checked)
+        return found
+
+    def _load(self, user_id, version, epoch, checked):
+        """Read and render user_id's facts; version was read before them, so it never runs ahead"""
+        facts = self.client.get('/rest/v1/family_facts', {
+            'user_id': f"eq.{user_id}", 'select': 'fact_type,subject,fact_text', 'limit': FACTS_LIMIT,
+        }) or []
+        block = render(facts)
+        context = Context(user_id, version, block, self.tokenizer.count(block) if block else 0, facts)
+        with self.lock:
+            self.stats['facts_queries'] += 1
+            # A NOTIFY for a newer version may have arrived while reading: serve, but don't keep
+            if self.pending.get(user_id, 0) <= version:
+                self.entries[user_id] = [context, epoch, checked]
+                self.entries.move_to_end(user_id)
+                while len(self.entries) > self.capacity:
+                    self.entries.popitem(last=False)
+                    self.stats['evictions'] += 1
+        return context
+
+    def notify(self, user_id, version):
+        """A family_facts_versions bump (NOTIFY payload or in-process writer)"""
+        with self.lock:
+            self.stats['notifications'] += 1
+            if user_id in self.pending:
+                self.pending[user_id] = max(self.pending[user_id], version)
+            entry = self.entries.get(user_id)
+            if entry and entry[0].version < version:
+                del self.entries[user_id]
+                self.stats['invalidated'] += 1
+
+    def invalidate(self, user_id):
+        with self.lock:
+            if self.entries.pop(user_id, None) is not None:
+                self.stats['invalidated'] += 1
+
+    def set_listening(self, connected):
+        """Trust cached entries only while notifications are being received
+
+        Each (re)connect starts a new epoch, so every entry is re-verified
+        once against family_facts_versions.
+        """
+        with self.lock:
+            if connected:
+                self.epoch += 1
+                self.stats['reconnects'] += 1
+            self.listening = connected
+
+    def _listen(self, database_url):
+        from unified_events_writer import connect
+        import select
+
+        while not self.stopped.is_set():
+            conn = None
+            try:
+                conn = connect(database_url)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                self.set_listening(True)
+                while not self.stopped.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            user_id, _, version = conn.notifies.pop(0).payload.rpartition(':')
+                            self.notify(user_id, int(version))
+            except Exception as e:
+                print(f"⚠️  {CHANNEL} listener disconnected: {e}", file=sys.stderr)
+            finally:
+                self.set_listening(False)
+                if conn is not None:
+                    conn.close()
+            self.stopped.wait(RECONNECT_DELAY)
+
+    def listen(self, database_url):
+        """Start the LISTEN thread (psycopg2 is only needed for this)"""
+        self.thread = threading.Thread(target=self._listen, args=(database_url,), daemon=True)
+        self.thread.start()
+        return self
+
+    def summary(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats, 'entries': len(self.entries), 'listening': self.listening,
+                'hit_ratio': round(self.stats['hits'] / lookups, 3) if lookups else None,
+                'tokens_cached': sum(entry[0].tokens for entry in self.entries.values()),
+            }
+
+    def close(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Cache-Control', 'no-store')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/stats':
+            return self._send(200, self.server.cache.summary())
+        if url.path != '/facts-context':
+            return self._send(404, {'error': 'not found'})
+        api_key = self.server.api_key
+        given = self.headers.get('Authorization', '')
+        if api_key and not hmac.compare_digest(given.encode(), f"Bearer {api_key}".encode()):
+            return self._send(401, {'error': 'Unauthorized'})
+        user_id = (parse_qs(url.query).get('userId') or [None])[-1]
+        if not user_id:
+            return self._send(400, {'error': 'userId query parameter required'})
+        try:
+            self._send(200, self.server.cache.get(user_id)._asdict())
+        except HttpError as e:
+            self._send(e.status or 502, {'error': str(e)})
+        except OSError as e:
+            self._send(502, {'error': str(e)})
+
+
+def benchmark(users=200, emails=3000, writes=30, latency=0.005, seed=0, trust=TRUST_SECONDS):
+    """Per-email facts lookups with interleaved fact writes: direct query vs polling vs listening cache
+
+    The run packs hours of mail into seconds, so the polling trust window
+    covers far more emails per user than it would in production; its stale
+    reads are the price of skipping version lookups, not a bug.
+    """
+    from mock_services import MockServices
+
+    rng = random.Random(seed)
+    with MockServices(users=users, messages=0, latency=latency, facts=4) as mock:
+        user_ids = [u['id'] for u in mock.tables['users']]
+        # Skewed like real inboxes: a few families get most of the mail
+        stream = rng.choices(user_ids, weights=[1 / (i + 1) for i in range(users)], k=emails)
+        write_at = set(rng.sample(range(emails), min(writes, emails)))
+        client = JsonClient(mock.url, size=4)
+
+        def write_fact(user_id, n):
+            client.request('POST', '/rest/v1/family_facts', body={
+                'user_id': user_id, 'fact_type': 'note', 'subject': 'family', 'fact_text': f"New fact {n}.",
+            })
+
+        def run(lookup, cache=None):
+            queries = lambda: (mock.counts['rest.get.family_facts'], mock.counts['rest.get.family_facts_versions'])
+            before = queries()
+            started = time.perf_counter()
+            mismatches = 0
+            for n, user_id in enumerate(stream):
+                if n in write_at:
+                    write_fact(user_id, n)
+                context = lookup(user_id)
+                expected = render(f for f in mock.tables['family_facts'] if f['user_id'] == user_id)
+                mismatches += context != expected
+            after = queries()
+            return time.perf_counter() - started, after[0] - before[0], after[1] - before[1], mismatches
+
+        def direct(user_id):
+            return render(client.get('/rest/v1/family_facts', {
+                'user_id': f"eq.{user_id}", 'select': 'fact_type,subject,fact_text', 'limit': FACTS_LIMIT,
+            }) or [])
+
+        results = [('direct query', *run(direct))]
+        polling = FactsContextCache(client, trust=trust)
+        results.append(('polling cache', *run(lambda u: polling.get(u).family_context)))
+        listening = FactsContextCache(client)
+        mock.version_listeners.append(listening.notify)
+        listening.set_listening(True)
+        results.append(('listening cache', *run(lambda u: listening.get(u).family_context)))
+        client.close()
+
+    print(f"{emails} emails for {users} users, {writes} fact writes, {latency * 1000:.0f} ms database latency:")
+    for name, elapsed, facts_queries, version_lookups, mismatches in results:
+        status = '✅' if not mismatches else f"❌ {mismatches} stale"
+        if mismatches and name == 'polling cache' and trust:
+            status = f"⚠️  {mismatches} stale (writes inside the {trust:g}s trust window)"
+        print(f"  {name:16s} {facts_queries:5d} facts queries  {version_lookups:5d} version lookups  "
+              f"{elapsed:6.2f}s  {status}")
+    print(f"  listening: {json.dumps(listening.summary())}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve cached per-user family_context blocks')
+    parser.add_argument('command', nargs='?', choices=('serve',))
+    parser.add_argument('--supabase-url', default=os.environ.get('SUPABASE_URL', SUPABASE_URL))
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help=f"LISTEN on {CHANNEL} (needs psycopg2); polls versions without it")
+    parser.add_argument('--port', type=int, default=8792)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--capacity', type=int, default=CAPACITY, help='users kept in the LRU')
+    parser.add_argument('--trust', type=float, default=TRUST_SECONDS,
+                        help='polling mode: seconds to reuse a verified entry without a version lookup')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--emails', type=int, default=3000)
+    parser.add_argument('--writes', type=int, default=30)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.users, args.emails, args.writes, trust=args.trust)
+        return
+    if not args.command:
+        parser.error('a command is required (or --benchmark)')
+    service_key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+    api_key = os.environ.get('N8N_API_KEY')
+    if not service_key or not api_key:
+        print('Error: SUPABASE_SERVICE_ROLE_KEY and N8N_API_KEY must be set', file=sys.stderr)
+        sys.exit(1)
+
+    client = JsonClient(args.supabase_url, {'apikey': service_key, 'Authorization': f"Bearer {service_key}"},
+                        size=16)
+    cache = FactsContextCache(client, args.capacity, trust=args.trust)
+    if args.database_url:
+        cache.listen(args.database_url)
+    server = ThreadingHTTPServer((args.host, args.port), _Handler)
+    server.daemon_threads = True
+    server.cache = cache
+    server.api_key = api_key
+    print(f"Serving family_context on http://{args.host}:{server.server_address[1]}/facts-context "
+          f"({'listening' if args.database_url else 'polling versions'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        cache.close()
+        client.close()
+        print(json.dumps(cache.summary()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
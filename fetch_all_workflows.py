@@ -1,61 +1,38 @@
 #!/usr/bin/env python3
 """
 Script to fetch all n8n workflows and save them to files.
-This script uses the n8n MCP tools via subprocess calls.
+Thin wrapper over n8n_backup.py (REST API) and workflow_io.py (file I/O).
 """
-import json
-import subprocess
-import re
 import os
-import time
+import sys
 
-def sanitize_filename(name):
-    if not name:
-        return "unknown"
-    name = name.lower()
-    name = re.sub(r'[^a-z0-9]+', '-', name)
-    name = re.sub(r'-+', '-', name)
-    name = name.strip('-')
-    return name or "unknown"
+import n8n_backup
+from workflow_io import WORKFLOWS_DIR, WorkflowWriter, unwrap_envelope
 
 def fetch_workflow(workflow_id):
-    """Fetch a single workflow using n8n_get_workflow MCP tool"""
+    """Fetch a single workflow through the n8n REST API"""
+    client = n8n_backup.N8nClient(os.environ.get('N8N_URL', n8n_backup.DEFAULT_URL),
+                                  os.environ.get('N8N_API_KEY', ''))
     try:
-        # Note: This would need to be adapted to actually call the MCP tool
-        # For now, this is a placeholder structure
-        result = subprocess.run(
-            ['n8n_get_workflow', '--id', workflow_id],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return json.loads(result.stdout)
-    except Exception as e:
+        return client.get_workflow(workflow_id)
+    except n8n_backup.N8nApiError as e:
         print(f"Error fetching workflow {workflow_id}: {e}", file=sys.stderr)
         return None
+    finally:
+        client.close()
 
-def save_workflow(workflow_data, output_dir='workflows'):
+def save_workflow(workflow_data, output_dir=WORKFLOWS_DIR):
     """Save workflow data to a file"""
-    if not workflow_data or not workflow_data.get('success'):
+    try:
+        workflow = unwrap_envelope(workflow_data)
+    except ValueError:
         return False
     
-    workflow = workflow_data.get('data', {})
-    workflow_name = workflow.get('name', 'unknown')
-    workflow_id = workflow.get('id', 'unknown')
-    
-    filename = sanitize_filename(workflow_name)
-    if not filename or filename == "unknown":
-        filename = f"workflow-{workflow_id}"
-    
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, f'{filename}.json')
-    
-    with open(output_path, 'w') as f:
-        json.dump(workflow, f, indent=2)
+    with WorkflowWriter(output_dir) as writer:
+        path, _ = writer.save(workflow)
     
-    print(f"Saved: {workflow_name} (ID: {workflow_id}) -> {filename}.json")
+    print(f"Saved: {workflow.get('name', 'unknown')} (ID: {workflow.get('id', 'unknown')}) -> {path.name}")
     return True
 
 if __name__ == "__main__":
-    print("This script requires manual execution with n8n MCP tools.")
-    print("Please use the n8n MCP tools directly to fetch workflows.")
+    n8n_backup.main()
@@ -1,16 +1,9 @@
 #!/usr/bin/env python3
 """Fetch and save a single workflow"""
 import json
-import re
 import sys
-from pathlib import Path
 
-def sanitize_filename(name):
-    """Convert workflow name to safe filename"""
-    name = name.lower()
-    name = re.sub(r'[^\w\s-]', '', name)
-    name = re.sub(r'[-\s]+', '-', name)
-    return name.strip('-')
+from workflow_io import save_workflow
 
 if __name__ == "__main__":
     if len(sys.argv) != 3:
@@ -23,23 +16,6 @@ if __name__ == "__main__":
     # Read workflow JSON from stdin
     workflow_data = json.load(sys.stdin)
     
-    # Sanitize filename
-    filename = sanitize_filename(workflow_name) + ".json"
-    filepath = Path("workflows") / filename
-    
-    # Save workflow
-    with open(filepath, 'w') as f:
-        json.dump(workflow_data, f, indent=2)
+    _, filepath = save_workflow(workflow_data, name=workflow_name)
     
     print(f"Saved: {filepath}")
-
-
-
-
-
-
-
-
-
-
-
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Gmail batch fetch.
+
+Packs message IDs into Gmail batch requests (multipart/mixed POSTs to
+/batch/gmail/v1, up to 50 calls each) sent over a JsonClient's pooled
+keep-alive connection, instead of one GET per message as the "Fetch
+Message Metadata" and "Get Email Content" nodes do. Parts that come back
+429/5xx (or are missing from the response) are retried in a follow-up
+batch after Retry-After / exponential backoff; 404s are reported and
+dropped. Each part is charged its quota units (5 per messages.get)
+against the fetcher's buckets and the ones passed to fetch(); only the
+latter (the caller's per-user bucket) are paused for Retry-After, so
+one user's rate limit doesn't hold back a shared bucket.
+
+Usage:
+  python3 gmail_batch.py --token ACCESS_TOKEN [--format metadata] ID [ID ...]
+  python3 gmail_batch.py --benchmark [--messages 60] [--latency 0.05]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from urllib.parse import urlencode
+
+from http_pool import RETRY_STATUSES, HttpError, JsonClient, parse_retry_after
+
+GMAIL_URL = 'https://gmail.googleapis.com'
+BATCH_PATH = '/batch/gmail/v1'
+# Gmail accepts 100 calls per batch but rate-limits batches above 50
+MAX_BATCH = 50
+GET_UNITS = 5
+FORMATS = ('full', 'metadata', 'minimal', 'raw')
+
+
+def message_path(message_id, fmt='full', metadata_headers=()):
+    params = [('format', fmt)] + [('metadataHeaders', h) for h in metadata_headers if fmt == 'metadata']
+    return f"/gmail/v1/users/me/messages/{message_id}?{urlencode(params)}"
+
+
+def build_batch(calls, boundary):
+    """multipart/mixed body for [(content_id, path), ...] GET calls
+
+    A call can also be (content_id, path, method, body) to send a JSON
+    body (Calendar events.insert parts, for instance).
+    """
+    chunks = []
+    for call in calls:
+        content_id, path, method, body = call if len(call) == 4 else (*call, 'GET', None)
+        request = f"{method} {path}\r\n\r\n"
+        if body is not None:
+            request = f"{method} {path}\r\nContent-Type: application/json\r\n\r\n{json.dumps(body)}\r\n"
+        chunks.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <{content_id}>\r\n\r\n"
+                      f"{request}")
+    return (''.join(chunks) + f"--{boundary}--\r\n").encode('utf-8')
+
+
+def _split_head(text):
+    """(head, rest) split at the first blank line, CRLF or LF"""
+    for sep in ('\r\n\r\n', '\n\n'):
+        head, found, rest = text.partition(sep)
+        if found:
+            return head, rest
+    return text, ''
+
+
+def _parse_headers(head):
+    headers = {}
+    for line in head.splitlines():
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def parse_batch(content_type, data):
+    """Map content id -> (status, headers, decoded JSON body) for a batch response"""
+    boundary = content_type.partition('boundary=')[2].split(';')[0].strip('"')
+    if not boundary:
+        raise ValueError(f"batch response without a boundary: {content_type}")
+    results = {}
+    for part in data.decode('utf-8').split(f"--{boundary}")[1:]:
+        if part.startswith('--'):
+            break
+        part_head, inner = _split_head(part.lstrip('\r\n'))
+        content_id = _parse_headers(part_head).get('content-id', '').strip('<>')
+        if content_id.startswith('response-'):
+            content_id = content_id[len('response-'):]
+        status_head, body = _split_head(inner)
+        status_line, _, header_lines = status_head.partition('\n')
+        status = int(status_line.split()[1])
+        body = body.strip()
+        try:
+            decoded = json.loads(body) if body else None
+        except json.JSONDecodeError:
+            decoded = body
+        results[content_id] = (status, _parse_headers(header_lines), decoded)
+    return results
+
+
+class GmailBatchFetcher:
+    """Fetch many messages per HTTP round trip with per-part retries"""
+
+    def __init__(self, client, batch_size=MAX_BATCH, max_attempts=4, buckets=()):
+        self.client = client
+        self.batch_size = min(batch_size, 100)
+        self.max_attempts = max_attempts
+        self.buckets = tuple(buckets)
+        self.stats = {'batches': 0, 'parts': 0, 'retried': 0}
+
+    def _send(self, token, calls, buckets, pause):
+        boundary = f"batch_{uuid.uuid4().hex}"
+        headers, data = self.client.send(
+            'POST', BATCH_PATH, build_batch(calls, boundary),
+            {'Authorization': f"Bearer {token}", 'Content-Type': f"multipart/mixed; boundary={boundary}"},
+            cost=GET_UNITS * len(calls), buckets=buckets, pause=pause,
+        )
+        self.stats['batches'] += 1
+        self.stats['parts'] += len(calls)
+        return parse_batch(headers.get('Content-Type', ''), data)
+
+    def fetch(self, token, message_ids, fmt='full', metadata_headers=(), buckets=()):
+        """Fetch messages; returns ({id: message} in input order, {id: HttpError})
+
+        Raises HttpError if the batch endpoint itself rejects the token.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        pause = tuple(buckets)
+        buckets = self.buckets + pause
+        ids = list(dict.fromkeys(message_ids))
+        found, errors = {}, {}
+        pending, last_status = ids, {}
+
+        for attempt in range(self.max_attempts):
+            retry, delay = [], 0.0
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                calls = [(f"item-{i}", message_path(mid, fmt, metadata_headers)) for i, mid in enumerate(chunk)]
+                try:
+                    results = self._send(token, calls, buckets, pause)
+                except HttpError as e:
+                    if e.status in (400, 401, 403):
+                        raise
+                    results = {}
+                for i, mid in enumerate(chunk):
+                    status, headers, body = results.get(f"item-{i}", (None, {}, None))
+                    if status == 200:
+                        found[mid] = body
+                    elif status is None or status in RETRY_STATUSES:
+                        retry.append(mid)
+                        last_status[mid] = status or 0
+                        wait = parse_retry_after(headers.get('retry-after'))
+                        delay = max(delay, wait if wait is not None else 0.5 * 2 ** attempt)
+                    else:
+                        message = body.get('error', {}).get('message') if isinstance(body, dict) else body
+                        errors[mid] = HttpError(status, message or 'error')
+            pending = retry
+            if not pending:
+                break
+            self.stats['retried'] += len(pending)
+            if attempt + 1 < self.max_attempts:
+                if pause:
+                    for bucket in pause:
+                        bucket.pause(delay)
+                else:
+                    time.sleep(delay)
+
+        for mid in pending:
+            errors[mid] = HttpError(last_status.get(mid, 0), f"giving up after {self.max_attempts} attempts")
+        return {mid: found[mid] for mid in ids if mid in found}, errors
+
+
+def benchmark(messages=60, latency=0.05):
+    """Per-message GETs (as the n8n HTTP nodes do them) vs batch fetch against mock_services"""
+    from mock_services import MockServices
+
+    with MockServices(users=1, messages=messages, latency=latency, user_quota=10 ** 6) as mock:
+        user_id = next(iter(mock.mailboxes))
+        token = f"tok-{user_id}"
+        ids = [m['id'] for m in mock.mailboxes[user_id]]
+        client = JsonClient(mock.url, size=1)
+        timings = {}
+        for fmt, headers in (('metadata', ('From', 'Subject', 'Date')), ('full', ())):
+            started = time.perf_counter()
+            for mid in ids:
+                client.send('GET', message_path(mid, fmt, headers), headers={'Authorization': f"Bearer {token}"})
+            timings[f"{fmt} per-message"] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            found, errors = GmailBatchFetcher(client).fetch(token, ids, fmt, headers)
+            timings[f"{fmt} batched"] = time.perf_counter() - started
+            assert len(found) == len(ids) and not errors
+        client.close()
+
+    print(f"{messages} messages, {latency * 1000:.0f} ms per round trip:")
+    for label, elapsed in timings.items():
+        print(f"  {label:<22} {elapsed:7.3f}s")
+    for fmt in ('metadata', 'full'):
+        print(f"  {fmt} speedup: {timings[f'{fmt} per-message'] / timings[f'{fmt} batched']:.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fetch Gmail messages with batch requests')
+    parser.add_argument('ids', nargs='*')
+    parser.add_argument('--token', default=os.environ.get('GMAIL_ACCESS_TOKEN'))
+    parser.add_argument('--format', choices=FORMATS, default='full')
+    parser.add_argument('--headers', default='From,Subject,Date', help='metadataHeaders for --format metadata')
+    parser.add_argument('--url', default=os.environ.get('GMAIL_URL', GMAIL_URL))
+    parser.add_argument('--benchmark', action='store_true', help='compare against per-message GETs on a mock')
+    parser.add_argument('--messages', type=int, default=60)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.messages, args.latency)
+        return
+    if not args.token or not args.ids:
+        parser.error('--token (or GMAIL_ACCESS_TOKEN) and message IDs are required')
+
+    client = JsonClient(args.url, size=1)
+    try:
+        found, errors = GmailBatchFetcher(client).fetch(args.token, args.ids, args.format,
+                                                        args.headers.split(','))
+    except HttpError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        client.close()
+    json.dump(list(found.values()), sys.stdout, indent=2)
+    print()
+    for mid, error in errors.items():
+        print(f"❌ {mid}: {error}", file=sys.stderr)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Gmail message body decoder.
+
+One body extractor for Gmail `format=full` messages, replacing the two in
+the workflows: "Convert To Readable Email" (onboarding) only reads
+top-level text/plain parts, and "Parse Email + Rate Limit" (scheduled
+sync) adds a top-level HTML fallback. Both come back blank for nested
+multipart/mixed > multipart/alternative trees.
+
+  - walks payload.parts iteratively; from each multipart/alternative only
+    the cheapest usable child is read (text/plain, else a nested multipart,
+    else text/html); attachments are skipped
+  - decodes base64url in chunks through an incremental decoder (honoring
+    the part's charset) and stops once the token budget is filled
+  - HTML goes through a regex tag stripper (script/style dropped, block
+    tags become line breaks, entities unescaped)
+  - quoted replies ("On ... wrote:", "-----Original Message-----", ">"
+    lines) and signatures ("-- ", "Sent from my ...") are stripped, unless
+    that would leave nothing; forwarded messages are kept
+  - output is capped at max_tokens (estimated at CHARS_PER_TOKEN)
+
+Usage:
+  python3 gmail_body.py message.json [--max-tokens 2000] [--keep-quotes]
+  python3 gmail_body.py --benchmark [--corpus PATH | --synthetic] [--messages 2000]
+
+--benchmark runs over fixtures/gmail_messages.ndjson, anonymized format=full
+messages in the part layouts real senders produce (Gmail, Outlook, Apple
+Mail, school/league mailers, calendar invites, receipts, scans), cycled up
+to --messages; --corpus points it at your own export instead.
+"""
+import argparse
+import base64
+import binascii
+import codecs
+import html
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+CHARS_PER_TOKEN = 4
+RECORDED_CORPUS = Path(__file__).resolve().parent / 'fixtures' / 'gmail_messages.ndjson'
+# base64url characters decoded per step; a multiple of 4
+CHUNK = 16 * 1024
+TEXT_TYPES = ('text/plain', 'text/html')
+
+Body = namedtuple('Body', 'text mime_type truncated')
+
+_CHARSET = re.compile(r'charset\s*=\s*"?([\w.:-]+)', re.I)
+_HTML_DROP = re.compile(r'<(script|style|head|title)\b.*?</\1\s*>|<!--.*?-->', re.I | re.S)
+_HTML_BREAK = re.compile(r'<(?:br|/?p|/?div|/?li|/?tr|/?h[1-6]|/?table|/?ul|/?ol|/?blockquote)\b[^>]*>', re.I)
+_HTML_TAG = re.compile(r'<[^>]*>')
+_SPACE_CHARS = '\t\f\v\r\xa0\u200b'
+_BLANK_LINES = re.compile(r'\n\n\n+')
+_REPLY_CUT = re.compile(
+    r'^[ \t]*(?:On\s[^\n]{1,200}(?:\n[^\n]{0,200})?\swrote:[ \t]*$'
+    r'|-{2,}[ \t]*Original Message[ \t]*-{2,})',
+    re.M | re.I,
+)
+_QUOTED_LINE = re.compile(r'^[ \t]*>.*(?:\n|$)', re.M)
+_SIGNATURE_CUT = re.compile(r'^-- ?$', re.M)
+_MOBILE_FOOTER = re.compile(r'^[ \t]*(?:Sent from my [^\n]{1,40}|Get Outlook for [^\n]{1,20})[ \t]*$', re.M | re.I)
+
+
+def estimate_tokens(text):
+    """Rough token count of `text` (CHARS_PER_TOKEN characters per token)"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _headers(part):
+    return {h.get('name', '').lower(): h.get('value', '') for h in part.get('headers') or []}
+
+
+def _is_attachment(part):
+    if part.get('filename') or (part.get('body') or {}).get('attachmentId'):
+        return True
+    return _headers(part).get('content-disposition', '').lower().startswith('attachment')
+
+
+def _charset(part):
+    match = _CHARSET.search(_headers(part).get('content-type', ''))
+    name = match.group(1) if match else 'utf-8'
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return 'utf-8'
+
+
+def _preference(part):
+    """Rank of a multipart/alternative child: lower is cheaper to read"""
+    mime = (part.get('mimeType') or '').lower()
+    has_data = bool((part.get('body') or {}).get('data'))
+    if mime == 'text/plain' and has_data:
+        return 0
+    if mime.startswith('multipart/') and part.get('parts'):
+        return 1
+    return 2 if mime == 'text/html' and has_data else 3
+
+
+def text_parts(payload):
+    """text/plain and text/html leaves worth reading, in document order"""
+    stack = [payload] if payload else []
+    while stack:
+        part = stack.pop()
+        mime = (part.get('mimeType') or '').lower()
+        children = [c for c in part.get('parts') or [] if isinstance(c, dict)]
+        if children:
+            if mime == 'multipart/alternative':
+                children = [min(children, key=_preference)]
+            stack.extend(reversed(children))
+        elif mime in TEXT_TYPES and (part.get('body') or {}).get('data') and not _is_attachment(part):
+            yield part
+        elif not mime and (part.get('body') or {}).get('data'):
+            # Single-part messages without a mimeType: treat as plain text
+            yield part
+
+
+def _b64_tail(piece):
+    """Pad the final base64url piece; a lone trailing character (truncated body) is dropped"""
+    if len(piece) % 4 == 1:
+        piece = piece[:-1]
+    return piece + '=' * (-len(piece) % 4)
+
+
+def decode_chunks(data, charset='utf-8', chunk=CHUNK):
+    """Yield decoded text from base64url `data` one chunk at a time
+
+    A truncated or corrupt body yields what decoded up to the damage.
+    """
+    decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+    for start in range(0, len(data), chunk):
+        piece = data[start:start + chunk]
+        last = start + chunk >= len(data)
+        if last:
+            piece = _b64_tail(piece)
+        try:
+            raw = base64.urlsafe_b64decode(piece)
+        except binascii.Error:
+            yield decoder.decode(b'', True)
+            return
+        yield decoder.decode(raw, last)
+    if not data:
+        yield ''
+
+
+def html_to_text(markup):
+    """Fast tag stripper: drops script/style, block tags become line breaks"""
+    text = _HTML_TAG.sub('', _HTML_BREAK.sub('\n', _HTML_DROP.sub('', markup)))
+    return normalize_whitespace(html.unescape(text))
+
+
+def normalize_whitespace(text):
+    """Collapse runs of spaces, trim every line and keep at most one blank line"""
+    # str.replace beats a character-class regex by an order of magnitude here
+    text = text.replace('\r\n', '\n')
+    for ch in _SPACE_CHARS:
+        if ch in text:
+            text = text.replace(ch, ' ')
+    while '  ' in text:
+        text = text.replace('  ', ' ')
+    text = text.replace(' \n', '\n').replace('\n ', '\n')
+    return _BLANK_LINES.sub('\n\n', text).strip()
+
+
+def strip_quotes(text):
+    """Remove quoted replies and signatures, keeping the text if nothing would be left"""
+    # Substring checks first: the line-anchored patterns are slow on long bodies
+    lowered, stripped = text.lower(), text
+    if 'wrote:' in lowered or 'original message' in lowered:
+        cut = _REPLY_CUT.search(stripped)
+        if cut:
+            stripped = stripped[:cut.start()]
+    if '>' in stripped:
+        stripped = _QUOTED_LINE.sub('', stripped)
+    if '--' in stripped:
+        cut = _SIGNATURE_CUT.search(stripped)
+        if cut:
+            stripped = stripped[:cut.start()]
+    if 'sent from my' in lowered or 'get outlook for' in lowered:
+        stripped = _MOBILE_FOOTER.sub('', stripped)
+    stripped = stripped.strip()
+    return stripped if stripped else text
+
+
+def _clean(raw, mime, quotes):
+    text = html_to_text(raw) if mime == 'text/html' else normalize_whitespace(raw)
+    return strip_quotes(text) if quotes else text
+
+
+def _truncate(text, max_chars):
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(' ', max_chars // 2, max_chars + 1)
+    return text[:cut if cut > 0 else max_chars].rstrip()
+
+
+def extract_body(payload, max_tokens=None, keep_quotes=False):
+    """Readable body of a Gmail message payload as a Body(text, mime_type, truncated)
+
+    mime_type is the type of the first part the text came from ('' if the
+    message has no readable text).
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN if max_tokens else None
+    sections, used, first_mime, truncated = [], 0, '', False
+    for part in text_parts(payload):
+        mime = (part.get('mimeType') or 'text/plain').lower()
+        raw, text = [], ''
+        for piece in decode_chunks(part['body']['data'], _charset(part)):
+            raw.append(piece)
+            # Stop decoding once what's kept so far fills the budget
+            if max_chars is not None and sum(map(len, raw)) >= max_chars - used:
+                text = _clean(''.join(raw), mime, not keep_quotes)
+                if len(text) >= max_chars - used:
+                    truncated = True
+                    break
+        else:
+            text = _clean(''.join(raw), mime, not keep_quotes)
+        if not text:
+            continue
+        first_mime = first_mime or mime
+        sections.append(text)
+        used += len(text) + 2
+        if max_chars is not None and used >= max_chars:
+            truncated = True
+            break
+    body = '\n\n'.join(sections)
+    if max_chars is not None and len(body) > max_chars:
+        body, truncated = _truncate(body, max_chars), True
+    return Body(body, first_mime, truncated)
+
+
+def node_body(payload, html_fallback=True):
+    """What "Parse Email + Rate Limit" extracts: top-level parts only, decoded whole
+
+    html_fallback=False is "Convert To Readable Email" (text/plain only).
+    """
+    def decode(data):
+        try:
+            return base64.urlsafe_b64decode(_b64_tail(data)).decode('utf-8', 'replace')
+        except binascii.Error:
+            return ''
+
+    body = ''
+    if payload.get('parts'):
+        for part in payload['parts']:
+            data = (part.get('body') or {}).get('data')
+            if part.get('mimeType') == 'text/plain' and data:
+                body += decode(data)
+            elif html_fallback and part.get('mimeType') == 'text/html' and data and not body:
+                body += decode(data)
+    elif (payload.get('body') or {}).get('data'):
+        body = decode(payload['body']['data'])
+    return body
+
+
+def _leaf(mime, text, charset='utf-8', **extra):
+    data = base64.urlsafe_b64encode(text.encode(charset)).decode('ascii').rstrip('=')
+    return {'mimeType': mime, 'headers': [{'name': 'Content-Type', 'value': f'{mime}; charset="{charset}"'}],
+            'body': {'size': len(text), 'data': data}, **extra}
+
+
+def _multipart(mime, *parts):
+    return {'mimeType': mime, 'headers': [], 'body': {'size': 0}, 'parts': list(parts)}
+
+
+def sample_payloads(count=2000, seed=0):
+    """Synthetic Gmail payloads in the shapes real mailboxes produce"""
+    rng = random.Random(seed)
+    sentences = [
+        'Field trip permission slips are due Friday.', 'Practice moves to 5:30pm at the north field.',
+        'Please RSVP for the spring concert by March 3.', 'Your order has shipped and arrives Tuesday.',
+        'Room 12 will have a substitute teacher on Monday.', 'Pick-up is at the side gate this week.',
+    ]
+    payloads = []
+    for i in range(count):
+        text = ' '.join(rng.choice(sentences) for _ in range(rng.randint(3, 40)))
+        markup = (f"<html><head><style>p{{color:#333}}</style></head><body><div><p>{html.escape(text)}</p>"
+                  f"<table><tr><td>Room&nbsp;12</td><td>Mon &amp; Tue</td></tr></table></div></body></html>")
+        reply = f"{text}\n\nOn Mon, Jan 5, 2026 at 9:14 AM Coach <coach@teamsnap.com> wrote:\n> {text}\n> Thanks\n"
+        kind = i % 8
+        if kind == 0:
+            payload = _leaf('text/plain', text)
+        elif kind == 1:
+            payload = _multipart('multipart/alternative', _leaf('text/plain', text), _leaf('text/html', markup))
+        elif kind == 2:
+            # mixed > alternative + attachment: blank for the node
+            payload = _multipart('multipart/mixed',
+                                 _multipart('multipart/alternative', _leaf('text/plain', text),
+                                            _leaf('text/html', markup)),
+                                 {'mimeType': 'application/pdf', 'filename': 'slip.pdf',
+                                  'body': {'attachmentId': 'att1', 'size': 52000}})
+        elif kind == 3:
+            # mixed > related > alternative (HTML with inline images)
+            payload = _multipart('multipart/mixed', _multipart(
+                'multipart/related',
+                _multipart('multipart/alternative', _leaf('text/plain', text), _leaf('text/html', markup)),
+                {'mimeType': 'image/png', 'filename': 'logo.png', 'body': {'attachmentId': 'att2', 'size': 900}}))
+        elif kind == 4:
+            payload = _leaf('text/html', markup)
+        elif kind == 5:
+            payload = _multipart('multipart/alternative', _leaf('text/plain', reply + '\n-- \nCoach Sam\n555-0100'),
+                                 _leaf('text/html', markup))
+        elif kind == 6:
+            payload = _leaf('text/plain', text.replace('.', '. café'), charset='iso-8859-1')
+        else:
+            # Long newsletter, mostly markup
+            payload = _multipart('multipart/alternative', _leaf('text/html', markup * rng.randint(20, 80)))
+        payloads.append(payload)
+    return payloads
+
+
+def load_corpus(path):
+    """Gmail payloads from recorded messages: a JSON file (one message, a list or
+    {"messages": [...]}), NDJSON, or a directory of such files"""
+    path = Path(path)
+    files = sorted(path.glob('*.json')) + sorted(path.glob('*.ndjson')) if path.is_dir() else [path]
+    messages = []
+    for file in files:
+        text = file.read_text()
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError:
+            data = [json.loads(line) for line in text.splitlines() if line.strip()]
+        if isinstance(data, dict):
+            data = data.get('messages', [data])
+        messages.extend(data)
+    return [m['payload'] if 'payload' in m else m for m in messages if isinstance(m, dict)]
+
+
+def benchmark(payloads, max_tokens=2000):
+    """The node's extraction vs extract_body over a corpus"""
+    started = time.perf_counter()
+    readable = [node_body(p, html_fallback=False) for p in payloads]
+    readable_elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    node = [node_body(p) for p in payloads]
+    node_elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    full = [extract_body(p) for p in payloads]
+    full_elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    capped = [extract_body(p, max_tokens) for p in payloads]
+    capped_elapsed = time.perf_counter() - started
+
+    def report(label, elapsed, texts):
+        blank = sum(len(t.strip()) < 50 for t in texts)
+        tokens = sum(estimate_tokens(t) for t in texts)
+        print(f"  {label:<28} {elapsed * 1000:8.1f} ms  {blank:5d} blank  "
+              f"{tokens / max(1, len(texts)):7.0f} tokens/email")
+
+    print(f"{len(payloads)} payloads (blank: under 50 characters; node tokens include raw HTML):")
+    report('Convert To Readable Email', readable_elapsed, readable)
+    report('Parse Email + Rate Limit', node_elapsed, node)
+    report('extract_body', full_elapsed, [b.text for b in full])
+    report(f'extract_body, {max_tokens} tokens', capped_elapsed, [b.text for b in capped])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Extract readable text from Gmail messages')
+    parser.add_argument('file', nargs='?', help='Gmail message JSON (format=full), - for stdin')
+    parser.add_argument('--max-tokens', type=int, help='cap the text at about this many tokens')
+    parser.add_argument('--keep-quotes', action='store_true', help="don't strip quoted replies and signatures")
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--corpus', default=str(RECORDED_CORPUS),
+                        help='recorded messages for --benchmark (file or directory)')
+    parser.add_argument('--synthetic', action='store_true', help='benchmark generated payloads instead')
+    parser.add_argument('--messages', type=int, default=2000, help='corpus size (recorded messages are cycled)')
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        if args.synthetic:
+            payloads = sample_payloads(args.messages)
+        else:
+            recorded = load_corpus(args.corpus)
+            if not recorded:
+                parser.error(f"no messages in {args.corpus}")
+            print(f"{len(recorded)} messages from {args.corpus}")
+            payloads = [recorded[i % len(recorded)] for i in range(max(args.messages, len(recorded)))]
+        benchmark(payloads, args.max_tokens or 2000)
+        return
+    if not args.file:
+        parser.error('a message file is required (or --benchmark)')
+    if args.file != '-' and not os.path.exists(args.file):
+        parser.error(f"{args.file} not found")
+    message = json.load(sys.stdin if args.file == '-' else open(args.file))
+    body = extract_body(message.get('payload', message), args.max_tokens, args.keep_quotes)
+    print(body.text)
+    if body.truncated:
+        print(f"[truncated at ~{args.max_tokens} tokens]", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
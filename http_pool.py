@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP plumbing for the API clients in this repo.
+
+  - ConnectionPool: fixed-size pool of keep-alive connections to one host
+  - TokenBucket: thread-safe rate limiter; acquire(cost) takes `cost`
+    tokens so one bucket can meter quota units rather than requests
+  - JsonClient: JSON requests over a pool with retries; a 429/503 with
+    Retry-After pauses every bucket the request was charged to, or only
+    the `pause` buckets when given (a per-user limit shouldn't stall a
+    shared bucket). Requests sent with idempotent=False (inserts) are
+    only retried after a 429 or a refused connection, where the server
+    can't have acted on them
+"""
+import gzip
+import http.client
+import json
+import queue
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode, urlsplit
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HttpError(Exception):
+    """Raised for a non-retryable HTTP error (or when retries run out)
+
+    body and headers are those of the last response (b'' / {} if none).
+    """
+
+    def __init__(self, status, message, body=b'', headers=None):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+        self.message = message
+        self.body = body
+        self.headers = headers or {}
+
+
+def parse_retry_after(value):
+    """Convert a Retry-After header (seconds or HTTP date) to seconds"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every request of a run"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        cost = min(float(cost), self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= cost:
+                        self.tokens -= cost
+                        return
+                    wait = (cost - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every caller for `seconds` (used for Retry-After)"""
+        with self.lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            self.tokens = 0
+            self.updated = self.paused_until
+
+
+class ConnectionPool:
+    """Fixed-size pool of keep-alive HTTP(S) connections to one host"""
+
+    def __init__(self, base_url, size, timeout=30):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, headers, body=None):
+        """Send one request, returning (status, headers, body bytes)"""
+        with self.slots:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                self.idle.put(conn)
+            return resp.status, resp.headers, data
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class JsonClient:
+    """JSON API client over a ConnectionPool with retries and rate limiting"""
+
+    def __init__(self, base_url, headers=None, size=8, bucket=None, max_retries=4, timeout=30):
+        self.pool = ConnectionPool(base_url, size, timeout)
+        self.headers = dict(headers or {})
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'retries': 0, 'bytes': 0}
+
+    def _count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def send(self, method, path, body=None, headers=None, cost=1, buckets=(), pause=None, idempotent=True):
+        """Send raw bytes with retries; returns (response headers, body bytes)
+
+        cost tokens are taken from the client's bucket and every extra
+        bucket before each attempt. A 429/503 pauses the `pause` buckets
+        (default: all of them) for Retry-After. With idempotent=False a
+        5xx or a dropped connection raises at once, as the request may
+        already have taken effect.
+        """
+        all_headers = {'Accept-Encoding': 'gzip', **self.headers, **(headers or {})}
+        buckets = [b for b in (self.bucket, *buckets) if b is not None]
+        pause = buckets if pause is None else [b for b in pause if b is not None]
+
+        attempt = 0
+        while True:
+            for bucket in buckets:
+                bucket.acquire(cost)
+            self._count('requests')
+            refused = False
+            try:
+                status, resp_headers, data = self.pool.request(method, path, all_headers, body)
+            except (http.client.HTTPException, OSError) as e:
+                status, resp_headers, data = None, {}, str(e).encode()
+                refused = isinstance(e, ConnectionRefusedError)
+
+            if status is not None:
+                self._count('bytes', len(data))
+                if resp_headers.get('Content-Encoding') == 'gzip':
+                    data = gzip.decompress(data)
+            if status is not None and status < 400:
+                return resp_headers, data
+
+            if status is not None and status not in RETRY_STATUSES:
+                raise HttpError(status, data[:200].decode('utf-8', 'replace'), data, resp_headers)
+            if not idempotent and status != 429 and not refused:
+                raise HttpError(status or 0, data[:200].decode('utf-8', 'replace'), data if status else b'',
+                                resp_headers)
+            if attempt >= self.max_retries:
+                raise HttpError(status or 0, f"giving up after {attempt + 1} attempts", data if status else b'',
+                                resp_headers)
+
+            attempt += 1
+            self._count('retries')
+            delay = parse_retry_after(resp_headers.get('Retry-After'))
+            if delay is None:
+                delay = min(30.0, 0.5 * 2 ** attempt)
+            if status in (429, 503) and pause:
+                for bucket in pause:
+                    bucket.pause(delay)
+            else:
+                time.sleep(delay)
+
+    def request(self, method, path, params=None, body=None, headers=None, cost=1, buckets=(), pause=None,
+                idempotent=True):
+        """Send a JSON request and return the decoded JSON body (None if empty)"""
+        if params:
+            path = f"{path}?{urlencode(params, doseq=True)}"
+        headers = {'Accept': 'application/json', **(headers or {})}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        _, data = self.send(method, path, payload, headers, cost, buckets, pause, idempotent)
+        return json.loads(data) if data.strip() else None
+
+    def get(self, path, params=None, **kwargs):
+        return self.request('GET', path, params, **kwargs)
+
+    def close(self):
+        self.pool.close()
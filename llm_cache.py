@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Content-hash cache for OpenAI chat completions.
+
+"Parse Command with AI", "Refine Facts Agent" and "AI Agent - Stage 1
+Analysis" re-run full GPT-4o calls whenever the same email or facts are
+processed again: after retries, processing_status resets, and error
+workflow replays. This module puts a local cache in front of the API:
+
+  - ResponseCache: SQLite store (WAL) keyed by request_key(), the SHA-256
+    of the request's canonical JSON minus transport-only fields, so model,
+    system prompt, user prompt, tool definitions, earlier tool turns and
+    sampling parameters all take part. Entries expire after `ttl` seconds
+    and the least recently used ones are evicted once the stored responses
+    pass `max_bytes`. Hit/miss/eviction counts and the tokens and seconds
+    saved are kept in `stats`; per-entry hit counts persist in the file.
+  - CachingProxy: an OpenAI-compatible HTTP endpoint that answers POST
+    /v1/chat/completions from the cache and forwards misses (and every
+    other path) upstream. Streaming requests and requests sent with
+    "Cache-Control: no-cache" are passed through; only 200 responses are
+    stored. Upstream errors go back with their own status, body and
+    Retry-After, and chat POSTs are only resent after a 429 or a refused
+    connection, never after a 5xx or a dropped one. GET /cache/stats
+    returns the metrics.
+
+To use it from n8n, set the Base URL of the "OpenAi account" credential to
+http://<host>:8790/v1. Every agent on that credential goes through the
+cache, and a replay is answered from it only when its request matches
+byte for byte once canonicalized.
+
+Usage:
+  python3 llm_cache.py serve [--port 8790] [--upstream https://api.openai.com] [--ttl 604800]
+  python3 llm_cache.py stats | purge | clear [--db PATH]
+  python3 llm_cache.py --benchmark [--requests 20] [--llm-latency 1.0]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from http_pool import HttpError, JsonClient
+from workflow_io import canonical_json
+
+DEFAULT_DB = Path(__file__).parent / '.cache' / 'llm_responses.sqlite3'
+DEFAULT_UPSTREAM = 'https://api.openai.com'
+CHAT_PATH = '/v1/chat/completions'
+TTL = 7 * 24 * 3600
+MAX_BYTES = 256 * 1024 * 1024
+# Evict down to this fraction of max_bytes so eviction doesn't run on every store
+EVICT_TO = 0.9
+# Fields that don't change the completion
+TRANSPORT_FIELDS = ('stream', 'stream_options', 'user', 'metadata', 'store')
+# Headers forwarded upstream
+FORWARD_HEADERS = ('Authorization', 'OpenAI-Organization', 'OpenAI-Project')
+# Upstream error headers passed back to the client
+PASS_BACK_HEADERS = ('Content-Type', 'Retry-After', 'x-request-id')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    response BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    latency REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+"""
+
+
+def request_key(request):
+    """SHA-256 of a chat completion request, ignoring transport-only fields"""
+    semantic = {k: v for k, v in request.items() if k not in TRANSPORT_FIELDS}
+    return hashlib.sha256(canonical_json(semantic).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed response cache with TTL and size-bounded LRU eviction (thread-safe)"""
+
+    def __init__(self, path=DEFAULT_DB, ttl=TTL, max_bytes=MAX_BYTES):
+        self.path = str(path)
+        if self.path != ':memory:':
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stores': 0, 'evictions': 0, 'bypassed': 0,
+                      'tokens_saved': 0, 'seconds_saved': 0.0}
+
+    def get(self, key):
+        """Cached response bytes for key, or None (expired entries are dropped)"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute('SELECT response, size, tokens, latency, created_at FROM responses '
+                                    'WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            response, size, tokens, latency, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self.conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.total_bytes -= size
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self.conn.execute('UPDATE responses SET accessed_at = ?, hits = hits + 1 WHERE key = ?', (now, key))
+            self.stats['hits'] += 1
+            self.stats['tokens_saved'] += tokens
+            self.stats['seconds_saved'] += latency
+            return bytes(response)
+
+    def put(self, key, response, model=None, tokens=0, latency=0.0):
+        """Store response bytes under key, then evict LRU entries if over max_bytes"""
+        now = time.time()
+        with self.lock:
+            old = self.conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self.conn.execute('INSERT OR REPLACE INTO responses (key, model, response, size, tokens, latency, '
+                              'created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (key, model, response, len(response), tokens, latency, now, now))
+            self.total_bytes += len(response) - (old[0] if old else 0)
+            self.stats['stores'] += 1
+            if self.total_bytes > self.max_bytes:
+                self._evict(int(self.max_bytes * EVICT_TO))
+
+    def _evict(self, target):
+        """Delete least recently used entries until at most `target` bytes remain"""
+        freed, victims = 0, []
+        for key, size in self.conn.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+            if self.total_bytes - freed <= target:
+                break
+            victims.append((key,))
+            freed += size
+        self.conn.executemany('DELETE FROM responses WHERE key = ?', victims)
+        self.total_bytes -= freed
+        self.stats['evictions'] += len(victims)
+
+    def purge(self):
+        """Delete expired entries; returns how many"""
+        if not self.ttl:
+            return 0
+        with self.lock:
+            cutoff = time.time() - self.ttl
+            freed, count = self.conn.execute('SELECT COALESCE(SUM(size), 0), COUNT(*) FROM responses '
+                                             'WHERE created_at < ?', (cutoff,)).fetchone()
+            self.conn.execute('DELETE FROM responses WHERE created_at < ?', (cutoff,))
+            self.total_bytes -= freed
+            return count
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM responses')
+            self.total_bytes = 0
+
+    def summary(self):
+        """Entry count, size and lifetime hit / token savings from the file itself"""
+        with self.lock:
+            entries, size, hits, tokens = self.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0), '
+                'COALESCE(SUM(hits * tokens), 0) FROM responses').fetchone()
+        requests = self.stats['hits'] + self.stats['misses']
+        return {'entries': entries, 'bytes': size, 'lifetime_hits': hits, 'lifetime_tokens_saved': tokens,
+                'hit_rate': round(self.stats['hits'] / requests, 3) if requests else None, **self.stats}
+
+    def close(self):
+        self.conn.close()
+
+
+class CachingProxy:
+    """OpenAI-compatible HTTP proxy answering chat completions from a ResponseCache"""
+
+    def __init__(self, cache, upstream=DEFAULT_UPSTREAM, port=8790, host='127.0.0.1', timeout=300):
+        self.cache = cache
+        self.client = JsonClient(upstream, size=16, max_retries=2, timeout=timeout)
+        self.server = ThreadingHTTPServer((host, port), _ProxyHandler)
+        self.server.daemon_threads = True
+        self.server.proxy = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def complete(self, raw, headers):
+        """(status, body bytes, cache state, upstream headers) for one chat completion request body"""
+        try:
+            request = json.loads(raw)
+        except ValueError:
+            return 400, json.dumps({'error': {'message': 'request body is not JSON'}}).encode(), 'BYPASS', {}
+        if request.get('stream') or 'no-cache' in headers.get('Cache-Control', ''):
+            with self.cache.lock:
+                self.cache.stats['bypassed'] += 1
+            status, body, upstream = self.forward('POST', CHAT_PATH, raw, headers)
+            return status, body, 'BYPASS', upstream
+
+        key = request_key(request)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return 200, cached, 'HIT', {}
+        started = time.perf_counter()
+        status, body, upstream = self.forward('POST', CHAT_PATH, raw, headers)
+        if status == 200:
+            try:
+                usage = json.loads(body).get('usage') or {}
+            except ValueError:
+                usage = {}
+            self.cache.put(key, body, request.get('model'), usage.get('total_tokens', 0),
+                           time.perf_counter() - started)
+        return status, body, 'MISS', upstream
+
+    def forward(self, method, path, raw, headers):
+        """Send a request upstream; returns (status, body bytes, headers to pass back)
+
+        Error responses are returned as upstream sent them, so clients see
+        OpenAI's error type / code and Retry-After.
+        """
+        forwarded = {name: headers[name] for name in FORWARD_HEADERS if headers.get(name)}
+        if raw:
+            forwarded['Content-Type'] = 'application/json'
+        try:
+            _, body = self.client.send(method, path, raw or None, forwarded, idempotent=method != 'POST')
+            return 200, body, {}
+        except HttpError as e:
+            if not e.status:
+                return 502, json.dumps({'error': {'message': str(e), 'type': 'upstream_error'}}).encode(), {}
+            return e.status, e.body, {name: e.headers[name] for name in PASS_BACK_HEADERS if e.headers.get(name)}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.client.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; without TCP_NODELAY a
+    # keep-alive client waits out delayed ACK (~40 ms) on every hit
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, data, cache_state=None, upstream=None):
+        upstream = upstream or {}
+        self.send_response(status)
+        self.send_header('Content-Type', upstream.get('Content-Type', 'application/json'))
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in upstream.items():
+            if name != 'Content-Type':
+                self.send_header(name, value)
+        if cache_state:
+            self.send_header('X-Cache', cache_state)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        proxy = self.server.proxy
+        if self.path == '/cache/stats':
+            return self._send(200, json.dumps(proxy.cache.summary()).encode())
+        status, body, upstream = proxy.forward('GET', self.path, b'', self.headers)
+        self._send(status, body, upstream=upstream)
+
+    def do_POST(self):
+        proxy = self.server.proxy
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if self.path.split('?')[0] == CHAT_PATH:
+            return self._send(*proxy.complete(raw, self.headers))
+        status, body, upstream = proxy.forward('POST', self.path, raw, self.headers)
+        self._send(status, body, upstream=upstream)
+
+
+def sample_requests(count):
+    """Chat requests shaped like the three cached agents, one per reprocessed email"""
+    requests = []
+    for i in range(count):
+        email = f"Subject: Soccer practice moved\n\nPractice for Emma moves to Thursday 4:{i:02d}pm."
+        requests.append({
+            'model': 'gpt-4o', 'temperature': 0.3, 'max_tokens': 2000,
+            'messages': [{'role': 'system', 'content': 'You are a precise command parser. Output ONLY valid JSON.'},
+                         {'role': 'user', 'content': f"Parse this email and extract commands.\n{email}"}],
+        })
+    return requests
+
+
+def benchmark(count=20, llm_latency=1.0):
+    """Process a batch of requests, then replay it, against the mock's chat endpoint"""
+    from mock_services import MockServices
+
+    cache = ResponseCache(':memory:')
+    with MockServices(users=0, llm_latency=llm_latency) as mock, CachingProxy(cache, mock.url, port=0) as proxy:
+        client = JsonClient(proxy.url, size=1)
+        requests = sample_requests(count)
+        timings = {}
+        for label in ('first run', 'replay'):
+            started = time.perf_counter()
+            for request in requests:
+                client.request('POST', CHAT_PATH, body=request)
+            timings[label] = time.perf_counter() - started
+        client.close()
+        upstream_calls = mock.counts['openai.chat']
+
+    summary = cache.summary()
+    print(f"{count} chat completions, {llm_latency:.1f}s upstream latency:")
+    for label, elapsed in timings.items():
+        print(f"  {label:<10} {elapsed:8.3f}s  ({elapsed / count * 1000:8.1f} ms/request)")
+    print(f"  upstream calls {upstream_calls}, hits {summary['hits']}, misses {summary['misses']}, "
+          f"tokens saved {summary['tokens_saved']}, seconds saved {summary['seconds_saved']:.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cache OpenAI chat completions by request content')
+    parser.add_argument('command', nargs='?', choices=('serve', 'stats', 'purge', 'clear'))
+    parser.add_argument('--db', default=os.environ.get('LLM_CACHE_DB', str(DEFAULT_DB)))
+    parser.add_argument('--ttl', type=int, default=TTL, help='seconds an entry stays valid (0: forever)')
+    parser.add_argument('--max-mb', type=int, default=MAX_BYTES // (1024 * 1024), help='cache size bound')
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--upstream', default=os.environ.get('OPENAI_BASE_URL', DEFAULT_UPSTREAM))
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--llm-latency', type=float, default=1.0, help='mock upstream seconds per call')
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.requests, args.llm_latency)
+        return
+    if not args.command:
+        parser.error('a command is required (or --benchmark)')
+
+    cache = ResponseCache(args.db, args.ttl, args.max_mb * 1024 * 1024)
+    try:
+        if args.command == 'stats':
+            print(json.dumps(cache.summary(), indent=2))
+        elif args.command == 'purge':
+            print(f"✅ {cache.purge()} expired entries removed")
+        elif args.command == 'clear':
+            cache.clear()
+            print('✅ Cache cleared')
+        else:
+            proxy = CachingProxy(cache, args.upstream, args.port, args.host)
+            print(f"Caching {args.upstream} on {proxy.url} ({args.db})")
+            print(f"  set the OpenAI credential's Base URL to {proxy.url}/v1")
+            try:
+                proxy.server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                proxy.client.close()
+                print(json.dumps(cache.summary()), file=sys.stderr)
+    finally:
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+"""
+Concurrent multi-tenant mailbox sync worker.
+
+Does what Bippity-Scheduled-Email-Check does every 5 minutes, without the
+serial "Process One User at a Time" loop and its fixed 1-second delays:
+
+  1. list active users from Supabase
+  2. for every user, concurrently (--workers):
+     - fetch the Google token from /api/auth/tokens through a TokenCache
+       (token_cache.py), so a token is only fetched again near its
+       expiry; failures mark the user needs_reauth, like "Mark Needs
+       Reauth"
+     - read the mailbox historyId (1 quota unit) and skip the user if it
+       hasn't moved since the last successful sync; an idle mailbox costs
+       only this request
+     - change feed (--mode history, the default): once a user has a stored
+       historyId, ask users.history.list for the messages added since
+       (2 quota units). Only new Primary inbox messages are fetched, and
+       the user's blacklist is applied locally (a Blacklist of addresses
+       and domains, refetched every BLACKLIST_TTL seconds) instead of in
+       the search query. A historyId Gmail no longer knows (404) falls
+       back to a search.
+     - search (--mode search, and every first sync): build the same Gmail
+       query as "Build Gmail Query" (after: last received_at,
+       category:primary, -from: blacklisted domains) and list the matching
+       messages
+     - fetch the new messages with Gmail batch requests
+       (gmail_batch.py), parse them like "Parse Email + Rate Limit" (but
+       with gmail_body.py reading nested multipart bodies) and
+       upsert them into unified_events in one request (PostgREST, or a
+       multi-row INSERT over --database-url; see unified_events_writer.py)
+     - stamp connected_services.last_sync_at
+
+Gmail requests are charged in quota units against a per-user bucket
+(--user-quota units/s) and a global bucket (--global-quota units/s); a 429
+pauses only that user's bucket for Retry-After, so one rate-limited
+mailbox doesn't stall the others. The historyId of each synced mailbox
+is kept in --state.
+
+Each cycle reports per-user latency percentiles; --metrics appends the
+cycle report to an NDJSON file.
+
+Usage:
+  SUPABASE_URL=... SUPABASE_SERVICE_ROLE_KEY=... N8N_API_KEY=... \\
+      python3 mailbox_sync.py [--cycles 0] [--interval 300] [--workers 16] [--database-url URL]
+                              [--mode history|search]
+  python3 mailbox_sync.py --mock 300 --cycles 2 --interval 0   # against mock_services.py
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import parseaddr
+from pathlib import Path
+
+from gmail_batch import GmailBatchFetcher
+from gmail_body import extract_body
+from http_pool import HttpError, JsonClient, TokenBucket
+from token_cache import TokenCache
+from unified_events_writer import UnifiedEventsError, UnifiedEventsWriter, connect
+from workflow_io import atomic_write_json
+
+GMAIL_URL = 'https://gmail.googleapis.com'
+BIPPITY_URL = 'https://bippity.boo'
+STATE_PATH = Path(__file__).parent / '.mailbox_sync_state.json'
+
+# Gmail API quota units per call
+GMAIL_UNITS = {'profile': 1, 'list': 5, 'get': 5, 'history': 2}
+MAX_RESULTS = 50
+HISTORY_PAGE = 500
+MODES = ('history', 'search')
+# Seconds a user's compiled blacklist is reused in history mode
+BLACKLIST_TTL = 900
+# Labels that keep a message out of category:primary
+NON_PRIMARY_LABELS = frozenset(('CATEGORY_PROMOTIONS', 'CATEGORY_SOCIAL', 'CATEGORY_UPDATES', 'CATEGORY_FORUMS',
+                                'SPAM', 'TRASH', 'DRAFT'))
+FIRST_SYNC_DAYS = 90
+# body_text cap, in estimated tokens
+BODY_TOKENS = 8000
+
+UserResult = namedtuple('UserResult', 'user_id status messages saved units latency error')
+
+
+class ReauthRequired(Exception):
+    """The user's Google token is missing, expired or can't be refreshed"""
+
+
+def _reauth_reason(status, data):
+    """The token route's reason to re-authenticate the user, or None
+
+    Only the route's own verdict counts: needs_reauth / is_expired in the
+    body, or a 404 for a user without stored tokens. A 401 for a wrong
+    N8N_API_KEY or a 429 is a failed cycle, not a reason to reauth.
+    """
+    data = data if isinstance(data, dict) else {}
+    if data.get('needs_reauth') or data.get('is_expired'):
+        return data.get('error') or 'Token expired'
+    if status == 404 and 'not found' in str(data.get('error', '')).lower():
+        return data['error']
+    return None
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def build_gmail_query(last_received_at, blacklist, now=None):
+    """Gmail search query for messages since the last saved one"""
+    filters = []
+    for entry in blacklist:
+        entry = str(entry or '').strip()
+        if not entry:
+            continue
+        if '@' in entry and not entry.startswith('@'):
+            filters.append(f"-from:{entry}")
+        else:
+            filters.append(f"-from:{entry if entry.startswith('@') else '@' + entry}")
+    if last_received_at:
+        after = datetime.fromisoformat(last_received_at.replace('Z', '+00:00'))
+    else:
+        after = (now or _utcnow()) - timedelta(days=FIRST_SYNC_DAYS)
+    query = f"after:{int(after.timestamp())} category:primary"
+    return f"{query} {' '.join(filters)}" if filters else query
+
+
+def is_primary(label_ids):
+    """Whether a message with these labels is in the Primary inbox"""
+    labels = label_ids or ()
+    return 'INBOX' in labels and NON_PRIMARY_LABELS.isdisjoint(labels)
+
+
+class Blacklist:
+    """blacklisted_domains entries compiled for matching From headers locally
+
+    An entry with a local part ("news@shop.com") blocks that address; any
+    other entry ("shop.com", "@shop.com") blocks the domain and its
+    subdomains, like the -from: terms of build_gmail_query.
+    """
+
+    def __init__(self, entries):
+        self.addresses = set()
+        self.domains = set()
+        for entry in entries:
+            entry = str(entry or '').strip().lower()
+            if '@' in entry and not entry.startswith('@'):
+                self.addresses.add(entry)
+            elif entry.lstrip('@'):
+                self.domains.add(entry.lstrip('@'))
+
+    def __len__(self):
+        return len(self.addresses) + len(self.domains)
+
+    def blocks(self, sender):
+        address = parseaddr(sender or '')[1].lower()
+        if not address:
+            return False
+        if address in self.addresses:
+            return True
+        domain = address.rpartition('@')[2]
+        while domain:
+            if domain in self.domains:
+                return True
+            domain = domain.partition('.')[2]
+        return False
+
+
+def _header(headers, name):
+    name = name.lower()
+    return next((h.get('value') for h in headers if h.get('name', '').lower() == name), None)
+
+
+def parse_message(message, user_id):
+    """unified_events row for a Gmail `format=full` message (None if unusable)
+
+    A malformed message is skipped with a warning rather than failing the
+    user's whole batch, which would stall their historyId on it for good.
+    """
+    payload = message.get('payload')
+    if not payload:
+        return None
+    try:
+        body = extract_body(payload, BODY_TOKENS).text
+        headers = payload.get('headers') or []
+        received = datetime.fromtimestamp(int(message.get('internalDate', 0)) / 1000, timezone.utc)
+    except (ValueError, TypeError, KeyError, AttributeError, OverflowError) as e:
+        print(f"⚠️  Skipping message {message.get('id')} for {user_id}: {e}", file=sys.stderr)
+        return None
+    return {
+        'user_id': user_id,
+        'channel': 'gmail',
+        'source_id': message.get('id'),
+        'source_thread_id': message.get('threadId'),
+        'event_type': 'email',
+        'subject': _header(headers, 'Subject') or None,
+        'snippet': message.get('snippet') or None,
+        'body_text': body or None,
+        'from_email': _header(headers, 'From') or None,
+        'received_at': received.isoformat().replace('+00:00', 'Z'),
+        'is_processed': False,
+        'processing_status': 'pending',
+    }
+
+
+def percentiles(values, points=(50, 90, 95, 99)):
+    """Nearest-rank percentiles (plus max) of a list of numbers"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {f"p{p}": ordered[max(0, -(-p * len(ordered) // 100) - 1)] for p in points}
+    result['max'] = ordered[-1]
+    return result
+
+
+class SyncState:
+    """Last synced historyId per user, persisted as JSON (path=None: memory only)"""
+
+    def __init__(self, path=STATE_PATH):
+        self.path = Path(path) if path else None
+        self.users = {}
+        self.lock = threading.Lock()
+        if self.path:
+            try:
+                with open(self.path) as f:
+                    self.users = json.load(f).get('users', {})
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+
+    def history_id(self, user_id):
+        return (self.users.get(user_id) or {}).get('history_id')
+
+    def record(self, user_id, history_id):
+        with self.lock:
+            self.users[user_id] = {'history_id': history_id, 'synced_at': _utcnow().isoformat()}
+
+    def save(self):
+        if self.path:
+            with self.lock:
+                atomic_write_json(self.path, {'users': self.users})
+
+
+class MailboxSync:
+    """One sync worker: call run_cycle() once per schedule tick"""
+
+    def __init__(self, supabase, tokens, gmail, state, workers=16, user_quota=250, global_quota=2000,
+                 writer=None, mode='history'):
+        self.supabase = supabase
+        self.tokens = tokens
+        self.token_cache = TokenCache(tokens).start()
+        self.gmail = gmail
+        self.state = state
+        self.workers = workers
+        self.user_quota = user_quota
+        self.global_bucket = TokenBucket(global_quota)
+        self.fetcher = GmailBatchFetcher(gmail, buckets=(self.global_bucket,))
+        self.writer = writer
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        self.mode = mode
+        # user_id -> (Blacklist, monotonic time fetched)
+        self.blacklists = {}
+
+    def active_users(self):
+        return self.supabase.get('/rest/v1/users', {'select': 'id,email', 'status': 'eq.active'}) or []
+
+    def get_token(self, user_id):
+        try:
+            data = self.token_cache.get(user_id)
+        except HttpError as e:
+            try:
+                body = json.loads(e.body or b'null')
+            except ValueError:
+                body = None
+            reason = _reauth_reason(e.status, body)
+            if reason:
+                raise ReauthRequired(reason) from None
+            raise
+        reason = _reauth_reason(200, data)
+        if reason:
+            raise ReauthRequired(reason)
+        if not data or data.get('error') or not data.get('access_token'):
+            raise ValueError(f"token route: {(data or {}).get('error') or 'no access token'}")
+        return data['access_token']
+
+    def blacklist_rows(self, user_id):
+        return self.supabase.get('/rest/v1/blacklisted_domains', {
+            'select': 'domain', 'user_id': f"eq.{user_id}", 'is_active': 'eq.true', 'limit': 100,
+        }) or []
+
+    def blacklist(self, user_id):
+        """The user's compiled Blacklist, refetched every BLACKLIST_TTL seconds"""
+        cached = self.blacklists.get(user_id)
+        if cached and time.monotonic() - cached[1] < BLACKLIST_TTL:
+            return cached[0]
+        blacklist = Blacklist(row.get('domain') for row in self.blacklist_rows(user_id))
+        self.blacklists[user_id] = (blacklist, time.monotonic())
+        return blacklist
+
+    @staticmethod
+    def history_changes(gmail, token, start_history_id):
+        """(ids of Primary inbox messages added since start_history_id, latest historyId)
+
+        Raises HttpError 404 when Gmail no longer has that historyId.
+        """
+        ids, page_token = {}, None
+        while True:
+            params = {'startHistoryId': start_history_id, 'historyTypes': 'messageAdded',
+                      'maxResults': HISTORY_PAGE}
+            if page_token:
+                params['pageToken'] = page_token
+            page = gmail('/gmail/v1/users/me/history', 'history', params, token) or {}
+            for record in page.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message = added.get('message') or {}
+                    if message.get('id') and is_primary(message.get('labelIds')):
+                        ids[message['id']] = True
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return list(ids), page.get('historyId') or start_history_id
+
+    def _touch(self, user_id):
+        self.supabase.request(
+            'PATCH', '/rest/v1/connected_services',
+            {'user_id': f"eq.{user_id}", 'service_name': 'eq.google'},
+            body={'last_sync_at': _utcnow().isoformat(), 'consecutive_failures': 0},
+        )
+
+    def sync_user(self, user):
+        """Sync one mailbox; never raises"""
+        user_id = user['id']
+        started = time.perf_counter()
+        bucket = TokenBucket(self.user_quota)
+        units = Counter()
+
+        def gmail(path, kind, params=None, token=None):
+            units[kind] += GMAIL_UNITS[kind]
+            return self.gmail.get(path, params, headers={'Authorization': f"Bearer {token}"},
+                                  cost=GMAIL_UNITS[kind], buckets=(bucket, self.global_bucket), pause=(bucket,))
+
+        def result(status, messages=0, saved=0, error=None):
+            return UserResult(user_id, status, messages, saved, sum(units.values()),
+                              time.perf_counter() - started, error)
+
+        try:
+            try:
+                token = self.get_token(user_id)
+            except ReauthRequired as e:
+                self.supabase.request('PATCH', '/rest/v1/users', {'id': f"eq.{user_id}"},
+                                      body={'status': 'needs_reauth'})
+                return result('reauth', error=str(e))
+
+            known = self.state.history_id(user_id)
+            profile = gmail('/gmail/v1/users/me/profile', 'profile', token=token) or {}
+            history_id = profile.get('historyId')
+            if history_id and known == history_id:
+                self._touch(user_id)
+                return result('unchanged')
+
+            ids = blacklist = None
+            if self.mode == 'history' and known:
+                try:
+                    ids, history_id = self.history_changes(gmail, token, known)
+                except HttpError as e:
+                    if e.status != 404:
+                        raise
+                else:
+                    if not ids:
+                        # Only labels changed or messages were deleted
+                        self.state.record(user_id, history_id)
+                        self._touch(user_id)
+                        return result('unchanged')
+                    blacklist = self.blacklist(user_id)
+
+            if ids is None:
+                last = self.supabase.get('/rest/v1/unified_events', {
+                    'select': 'received_at', 'user_id': f"eq.{user_id}", 'channel': 'eq.gmail',
+                    'order': 'received_at.desc', 'limit': 1,
+                }) or []
+                query = build_gmail_query(last[0].get('received_at') if last else None,
+                                          [row.get('domain') for row in self.blacklist_rows(user_id)])
+                listing = gmail('/gmail/v1/users/me/messages', 'list',
+                                {'q': query, 'maxResults': MAX_RESULTS}, token) or {}
+                ids = list(dict.fromkeys(m['id'] for m in listing.get('messages', []) if m.get('id')))
+
+            units['get'] += GMAIL_UNITS['get'] * len(ids)
+            messages, errors = self.fetcher.fetch(token, ids, 'full', buckets=(bucket,))
+            failed = sum(e.status != 404 for e in errors.values())
+            rows = [row for row in (parse_message(m, user_id) for m in messages.values()) if row]
+            if blacklist:
+                rows = [row for row in rows if not blacklist.blocks(row['from_email'])]
+
+            if rows and self.writer:
+                self.writer.insert(rows)
+            elif rows:
+                self.supabase.request(
+                    'POST', '/rest/v1/unified_events', {'on_conflict': 'user_id,channel,source_id'},
+                    body=rows, headers={'Prefer': 'resolution=ignore-duplicates,return=minimal'},
+                )
+            self._touch(user_id)
+            if failed:
+                # Leave the historyId alone so the next cycle retries
+                return result('failed', len(ids), len(rows), f"{failed} message fetch(es) failed")
+            if history_id:
+                self.state.record(user_id, history_id)
+            return result('synced', len(ids), len(rows))
+        except (HttpError, OSError, ValueError, UnifiedEventsError) as e:
+            if isinstance(e, HttpError) and e.status == 401:
+                self.token_cache.invalidate(user_id)
+            return result('failed', error=str(e))
+
+    def run_cycle(self):
+        """Sync every active user once and return the cycle report"""
+        started_at = _utcnow()
+        started = time.perf_counter()
+        users = self.active_users()
+        tokens_before = self.token_cache.summary()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(self.sync_user, users))
+        self.state.save()
+        elapsed = time.perf_counter() - started
+
+        statuses = Counter(r.status for r in results)
+        tokens = self.token_cache.summary()
+        return {
+            'started_at': started_at.isoformat(),
+            'elapsed': elapsed,
+            'users': len(results),
+            'synced': statuses['synced'],
+            'unchanged': statuses['unchanged'],
+            'reauth': statuses['reauth'],
+            'failed': statuses['failed'],
+            'messages': sum(r.messages for r in results),
+            'saved': sum(r.saved for r in results),
+            'gmail_units': sum(r.units for r in results),
+            'latency': percentiles([r.latency for r in results]),
+            'token_hits': tokens['hits'] - tokens_before['hits'],
+            'token_fetches': tokens['fetches'] - tokens_before['fetches'],
+            'token_fetch_latency_ms': tokens['fetch_latency_ms'],
+            'errors': {r.user_id: r.error for r in results if r.status == 'failed'},
+        }
+
+    def close(self):
+        self.token_cache.close()
+        for client in (self.supabase, self.tokens, self.gmail):
+            client.close()
+        if self.writer:
+            self.writer.conn.close()
+
+
+def print_report(report):
+    print(f"Cycle {report['started_at']}: {report['users']} users in {report['elapsed']:.2f}s "
+          f"(synced {report['synced']}, unchanged {report['unchanged']}, "
+          f"reauth {report['reauth']}, failed {report['failed']})")
+    print(f"  {report['messages']} messages fetched, {report['saved']} saved, "
+          f"{report['gmail_units']} Gmail quota units")
+    print(f"  tokens: {report['token_hits']} cached, {report['token_fetches']} fetched "
+          f"(fetch latency {' '.join(f'{k} {v:.0f}ms' for k, v in report['token_fetch_latency_ms'].items())})")
+    if report['latency']:
+        print('  per-user latency ' + ' '.join(f"{k} {v * 1000:.0f}ms" for k, v in report['latency'].items()))
+    for user_id, error in list(report['errors'].items())[:10]:
+        print(f"  ❌ {user_id}: {error}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent Gmail -> unified_events sync worker')
+    parser.add_argument('--cycles', type=int, default=1, help='cycles to run (0: forever)')
+    parser.add_argument('--interval', type=float, default=300, help='seconds between cycle starts')
+    parser.add_argument('--workers', type=int, default=16, help='users synced concurrently')
+    parser.add_argument('--user-quota', type=float, default=250, help='Gmail units/s per user')
+    parser.add_argument('--global-quota', type=float, default=2000, help='Gmail units/s for the worker')
+    parser.add_argument('--state', default=str(STATE_PATH), help='historyId state file')
+    parser.add_argument('--mode', choices=MODES, default='history',
+                        help='find new mail with users.history.list or with a search query')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='write unified_events over Postgres instead of PostgREST')
+    parser.add_argument('--metrics', help='append each cycle report to this NDJSON file')
+    parser.add_argument('--mock', type=int, metavar='USERS', help='run against an in-process mock_services')
+    parser.add_argument('--mock-latency', type=float, default=0.02)
+    args = parser.parse_args(argv)
+
+    mock = None
+    if args.mock:
+        from mock_services import MockServices
+        mock = MockServices(users=args.mock, latency=args.mock_latency, expired=max(1, args.mock // 100)).start()
+        supabase_url = gmail_url = bippity_url = mock.url
+        service_key = api_key = 'mock'
+        state = SyncState(None)
+    else:
+        supabase_url = os.environ.get('SUPABASE_URL') or os.environ.get('NEXT_PUBLIC_SUPABASE_URL')
+        service_key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+        api_key = os.environ.get('N8N_API_KEY')
+        gmail_url = os.environ.get('GMAIL_URL', GMAIL_URL)
+        bippity_url = os.environ.get('BIPPITY_URL', BIPPITY_URL)
+        missing = [name for name, value in [('SUPABASE_URL', supabase_url),
+                                            ('SUPABASE_SERVICE_ROLE_KEY', service_key),
+                                            ('N8N_API_KEY', api_key)] if not value]
+        if missing:
+            print(f"Error: {', '.join(missing)} not set", file=sys.stderr)
+            sys.exit(1)
+        state = SyncState(args.state)
+
+    writer = None
+    if args.database_url:
+        writer = UnifiedEventsWriter(connect(args.database_url))
+
+    sync = MailboxSync(
+        JsonClient(supabase_url, {'apikey': service_key, 'Authorization': f"Bearer {service_key}"},
+                   size=args.workers),
+        JsonClient(bippity_url, {'Authorization': f"Bearer {api_key}"}, size=args.workers),
+        JsonClient(gmail_url, size=args.workers),
+        state, args.workers, args.user_quota, args.global_quota, writer, args.mode,
+    )
+    cycle = 0
+    try:
+        while True:
+            cycle_start = time.monotonic()
+            try:
+                report = sync.run_cycle()
+            except (HttpError, OSError) as e:
+                print(f"❌ Cycle failed: {e}", file=sys.stderr)
+            else:
+                print_report(report)
+                if args.metrics:
+                    with open(args.metrics, 'a') as f:
+                        f.write(json.dumps(report) + '\n')
+                if args.interval and report['elapsed'] > args.interval:
+                    print(f"⚠️  Cycle took {report['elapsed']:.0f}s, longer than the "
+                          f"{args.interval:.0f}s interval", file=sys.stderr)
+            cycle += 1
+            if args.cycles and cycle >= args.cycles:
+                break
+            if mock:
+                # New mail for ~5% of the mock mailboxes before the next cycle
+                for user_id in list(mock.mailboxes)[::20]:
+                    mock.add_message(user_id)
+            time.sleep(max(0.0, args.interval - (time.monotonic() - cycle_start)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sync.close()
+        if mock:
+            mock.stop()
+
+
+if __name__ == '__main__':
+    main()
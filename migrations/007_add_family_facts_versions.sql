@@ -0,0 +1,87 @@
+-- Migration: Per-user version counter for family_facts
+-- Purpose: Let the AI Email Processor's facts-context cache (facts_context.py)
+-- keep a rendered facts block per user and re-read family_facts only after
+-- that user's facts change.
+--
+-- The counter is bumped by statement-level triggers, so every writer is
+-- covered without workflow changes: "Save to family_facts"
+-- (onboarding-finalize), "Create Family Fact" and the other Command
+-- Processor nodes, and /api/onboarding/finalize. Each bump also sends a
+-- NOTIFY on the family_facts_versions channel with "<user_id>:<version>",
+-- so a listening cache can drop a stale entry without polling.
+-- A user without a row is at version 0.
+
+CREATE TABLE IF NOT EXISTS family_facts_versions (
+  user_id UUID PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE family_facts_versions ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their family facts version"
+  ON family_facts_versions FOR SELECT
+  USING (user_id = auth.uid());
+
+-- Bump the version of every user touched by one INSERT/UPDATE/DELETE
+-- statement (once per user per statement, however many rows changed).
+-- SECURITY DEFINER so writes made under RLS can still bump the counter.
+CREATE OR REPLACE FUNCTION bump_family_facts_versions()
+RETURNS TRIGGER AS $$
+DECLARE
+  notified INTEGER;
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    WITH bumped AS (
+      INSERT INTO family_facts_versions AS v (user_id, version, updated_at)
+      SELECT DISTINCT user_id, 1, NOW() FROM new_rows WHERE user_id IS NOT NULL
+      ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1, updated_at = NOW()
+      RETURNING user_id, version
+    )
+    SELECT COUNT(pg_notify('family_facts_versions', user_id::text || ':' || version)) INTO notified FROM bumped;
+  END IF;
+
+  -- Updates that move a fact to another user bump the previous owner too
+  IF TG_OP = 'UPDATE' THEN
+    WITH bumped AS (
+      INSERT INTO family_facts_versions AS v (user_id, version, updated_at)
+      SELECT DISTINCT o.user_id, 1, NOW() FROM old_rows o
+      WHERE o.user_id IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM new_rows n WHERE n.user_id = o.user_id)
+      ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1, updated_at = NOW()
+      RETURNING user_id, version
+    )
+    SELECT COUNT(pg_notify('family_facts_versions', user_id::text || ':' || version)) INTO notified FROM bumped;
+  END IF;
+
+  IF TG_OP = 'DELETE' THEN
+    WITH bumped AS (
+      INSERT INTO family_facts_versions AS v (user_id, version, updated_at)
+      SELECT DISTINCT user_id, 1, NOW() FROM old_rows WHERE user_id IS NOT NULL
+      ON CONFLICT (user_id) DO UPDATE SET version = v.version + 1, updated_at = NOW()
+      RETURNING user_id, version
+    )
+    SELECT COUNT(pg_notify('family_facts_versions', user_id::text || ':' || version)) INTO notified FROM bumped;
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS family_facts_versions_insert ON family_facts;
+CREATE TRIGGER family_facts_versions_insert
+  AFTER INSERT ON family_facts
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_family_facts_versions();
+
+DROP TRIGGER IF EXISTS family_facts_versions_update ON family_facts;
+CREATE TRIGGER family_facts_versions_update
+  AFTER UPDATE ON family_facts
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_family_facts_versions();
+
+DROP TRIGGER IF EXISTS family_facts_versions_delete ON family_facts;
+CREATE TRIGGER family_facts_versions_delete
+  AFTER DELETE ON family_facts
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION bump_family_facts_versions();
@@ -0,0 +1,54 @@
+-- Migration: Work-queue claims for unified_events
+-- Purpose: Let several AI processor workers (event_queue.py, or n8n via
+-- claim_unified_events()) drain pending emails in parallel without picking
+-- up the same row twice.
+--
+-- A claim leases rows with SELECT ... FOR UPDATE SKIP LOCKED: the row moves
+-- to processing_status = 'processing' with locked_by / locked_until set and
+-- attempts incremented. A worker that dies simply lets its lease expire and
+-- the row becomes claimable again; after max_attempts claims it is left for
+-- event_queue.py to mark 'error'.
+
+ALTER TABLE unified_events
+  ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS locked_until TIMESTAMP WITH TIME ZONE,
+  ADD COLUMN IF NOT EXISTS locked_by TEXT,
+  ADD COLUMN IF NOT EXISTS last_error TEXT;
+
+-- Only queued rows are indexed, so the index stays small as history grows
+CREATE INDEX IF NOT EXISTS idx_unified_events_queue
+  ON unified_events(created_at)
+  WHERE processing_status IN ('pending', 'processing');
+
+-- Lease up to batch_size claimable rows, oldest first. Rows in 'pending'
+-- with a future locked_until are waiting out a retry backoff.
+CREATE OR REPLACE FUNCTION claim_unified_events(
+  worker TEXT,
+  batch_size INTEGER DEFAULT 10,
+  lease_seconds INTEGER DEFAULT 300,
+  max_attempts INTEGER DEFAULT 3
+)
+RETURNS SETOF unified_events AS $$
+  WITH next AS (
+    SELECT id FROM unified_events
+    WHERE processing_status IN ('pending', 'processing')
+      AND (locked_until IS NULL OR locked_until <= NOW())
+      AND attempts < max_attempts
+    ORDER BY created_at
+    LIMIT batch_size
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE unified_events e
+  SET processing_status = 'processing',
+      locked_by = worker,
+      locked_until = NOW() + lease_seconds * INTERVAL '1 second',
+      attempts = e.attempts + 1
+  FROM next
+  WHERE e.id = next.id
+  RETURNING e.*;
+$$ LANGUAGE sql;
+
+COMMENT ON COLUMN unified_events.attempts IS 'Number of times a worker claimed this event';
+COMMENT ON COLUMN unified_events.locked_until IS 'Lease expiry while processing; retry-after time while pending';
+COMMENT ON COLUMN unified_events.locked_by IS 'Worker holding the current lease';
+COMMENT ON COLUMN unified_events.last_error IS 'Error from the most recent failed attempt';
@@ -0,0 +1,28 @@
+-- Migration: NOTIFY when pending unified_events arrive
+-- Purpose: Let event_dispatcher.py start the AI processor as soon as
+-- ingestion commits new emails, instead of the processor's cron polling
+-- two minutes after the ingestion cron.
+--
+-- One notification per INSERT statement (a batched insert of 200 emails
+-- sends one), on channel unified_events_pending with the number of new
+-- pending rows as payload. Postgres delivers it at commit and folds
+-- identical payloads sent by one transaction.
+
+CREATE OR REPLACE FUNCTION notify_unified_events_pending()
+RETURNS TRIGGER AS $$
+DECLARE
+  queued INTEGER;
+BEGIN
+  SELECT COUNT(*) INTO queued FROM new_rows WHERE processing_status = 'pending';
+  IF queued > 0 THEN
+    PERFORM pg_notify('unified_events_pending', queued::text);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS unified_events_pending_notify ON unified_events;
+CREATE TRIGGER unified_events_pending_notify
+  AFTER INSERT ON unified_events
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION notify_unified_events_pending();
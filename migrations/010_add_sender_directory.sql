@@ -0,0 +1,50 @@
+-- Migration: Case-normalized sender lookup for the Gmail Command Poller
+-- Purpose: Resolve command senders to users / families with indexed
+-- lower(email) lookups (sender_resolver.py) instead of one Supabase
+-- "ilike" query per message, which can't use a plain B-tree index and
+-- treats "_" in an address as a wildcard.
+
+CREATE INDEX IF NOT EXISTS idx_users_email_lower ON users(lower(email));
+CREATE INDEX IF NOT EXISTS idx_family_members_email_lower ON family_members(lower(email));
+
+-- Every known sender address, lowercased, with its user and family (either
+-- may be NULL: a family member without an account, or a user without a
+-- family yet). security_invoker keeps the underlying tables' RLS in force.
+CREATE OR REPLACE VIEW sender_directory WITH (security_invoker = true) AS
+SELECT
+  lower(COALESCE(u.email, fm.email)) AS email,
+  u.id AS user_id,
+  fm.family_id,
+  fm.role
+FROM users u
+FULL OUTER JOIN family_members fm ON lower(fm.email) = lower(u.email);
+
+-- Cold lookup for one batch of addresses (lowercased by the caller or here)
+CREATE OR REPLACE FUNCTION resolve_senders(emails TEXT[])
+RETURNS TABLE (email TEXT, user_id UUID, family_id UUID, role TEXT) AS $$
+  SELECT DISTINCT ON (e.email) e.email, u.id, fm.family_id, fm.role
+  FROM (SELECT DISTINCT lower(trim(x)) AS email FROM unnest(emails) AS x) e
+  LEFT JOIN users u ON lower(u.email) = e.email
+  LEFT JOIN family_members fm ON lower(fm.email) = e.email
+  WHERE u.id IS NOT NULL OR fm.family_id IS NOT NULL
+  ORDER BY e.email, u.id NULLS LAST;
+$$ LANGUAGE sql STABLE;
+
+-- Tell listening resolvers to reload when addresses or memberships change
+CREATE OR REPLACE FUNCTION notify_sender_directory()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_notify('sender_directory', TG_TABLE_NAME);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_sender_directory_notify ON users;
+CREATE TRIGGER users_sender_directory_notify
+  AFTER INSERT OR DELETE OR UPDATE OF email ON users
+  FOR EACH STATEMENT EXECUTE FUNCTION notify_sender_directory();
+
+DROP TRIGGER IF EXISTS family_members_sender_directory_notify ON family_members;
+CREATE TRIGGER family_members_sender_directory_notify
+  AFTER INSERT OR DELETE OR UPDATE OF email, family_id, role ON family_members
+  FOR EACH STATEMENT EXECUTE FUNCTION notify_sender_directory();
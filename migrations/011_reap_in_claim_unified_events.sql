@@ -0,0 +1,49 @@
+-- Migration: Expire out-of-attempts leases inside claim_unified_events()
+-- Purpose: A row whose processor run keeps failing is claimed max_attempts
+-- times and then sat in 'processing' forever: only event_queue.py's reap()
+-- moved it to 'error', and a deployment that only runs the n8n cron never
+-- calls that. Every claim now reaps first, in the same statement.
+--
+-- Reaped rows have attempts >= max_attempts and claimed rows fewer, so the
+-- two updates never touch the same row.
+
+CREATE OR REPLACE FUNCTION claim_unified_events(
+  worker TEXT,
+  batch_size INTEGER DEFAULT 10,
+  lease_seconds INTEGER DEFAULT 300,
+  max_attempts INTEGER DEFAULT 3
+)
+RETURNS SETOF unified_events AS $$
+  WITH reaped AS (
+    UPDATE unified_events
+    SET processing_status = 'error',
+        locked_until = NULL,
+        locked_by = NULL,
+        last_error = COALESCE(last_error, 'lease expired')
+    WHERE id IN (
+      SELECT id FROM unified_events
+      WHERE processing_status IN ('pending', 'processing')
+        AND attempts >= max_attempts
+        AND locked_until <= NOW()
+      FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id
+  ),
+  next AS (
+    SELECT id FROM unified_events
+    WHERE processing_status IN ('pending', 'processing')
+      AND (locked_until IS NULL OR locked_until <= NOW())
+      AND attempts < max_attempts
+    ORDER BY created_at
+    LIMIT batch_size
+    FOR UPDATE SKIP LOCKED
+  )
+  UPDATE unified_events e
+  SET processing_status = 'processing',
+      locked_by = worker,
+      locked_until = NOW() + lease_seconds * INTERVAL '1 second',
+      attempts = e.attempts + 1
+  FROM next
+  WHERE e.id = next.id
+  RETURNING e.*;
+$$ LANGUAGE sql;
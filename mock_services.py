@@ -0,0 +1,681 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the services the email workers talk to.
+
+One threaded HTTP server answers:
+  - Gmail:    /gmail/v1/users/me/profile, /messages (q: after:, -from:),
+              /messages/{id} (format full/metadata/minimal), /history
+              (startHistoryId; messages delivered by add_message, 404 for
+              a historyId older than the mailbox's first) and the
+              /batch/gmail/v1 multipart endpoint; a bearer token of
+              "tok-<user id>" selects the mailbox (and the calendar below),
+              and each user gets a
+              per-second quota-unit budget (429 + Retry-After when
+              exceeded), like the real API. batch_failure_rate makes that
+              fraction of batch parts answer 503.
+  - Calendar: /calendar/v3/calendars/primary/events (q, timeMin/timeMax,
+              maxResults, orderBy=startTime; POST inserts) and /events/{id}
+              (GET, PATCH, DELETE), plus the /batch/calendar/v3 multipart
+              endpoint; `calendar` seeds that many events per user
+  - Supabase: /rest/v1/<table> with PostgREST eq/neq/in/ilike/gt/lt
+              filters, select, order, limit/offset, POST (on_conflict +
+              Prefer resolution) and PATCH; writes to family_facts bump
+              family_facts_versions like the migration 007 triggers, and
+              sender_directory / rpc/resolve_senders follow migration 010
+  - Tokens:   /api/auth/tokens?userId=...&provider=google (the bippity.boo
+              route n8n calls; tokens expire after token_lifetime seconds
+              and are refreshed on demand once expired) and POST
+              /api/auth/refresh-tokens?hoursBeforeExpiry=N[&userId=...]
+  - OpenAI:   /v1/chat/completions, answering after llm_latency seconds
+              with a canned reply and usage counted from the prompt size
+
+Usage:
+  python3 mock_services.py [--port 8787] [--users 300] [--messages 5]
+                           [--latency 0.05] [--expired 3] [--llm-latency 1.5]
+                           [--facts 4] [--members 2] [--calendar 5]
+  # then point SUPABASE_URL / GMAIL_URL / BIPPITY_URL at http://127.0.0.1:8787
+
+In-process:
+  with MockServices(users=50) as mock:
+      ...  # mock.url, mock.tables, mock.calendars, mock.add_message(user_id), mock.counts
+"""
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Gmail API quota units per method
+GMAIL_UNITS = {'profile': 1, 'list': 5, 'get': 5, 'history': 2}
+FIRST_HISTORY_ID = 1000
+
+# PostgREST upsert keys per table
+CONFLICT_KEYS = {
+    'unified_events': ('user_id', 'channel', 'source_id'),
+    'family_facts_versions': ('user_id',),
+}
+
+SENDERS = [
+    'Lincoln Elementary <office@lincoln-elementary.org>',
+    'Coach Rivera <coach@cityyouthsoccer.org>',
+    'Dr. Patel <appointments@kidsdental.com>',
+    'PTA <pta@lincoln-elementary.org>',
+    'Deals <promo@marketing.com>',
+]
+FACTS = [
+    ('child', 'Emma', 'Emma is in 3rd grade at Lincoln Elementary.'),
+    ('activity', 'Emma', 'Emma plays soccer with City Youth Soccer on Tuesdays and Thursdays.'),
+    ('child', 'Noah', 'Noah is 5 and goes to Sunshine Preschool.'),
+    ('health', 'Noah', 'Noah sees Dr. Patel at Kids Dental every six months.'),
+    ('school', 'Lincoln Elementary', 'Ms. Alvarez is Emma\'s teacher.'),
+    ('activity', 'Noah', 'Noah has swim lessons on Saturday mornings.'),
+]
+CALENDAR_EVENTS = [
+    ('Emma soccer practice', 'City Youth Soccer field', 17),
+    ('Noah swim lesson', 'Community Pool', 9),
+    ('Lincoln Elementary PTA meeting', 'Lincoln Elementary library', 18),
+    ('Noah dental checkup', 'Kids Dental', 10),
+    ('Emma piano recital', 'Lincoln Elementary auditorium', 19),
+    ('Bake sale', 'Lincoln Elementary gym', 8),
+]
+SUBJECTS = [
+    'Field trip permission slip due Friday',
+    'Practice moved to Thursday 5pm',
+    'Appointment reminder',
+    'Bake sale volunteers needed',
+    '50% off everything this weekend',
+]
+
+
+def _b64url(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def make_message(rng, received):
+    """A Gmail API `format=full` message"""
+    sender = rng.choice(SENDERS)
+    subject = rng.choice(SUBJECTS)
+    text = f"Hi,\n\n{subject}. Please reply by the end of the week.\n\nThanks!"
+    message_id = f"{rng.getrandbits(64):016x}"
+    return {
+        'id': message_id,
+        'threadId': message_id,
+        'labelIds': ['INBOX', 'CATEGORY_PERSONAL'],
+        'snippet': text[:100].replace('\n', ' '),
+        'internalDate': str(int(received.timestamp() * 1000)),
+        'payload': {
+            'mimeType': 'multipart/alternative',
+            'headers': [
+                {'name': 'From', 'value': sender},
+                {'name': 'To', 'value': 'parent@example.com'},
+                {'name': 'Subject', 'value': subject},
+                {'name': 'Date', 'value': format_datetime(received)},
+            ],
+            'parts': [
+                {'mimeType': 'text/plain', 'body': {'data': _b64url(text)}},
+                {'mimeType': 'text/html', 'body': {'data': _b64url(f"<p>{text}</p>")}},
+            ],
+        },
+    }
+
+
+def _matches(row, column, expr):
+    op, _, value = expr.partition('.')
+    actual = row.get(column)
+    actual_text = 'null' if actual is None else str(actual).lower() if isinstance(actual, bool) else str(actual)
+    if op == 'eq':
+        return actual_text == value
+    if op == 'neq':
+        return actual_text != value
+    if op == 'in':
+        return actual_text in value.strip('()').split(',')
+    if op == 'ilike':
+        # % and _ are wildcards, as in SQL (PostgREST also accepts * for %)
+        pattern = ''.join('.*' if c in '%*' else '.' if c == '_' else re.escape(c) for c in value)
+        return actual is not None and re.fullmatch(pattern, actual_text, re.IGNORECASE | re.DOTALL) is not None
+    if op == 'is':
+        return actual_text == value
+    if op in ('gt', 'lt', 'gte', 'lte'):
+        if actual is None:
+            return False
+        try:
+            a, b = float(actual), float(value)
+        except ValueError:
+            a, b = actual_text, value
+        return {'gt': a > b, 'lt': a < b, 'gte': a >= b, 'lte': a <= b}[op]
+    raise ValueError(f"unsupported filter {expr}")
+
+
+def _event_time(value):
+    """Comparable UTC datetime for an RFC 3339 string or an event's start/end ({dateTime} or {date})"""
+    if isinstance(value, dict):
+        value = value.get('dateTime') or value.get('date')
+    if not value:
+        return None
+    when = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return when if when.tzinfo else when.replace(tzinfo=timezone.utc)
+
+
+class MockServices:
+    """Threaded HTTP server holding in-memory Gmail mailboxes and tables"""
+
+    def __init__(self, users=10, messages=5, latency=0.0, user_quota=250, expired=0, seed=0, port=0,
+                 batch_failure_rate=0.0, llm_latency=0.0, token_lifetime=3600, facts=0, members=0, calendar=0):
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.batch_failure_rate = batch_failure_rate
+        self.llm_latency = llm_latency
+        self.token_lifetime = token_lifetime
+        self.user_quota = user_quota
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.usage = defaultdict(deque)
+        self.tables = defaultdict(list)
+        self.mailboxes = {}
+        self.calendars = {}
+        self.history = {}
+        self.history_log = defaultdict(list)
+        self.tokens = {}
+        self.token_expiry = {}
+        # Called with (user_id, version) after each family_facts version bump (stands in for NOTIFY)
+        self.version_listeners = []
+
+        now = datetime.now(timezone.utc)
+        for i in range(users):
+            user_id = f"00000000-0000-4000-8000-{i:012d}"
+            self.tables['users'].append({'id': user_id, 'email': f"parent{i}@example.com", 'status': 'active'})
+            self.tables['connected_services'].append({
+                'user_id': user_id, 'service_name': 'google', 'last_sync_at': None, 'consecutive_failures': 0,
+            })
+            self.tokens[user_id] = i >= users - expired
+            self.token_expiry[user_id] = time.time() + token_lifetime
+            self.mailboxes[user_id] = []
+            self.history[user_id] = FIRST_HISTORY_ID
+            for m in reversed(range(messages)):
+                self.mailboxes[user_id].append(make_message(self.rng, now.replace(microsecond=0) - timedelta(hours=m)))
+            self.calendars[user_id] = {}
+            for e in range(calendar):
+                summary, location, hour = CALENDAR_EVENTS[e % len(CALENDAR_EVENTS)]
+                start = (now + timedelta(days=e + 1)).replace(hour=hour, minute=0, second=0, microsecond=0)
+                self.add_event(user_id, {
+                    'summary': summary, 'location': location,
+                    'start': {'dateTime': start.isoformat(), 'timeZone': 'America/Los_Angeles'},
+                    'end': {'dateTime': (start + timedelta(hours=1)).isoformat(), 'timeZone': 'America/Los_Angeles'},
+                })
+            for fact_type, subject, fact_text in FACTS[:facts]:
+                self.tables['family_facts'].append({
+                    'id': f"family_facts-{len(self.tables['family_facts']) + 1}", 'user_id': user_id,
+                    'fact_type': fact_type, 'subject': subject, 'fact_text': fact_text,
+                })
+            if facts:
+                self.tables['family_facts_versions'].append({'user_id': user_id, 'version': 1})
+            if members:
+                # The user plus members - 1 relatives without an account
+                family_id = f"10000000-0000-4000-8000-{i:012d}"
+                self.tables['families'].append({'id': family_id, 'name': f"Parent{i} Family"})
+                for m in range(members):
+                    self.tables['family_members'].append({
+                        'id': f"family_members-{len(self.tables['family_members']) + 1}", 'family_id': family_id,
+                        'email': f"parent{i}@example.com" if m == 0 else f"relative{i}.{m}@example.com",
+                        'role': 'owner' if m == 0 else 'member',
+                    })
+        self.tables['blacklisted_domains'].append({
+            'user_id': self.tables['users'][0]['id'] if users else None, 'domain': 'marketing.com', 'is_active': True,
+        })
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_message(self, user_id, received=None):
+        """Deliver a new message to a mailbox (bumps its historyId)"""
+        with self.lock:
+            message = make_message(self.rng, received or datetime.now(timezone.utc))
+            self.mailboxes[user_id].append(message)
+            self.history[user_id] += 1
+            self.history_log[user_id].append((self.history[user_id], message))
+            return message
+
+    def add_event(self, user_id, body):
+        """Insert a calendar event the way events.insert does; returns the stored event"""
+        event_id = f"{self.rng.getrandbits(64):016x}"
+        stamp = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+        event = {'kind': 'calendar#event', 'id': event_id, 'status': 'confirmed',
+                 'htmlLink': f"https://www.google.com/calendar/event?eid={event_id}",
+                 'created': stamp, 'updated': stamp, **body}
+        self.calendars[user_id][event_id] = event
+        return event
+
+    def sender_directory(self):
+        """Migration 010's sender_directory view: users full-joined to family_members on lower(email)"""
+        users = {u['email'].lower(): u for u in self.tables['users'] if u.get('email')}
+        members = {m['email'].lower(): m for m in self.tables['family_members'] if m.get('email')}
+        return [{'email': email, 'user_id': users.get(email, {}).get('id'),
+                 'family_id': members.get(email, {}).get('family_id'), 'role': members.get(email, {}).get('role')}
+                for email in sorted(users.keys() | members.keys())]
+
+    def _bump_versions(self, rows):
+        """Migration 007's triggers: one version bump per user touched by a family_facts write (lock held)"""
+        versions = {r['user_id']: r for r in self.tables['family_facts_versions']}
+        bumped = []
+        for user_id in dict.fromkeys(r.get('user_id') for r in rows):
+            if user_id is None:
+                continue
+            row = versions.get(user_id)
+            if row is None:
+                row = versions[user_id] = {'user_id': user_id, 'version': 0}
+                self.tables['family_facts_versions'].append(row)
+            row['version'] += 1
+            bumped.append((user_id, row['version']))
+        for listener in self.version_listeners:
+            for user_id, version in bumped:
+                listener(user_id, version)
+
+    def charge(self, user_id, units):
+        """Record quota use; returns seconds to wait if over budget, else None"""
+        with self.lock:
+            now = time.monotonic()
+            window = self.usage[user_id]
+            while window and window[0][0] <= now - 1:
+                window.popleft()
+            used = sum(u for _, u in window)
+            if used + units > self.user_quota:
+                return 1
+            window.append((now, units))
+            return None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Otherwise every keep-alive response waits out delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def _send(self, status, body=None, headers=None):
+        data = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _dispatch(self, method):
+        if self.mock.latency:
+            time.sleep(self.mock.latency)
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        params = {k: v[-1] for k, v in query.items()}
+        raw = self._body() if method in ('POST', 'PATCH') else b''
+        try:
+            if url.path.startswith('/gmail/v1/users/me/'):
+                self._send(*self._gmail(self._gmail_user(self.headers), url.path[len('/gmail/v1/users/me/'):], query))
+            elif url.path.startswith('/calendar/v3/calendars/primary/events'):
+                self._send(*self._calendar(self._gmail_user(self.headers), method,
+                                           url.path[len('/calendar/v3/calendars/primary/events'):], query,
+                                           json.loads(raw) if raw else None))
+            elif url.path in ('/batch/gmail/v1', '/batch/calendar/v3'):
+                self._batch(raw, url.path.split('/')[2])
+            elif url.path.startswith('/rest/v1/'):
+                self._rest(method, url.path[len('/rest/v1/'):], params, json.loads(raw) if raw else None)
+            elif url.path == '/api/auth/tokens':
+                self._token(params)
+            elif url.path == '/api/auth/refresh-tokens' and method == 'POST':
+                self._refresh_tokens(params)
+            elif url.path == '/v1/chat/completions' and method == 'POST':
+                self._send(200, self._chat(json.loads(raw)))
+            else:
+                self._send(404, {'error': 'not found'})
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _token(self, params):
+        user_id = params.get('userId')
+        self.mock.counts['tokens'] += 1
+        if user_id not in self.mock.tokens:
+            return self._send(404, {'error': 'OAuth tokens not found for this user. Please complete OAuth setup.'})
+        if self.mock.tokens[user_id]:
+            return self._send(200, {'error': 'Token expired and refresh failed. Please re-authenticate.',
+                                    'is_expired': True})
+        with self.mock.lock:
+            if self.mock.token_expiry[user_id] <= time.time():
+                self.mock.token_expiry[user_id] = time.time() + self.mock.token_lifetime
+            expires_at = datetime.fromtimestamp(self.mock.token_expiry[user_id], timezone.utc).isoformat()
+        return self._send(200, {'provider': 'google', 'access_token': f"tok-{user_id}", 'expires_at': expires_at,
+                                'is_expired': False})
+
+    def _refresh_tokens(self, params):
+        self.mock.counts['refresh'] += 1
+        threshold = time.time() + int(params.get('hoursBeforeExpiry', 24)) * 3600
+        only = params.get('userId')
+        refreshed = failed = 0
+        with self.mock.lock:
+            for user_id, expiry in self.mock.token_expiry.items():
+                if expiry > threshold or (only and user_id != only):
+                    continue
+                if self.mock.tokens[user_id]:
+                    failed += 1
+                else:
+                    self.mock.token_expiry[user_id] = time.time() + self.mock.token_lifetime
+                    refreshed += 1
+        return self._send(200, {'success': True, 'message': f"Refreshed {refreshed} tokens, {failed} failed",
+                                'refreshed': refreshed, 'failed': failed, 'total': refreshed + failed})
+
+    def _chat(self, request):
+        self.mock.counts['openai.chat'] += 1
+        if self.mock.llm_latency:
+            time.sleep(self.mock.llm_latency)
+        prompt_tokens = len(json.dumps(request.get('messages', []))) // 4
+        content = json.dumps({'entities': [], 'messages': len(request.get('messages', []))})
+        return {
+            'id': f"chatcmpl-mock{self.mock.counts['openai.chat']}", 'object': 'chat.completion',
+            'created': int(time.time()), 'model': request.get('model', 'gpt-4o'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                         'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': 12,
+                      'total_tokens': prompt_tokens + 12},
+        }
+
+    def _gmail_user(self, headers):
+        auth = headers.get('Authorization', '')
+        user_id = auth[len('Bearer tok-'):] if auth.startswith('Bearer tok-') else None
+        return user_id if user_id in self.mock.mailboxes else None
+
+    def _gmail(self, user_id, path, query):
+        """Answer one Gmail API call; returns (status, body, headers)"""
+        if user_id is None:
+            return 401, {'error': {'code': 401, 'message': 'Invalid Credentials'}}, None
+        params = {k: v[-1] for k, v in query.items()}
+        kind = {'profile': 'profile', 'messages': 'list', 'history': 'history'}.get(path, 'get')
+        wait = self.mock.charge(user_id, GMAIL_UNITS[kind])
+        self.mock.counts[f"gmail.{kind}"] += 1
+        if wait:
+            self.mock.counts['gmail.429'] += 1
+            return 429, {'error': {'code': 429, 'message': 'User-rate limit exceeded'}}, {'Retry-After': str(wait)}
+        mailbox = self.mock.mailboxes[user_id]
+
+        if kind == 'profile':
+            return 200, {'emailAddress': f"{user_id}@example.com", 'messagesTotal': len(mailbox),
+                         'historyId': str(self.mock.history[user_id])}, None
+        if kind == 'history':
+            start = int(params.get('startHistoryId') or 0)
+            if start < FIRST_HISTORY_ID:
+                return 404, {'error': {'code': 404, 'message': 'Requested entity was not found.'}}, None
+            offset = int(params.get('pageToken') or 0)
+            page_size = int(params.get('maxResults', 100))
+            records = [(h, m) for h, m in self.mock.history_log[user_id] if h > start]
+            page = records[offset:offset + page_size]
+            body = {'historyId': str(self.mock.history[user_id])}
+            if page:
+                body['history'] = [{
+                    'id': str(h),
+                    'messages': [{'id': m['id'], 'threadId': m['threadId']}],
+                    'messagesAdded': [{'message': {'id': m['id'], 'threadId': m['threadId'],
+                                                   'labelIds': m['labelIds']}}],
+                } for h, m in page]
+            if offset + page_size < len(records):
+                body['nextPageToken'] = str(offset + page_size)
+            return 200, body, None
+        if kind == 'list':
+            after, excluded = 0, []
+            for term in params.get('q', '').split():
+                if term.startswith('after:'):
+                    after = int(term[len('after:'):]) * 1000
+                elif term.startswith('-from:'):
+                    excluded.append(term[len('-from:'):].lower())
+            found = []
+            for message in reversed(mailbox):
+                sender = next(h['value'] for h in message['payload']['headers'] if h['name'] == 'From').lower()
+                if int(message['internalDate']) > after and not any(x in sender for x in excluded):
+                    found.append({'id': message['id'], 'threadId': message['threadId']})
+            found = found[:int(params.get('maxResults', 100))]
+            return 200, ({'messages': found, 'resultSizeEstimate': len(found)} if found
+                         else {'resultSizeEstimate': 0}), None
+
+        message_id = path[len('messages/'):]
+        message = next((m for m in mailbox if m['id'] == message_id), None)
+        if message is None:
+            return 404, {'error': {'code': 404, 'message': 'Requested entity was not found.'}}, None
+        fmt = params.get('format', 'full')
+        if fmt == 'minimal':
+            message = {k: v for k, v in message.items() if k != 'payload'}
+        elif fmt == 'metadata':
+            wanted = {h.lower() for h in query.get('metadataHeaders', [])}
+            headers = [h for h in message['payload']['headers'] if not wanted or h['name'].lower() in wanted]
+            message = {**message, 'payload': {'mimeType': message['payload']['mimeType'], 'headers': headers}}
+        return 200, message, None
+
+    def _calendar(self, user_id, method, path, query, body):
+        """Answer one Calendar events call; returns (status, body, headers)"""
+        if user_id is None:
+            return 401, {'error': {'code': 401, 'message': 'Invalid Credentials'}}, None
+        params = {k: v[-1] for k, v in query.items()}
+        event_id = path.strip('/')
+        kind = {'GET': 'get', 'PATCH': 'patch', 'DELETE': 'delete'}.get(method) if event_id else \
+            {'GET': 'list', 'POST': 'insert'}.get(method)
+        if kind is None:
+            return 405, {'error': {'code': 405, 'message': 'Method Not Allowed'}}, None
+        self.mock.counts[f"calendar.{kind}"] += 1
+
+        with self.mock.lock:
+            events = self.mock.calendars[user_id]
+            if kind == 'list':
+                text = params.get('q', '').lower()
+                low, high = _event_time(params.get('timeMin')), _event_time(params.get('timeMax'))
+                found = [e for e in events.values()
+                         if text in ' '.join(str(e.get(k) or '') for k in ('summary', 'description', 'location')).lower()
+                         and (low is None or _event_time(e['end']) > low)
+                         and (high is None or _event_time(e['start']) < high)]
+                if params.get('orderBy') == 'startTime':
+                    found.sort(key=lambda e: _event_time(e['start']))
+                return 200, {'kind': 'calendar#events', 'items': found[:int(params.get('maxResults', 250))]}, None
+            if kind == 'insert':
+                try:
+                    start, end = _event_time((body or {}).get('start')), _event_time((body or {}).get('end'))
+                except ValueError:
+                    start = end = None
+                if start is None or end is None:
+                    return 400, {'error': {'code': 400, 'message': 'Missing end time.' if start else
+                                           'Start and end times must either both be date or both be dateTime.'}}, None
+                return 200, self.mock.add_event(user_id, body), None
+            event = events.get(event_id)
+            if event is None:
+                return 404, {'error': {'code': 404, 'message': 'Not Found'}}, None
+            if kind == 'delete':
+                del events[event_id]
+                return 204, None, None
+            if kind == 'patch':
+                event.update(body or {})
+                event['updated'] = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+            return 200, dict(event), None
+
+    def _batch(self, raw, api='gmail'):
+        """multipart/mixed batch of Gmail or Calendar calls, answered part by part"""
+        content_type = self.headers.get('Content-Type', '')
+        boundary = content_type.partition('boundary=')[2].strip('"')
+        if not content_type.startswith('multipart/mixed') or not boundary:
+            raise ValueError('batch requests must be multipart/mixed with a boundary')
+        parts = [p for p in raw.decode('utf-8').split(f"--{boundary}")[1:] if not p.startswith('--')]
+        if len(parts) > 100:
+            raise ValueError('too many requests in batch (max 100)')
+        self.mock.counts[f"{api}.batch"] += 1
+
+        out_boundary = f"batch_{self.mock.rng.getrandbits(48):012x}"
+        chunks = []
+        for part in parts:
+            part_headers, _, inner = part.strip('\r\n').partition('\r\n\r\n')
+            content_id = next((line.split(':', 1)[1].strip() for line in part_headers.split('\r\n')
+                               if line.lower().startswith('content-id:')), '')
+            request_line, _, inner_rest = inner.partition('\r\n')
+            inner_head, _, inner_body = inner_rest.partition('\r\n\r\n')
+            inner_headers = dict(line.split(': ', 1) for line in inner_head.split('\r\n') if ': ' in line)
+            method, target = request_line.split()[:2]
+            url = urlsplit(target)
+            if self.mock.rng.random() < self.mock.batch_failure_rate:
+                status, body, headers = 503, {'error': {'code': 503, 'message': 'Backend Error'}}, None
+            else:
+                user_id = self._gmail_user({**dict(self.headers), **inner_headers})
+                if api == 'calendar':
+                    status, body, headers = self._calendar(
+                        user_id, method, url.path[len('/calendar/v3/calendars/primary/events'):],
+                        parse_qs(url.query), json.loads(inner_body) if inner_body.strip() else None)
+                else:
+                    status, body, headers = self._gmail(user_id, url.path[len('/gmail/v1/users/me/'):],
+                                                        parse_qs(url.query))
+            payload = json.dumps(body)
+            extra = ''.join(f"{k}: {v}\r\n" for k, v in (headers or {}).items())
+            chunks.append(
+                f"--{out_boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id.strip('<>')}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n{extra}"
+                f"Content-Length: {len(payload.encode('utf-8'))}\r\n\r\n{payload}\r\n"
+            )
+        data = (''.join(chunks) + f"--{out_boundary}--\r\n").encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', f"multipart/mixed; boundary={out_boundary}")
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _rest(self, method, table, params, body):
+        self.mock.counts[f"rest.{method.lower()}.{table}"] += 1
+        select = params.pop('select', None)
+        order = params.pop('order', None)
+        limit = params.pop('limit', None)
+        offset = params.pop('offset', None)
+        on_conflict = params.pop('on_conflict', None)
+        rows = self.mock.tables[table]
+
+        with self.mock.lock:
+            if table == 'rpc/resolve_senders':
+                wanted = {e.strip().lower() for e in (body or {}).get('emails') or []}
+                return self._send(200, [r for r in self.mock.sender_directory() if r['email'] in wanted])
+            if table == 'sender_directory':
+                rows = self.mock.sender_directory()
+            if method == 'POST':
+                new_rows = body if isinstance(body, list) else [body]
+                keys = tuple(on_conflict.split(',')) if on_conflict else CONFLICT_KEYS.get(table)
+                prefer = self.headers.get('Prefer', '')
+                existing = {tuple(r.get(k) for k in keys): r for r in rows} if keys else {}
+                inserted = []
+                for row in new_rows:
+                    key = tuple(row.get(k) for k in keys) if keys else None
+                    if key in existing:
+                        if 'merge-duplicates' in prefer:
+                            existing[key].update(row)
+                        elif 'ignore-duplicates' not in prefer:
+                            return self._send(409, {'code': '23505', 'message': 'duplicate key value'})
+                        continue
+                    row = {'id': f"{table}-{len(rows) + 1}", **row}
+                    rows.append(row)
+                    inserted.append(row)
+                    if key:
+                        existing[key] = row
+                if table == 'family_facts':
+                    self.mock._bump_versions(new_rows)
+                return self._send(201, inserted if 'return=representation' in prefer else None)
+
+            matched = [r for r in rows if all(_matches(r, col, expr) for col, expr in params.items())]
+            if method == 'PATCH':
+                before = [dict(row) for row in matched]
+                for row in matched:
+                    row.update(body or {})
+                if table == 'family_facts' and matched:
+                    self.mock._bump_versions(before + matched)
+                if 'return=representation' in self.headers.get('Prefer', ''):
+                    return self._send(200, matched)
+                return self._send(204)
+
+            if order:
+                column, _, direction = order.partition('.')
+                matched = sorted(matched, key=lambda r: (r.get(column) is None, r.get(column) or ''),
+                                 reverse=direction.startswith('desc'))
+            if offset:
+                matched = matched[int(offset):]
+            if limit:
+                matched = matched[:int(limit)]
+            if select and select != '*':
+                columns = select.split(',')
+                matched = [{c: r.get(c) for c in columns} for r in matched]
+            return self._send(200, matched)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local Gmail / Supabase / token API stand-in')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=5, help='messages per mailbox')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--user-quota', type=int, default=250, help='Gmail quota units per user per second')
+    parser.add_argument('--expired', type=int, default=0, help='users whose token refresh fails')
+    parser.add_argument('--llm-latency', type=float, default=0.0, help='seconds per chat completion')
+    parser.add_argument('--facts', type=int, default=0, help=f"family_facts rows per user (max {len(FACTS)})")
+    parser.add_argument('--members', type=int, default=0, help='family_members per user (the user plus relatives)')
+    parser.add_argument('--calendar', type=int, default=0, help='calendar events per user')
+    args = parser.parse_args(argv)
+
+    mock = MockServices(args.users, args.messages, args.latency, args.user_quota, args.expired, port=args.port,
+                        llm_latency=args.llm_latency, facts=args.facts, members=args.members, calendar=args.calendar)
+    print(f"Serving {args.users} mailboxes on {mock.url}")
+    print(f"  export SUPABASE_URL={mock.url} GMAIL_URL={mock.url} BIPPITY_URL={mock.url} CALENDAR_URL={mock.url}")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
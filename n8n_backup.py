@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Backup n8n workflows through the n8n REST API.
+
+Lists workflows page by page from /api/v1/workflows and fetches the full
+workflow bodies concurrently over a pool of keep-alive connections. All
+requests share a token-bucket rate limiter, and a 429/503 with Retry-After
+pauses the whole bucket rather than just the request that hit it.
+
+Usage:
+  N8N_API_KEY=... python3 n8n_backup.py [--url URL] [--out workflows]
+                                        [--workers 8] [--rate 10]
+                                        [--incremental] [--snapshot]
+                                        [--ids ID[:FILENAME] ...]
+
+With --incremental, workflows/.workflow_list_backup.json doubles as a
+manifest of each workflow's last-seen updatedAt and canonical-JSON SHA-256.
+Only workflows whose updatedAt moved are fetched, and only those whose
+content hash changed are rewritten, so a run with no changes costs one
+list call.
+
+With --snapshot, every written workflow is also recorded in the
+deduplicated snapshot store (see workflow_store.py) for point-in-time
+restore.
+
+Point --url (or N8N_URL) at a local stub server to test without n8n cloud.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from http_pool import HttpError, JsonClient, TokenBucket
+from workflow_graph import WorkflowGraph
+from workflow_io import WORKFLOWS_DIR, WorkflowWriter
+from workflow_store import WorkflowStore
+
+DEFAULT_URL = 'https://chungxchung.app.n8n.cloud'
+PAGE_SIZE = 100
+
+
+class N8nApiError(HttpError):
+    """Raised when the n8n API returns a non-retryable error"""
+
+
+class N8nClient:
+    """Minimal n8n public API client over a rate-limited JsonClient"""
+
+    def __init__(self, base_url, api_key, workers=8, rate=10, max_retries=5):
+        self.workers = workers
+        self.client = JsonClient(base_url, headers={'X-N8N-API-KEY': api_key}, size=workers,
+                                 bucket=TokenBucket(rate), max_retries=max_retries)
+
+    @property
+    def stats(self):
+        return self.client.stats
+
+    def get_json(self, path, params=None):
+        try:
+            return self.client.get(path, params)
+        except HttpError as e:
+            raise N8nApiError(e.status, e.message) from None
+
+    def list_workflows(self, limit=PAGE_SIZE):
+        """Yield workflow summaries from every page of /api/v1/workflows"""
+        cursor = None
+        while True:
+            params = {'limit': limit}
+            if cursor:
+                params['cursor'] = cursor
+            page = self.get_json('/api/v1/workflows', params)
+            yield from page.get('data', [])
+            cursor = page.get('nextCursor')
+            if not cursor:
+                return
+
+    def get_workflow(self, workflow_id):
+        return self.get_json(f'/api/v1/workflows/{workflow_id}')
+
+    def fetch_workflows(self, workflow_ids):
+        """Fetch full workflows concurrently, yielding (id, workflow, error)"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.get_workflow, wid): wid for wid in workflow_ids}
+            for future in as_completed(futures):
+                wid = futures[future]
+                try:
+                    yield wid, future.result(), None
+                except (N8nApiError, ValueError) as e:
+                    yield wid, None, e
+
+    def close(self):
+        self.client.close()
+
+
+def run_backup(client, workflows_dir, workflow_ids=None, filenames=None, incremental=False,
+               store=None):
+    """Fetch and save workflows, returning a stats dict for the run"""
+    writer = WorkflowWriter(workflows_dir, store=store, graph=WorkflowGraph(workflows_dir))
+    index = writer.index
+    filenames = filenames or {}
+    started = time.monotonic()
+
+    summaries = {}
+    if workflow_ids is None or incremental:
+        summaries = {wf['id']: wf for wf in client.list_workflows()}
+    if workflow_ids is None:
+        workflow_ids = list(summaries)
+        # A full listing is authoritative: drop workflows deleted upstream
+        for filename in index.retain(workflow_ids):
+            writer.graph.remove(filename)
+
+    to_fetch = []
+    for wid in workflow_ids:
+        summary = summaries.get(wid)
+        if incremental and summary and index.is_unchanged(summary):
+            # Same updatedAt: only refresh the listing fields (name, active)
+            index.update_summary(summary)
+        else:
+            to_fetch.append(wid)
+
+    fetched, rewritten, failed = 0, 0, []
+    for wid, workflow, error in client.fetch_workflows(to_fetch):
+        if error:
+            failed.append((wid, str(error)))
+            print(f"❌ Failed: {wid}: {error}", file=sys.stderr)
+            continue
+        fetched += 1
+        path, written = writer.save(workflow, filename=filenames.get(wid), force=not incremental)
+        if not written:
+            # Same content under a new updatedAt: record it so the next run skips the GET.
+            # Failed fetches keep their old updatedAt and are retried next run.
+            index.update_summary(workflow)
+        if written:
+            rewritten += 1
+            print(f"Saved: {workflow.get('name', 'unknown')} (ID: {wid}) -> {path.name}")
+
+    writer.close()
+
+    elapsed = time.monotonic() - started
+    stats = dict(client.stats)
+    stats.update({
+        'listed': len(summaries),
+        'unchanged': len(workflow_ids) - len(to_fetch),
+        'fetched': fetched,
+        'written': rewritten,
+        'failed': failed,
+        'elapsed': elapsed,
+        'workflows_per_sec': fetched / elapsed if elapsed else 0.0,
+    })
+    return stats
+
+
+def print_report(stats):
+    kb = stats['bytes'] / 1024
+    print(f"\n✅ Backup complete: {stats['fetched']} fetched, {stats['written']} written, "
+          f"{stats['unchanged']} unchanged, {len(stats['failed'])} failed")
+    print(f"   {stats['elapsed']:.2f}s, {stats['workflows_per_sec']:.1f} workflows fetched/s, "
+          f"{kb / stats['elapsed'] if stats['elapsed'] else 0:.0f} KB/s")
+    print(f"   {stats['requests']} requests, {stats['retries']} retries")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backup n8n workflows via the REST API')
+    parser.add_argument('--url', default=os.environ.get('N8N_URL', DEFAULT_URL))
+    parser.add_argument('--out', default=str(WORKFLOWS_DIR))
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=10, help='max requests per second')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only fetch/write workflows changed since the last run')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='also record written workflows in the snapshot store')
+    parser.add_argument('--ids', nargs='*', help='workflow IDs (optionally ID:FILENAME) instead of listing all')
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get('N8N_API_KEY')
+    if not api_key:
+        print("Error: N8N_API_KEY is not set", file=sys.stderr)
+        sys.exit(1)
+
+    workflow_ids, filenames = None, {}
+    if args.ids:
+        workflow_ids = []
+        for item in args.ids:
+            wid, _, filename = item.partition(':')
+            workflow_ids.append(wid)
+            if filename:
+                filenames[wid] = filename
+
+    client = N8nClient(args.url, api_key, workers=args.workers, rate=args.rate)
+    try:
+        store = WorkflowStore(Path(args.out) / '.store') if args.snapshot else None
+        stats = run_backup(client, args.out, workflow_ids, filenames, args.incremental, store)
+    except N8nApiError as e:
+        print(f"Error listing workflows: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        client.close()
+
+    print_report(stats)
+    if stats['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Token-budget prompt packer for the onboarding extraction agent.
+
+Onboarding sends every email that survives "Filter Out Blank Emails" to
+the "Extraction System" agent in its own GPT-4o call, with the full body
+and the full system prompt each time, and nothing bounds how big one call
+gets. PromptPacker.pack() turns a user's emails into as few calls as fit a
+per-call token budget:
+
+  - emails with under MIN_CHARS of text (the node's 50) are dropped, and
+    so are near-duplicates: >= DUPLICATE_THRESHOLD Jaccard overlap of
+    4-word shingles (over the first 1000 words) with a higher-priority
+    email
+  - each email is truncated to a token cap that shrinks with its priority
+    rank (by `score` from "Filter and Score Emails"): the top email keeps
+    up to max_email_tokens, the last min_email_tokens
+  - emails are packed first-fit decreasing into calls whose system
+    prompt + instruction + emails stay under budget - reserve (the tokens
+    left for the answer); within a call they stay in priority order
+  - each call's text is one "=== Email N (id) ===" section per email, the
+    same framing "Aggregate Extractions" uses for the consolidator
+
+Tokens are counted with tiktoken's o200k_base (GPT-4o) encoding when
+tiktoken is installed, else estimated like gmail_body (4 characters per
+token). --workflow reads the system prompt and instruction from the agent
+node so the budget accounts for them.
+
+The AI Email Processor acts on one email per run (two agent stages with
+tools), so for it use max_emails=1: calls aren't merged, but blank and
+duplicate emails are still dropped and long ones truncated.
+
+Usage:
+  python3 prompt_packer.py emails.json [--budget 16000] [--workflow WORKFLOW] [--items]
+  python3 prompt_packer.py --benchmark [--users 20] [--workflow WORKFLOW]
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from collections import namedtuple
+
+from gmail_body import CHARS_PER_TOKEN, estimate_tokens
+
+# Per-call prompt budget: well under GPT-4o's 128K window, since latency
+# grows with prompt size and extraction quality drops on very long prompts
+BUDGET_TOKENS = 16000
+# Left for the model's answer
+RESERVE_TOKENS = 2000
+MAX_EMAIL_TOKENS = 3000
+MIN_EMAIL_TOKENS = 400
+MIN_CHARS = 50
+DUPLICATE_THRESHOLD = 0.85
+SHINGLE_WORDS = 4
+# Only the start of an email is compared; long newsletters get truncated anyway
+SHINGLE_LIMIT = 1000
+ENCODING = 'o200k_base'
+INSTRUCTION = 'Extract entity facts from the following emails:\n'
+DEFAULT_NODE = 'Extraction System'
+
+Call = namedtuple('Call', 'user_id ids text tokens')
+
+_WORD = re.compile(r'\w+')
+_EXPRESSION = re.compile(r'\{\{.*?\}\}\s*(?:\}\})?', re.S)
+
+
+class Tokenizer:
+    """tiktoken encoding when installed, else the 4-characters-per-token estimate"""
+
+    def __init__(self, encoding=ENCODING):
+        try:
+            import tiktoken
+            self.encoding = tiktoken.get_encoding(encoding)
+            self.name = encoding
+        except ImportError:
+            self.encoding = None
+            self.name = f"estimate ({CHARS_PER_TOKEN} chars/token)"
+
+    def count(self, text):
+        if self.encoding is None:
+            return estimate_tokens(text)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text, tokens):
+        """text cut to about `tokens` tokens, at a word boundary where possible"""
+        if self.encoding is not None:
+            encoded = self.encoding.encode(text, disallowed_special=())
+            if len(encoded) <= tokens:
+                return text
+            text = self.encoding.decode(encoded[:tokens])
+            max_chars = len(text) - 1
+        else:
+            max_chars = tokens * CHARS_PER_TOKEN
+            if len(text) <= max_chars:
+                return text
+        cut = text.rfind(' ', max_chars // 2, max_chars + 1)
+        return text[:cut if cut > 0 else max_chars].rstrip()
+
+
+def shingles(text, size=SHINGLE_WORDS, limit=SHINGLE_LIMIT):
+    """The overlapping `size`-word runs in the first `limit` words of text (lowercased)"""
+    words = _WORD.findall(text[:limit * 12].lower())[:limit]
+    if len(words) <= size:
+        return {tuple(words)}
+    return set(zip(*(words[i:] for i in range(size))))
+
+
+def email_text(email):
+    """Body text of an item from "Convert To Readable Email" or a unified_events row"""
+    text = email.get('text')
+    if text is None:
+        text = email.get('body_text')
+    return text if isinstance(text, str) else ''
+
+
+def _score(email):
+    try:
+        return float(email.get('score') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class PromptPacker:
+    """Pack emails into as few agent calls as fit the token budget"""
+
+    def __init__(self, budget=BUDGET_TOKENS, system_prompt='', instruction=INSTRUCTION,
+                 reserve=RESERVE_TOKENS, max_email_tokens=MAX_EMAIL_TOKENS,
+                 min_email_tokens=MIN_EMAIL_TOKENS, max_emails=None,
+                 duplicate_threshold=DUPLICATE_THRESHOLD, tokenizer=None):
+        self.tokenizer = tokenizer or Tokenizer()
+        self.budget = budget
+        self.instruction = instruction
+        self.overhead = self.tokenizer.count(system_prompt) + self.tokenizer.count(instruction)
+        self.available = budget - reserve - self.overhead
+        if self.available < min_email_tokens:
+            raise ValueError(f"budget {budget} leaves {self.available} tokens for emails "
+                             f"(system prompt and instruction take {self.overhead}, reserve {reserve})")
+        self.max_email_tokens = max_email_tokens
+        self.min_email_tokens = min(min_email_tokens, max_email_tokens)
+        self.max_emails = max_emails
+        self.duplicate_threshold = duplicate_threshold
+        self.stats = {'users': 0, 'emails': 0, 'blank': 0, 'duplicates': 0, 'truncated': 0,
+                      'calls': 0, 'tokens': 0}
+
+    def _header(self, number, email_id):
+        return f"=== Email {number} ({email_id}) ===\n" if email_id is not None else f"=== Email {number} ===\n"
+
+    def prepare(self, emails):
+        """Emails worth sending, highest priority first, as (email, text) pairs"""
+        candidates = []
+        for email in emails:
+            text = email_text(email).strip()
+            if len(text) < MIN_CHARS:
+                self.stats['blank'] += 1
+                continue
+            candidates.append((email, text))
+        # sorted() is stable, so equal scores keep their input order
+        candidates.sort(key=lambda pair: _score(pair[0]), reverse=True)
+
+        kept, kept_shingles = [], []
+        threshold = self.duplicate_threshold
+        for email, text in candidates:
+            current = shingles(text)
+            size = len(current)
+            duplicate = False
+            for other in kept_shingles:
+                # |A & B| / |A | B| can't reach the threshold if the sizes differ too much
+                if min(size, len(other)) < threshold * max(size, len(other)):
+                    continue
+                shared = len(current & other)
+                if shared >= threshold * (size + len(other) - shared):
+                    duplicate = True
+                    break
+            if duplicate:
+                self.stats['duplicates'] += 1
+                continue
+            kept.append((email, text))
+            kept_shingles.append(current)
+        return kept
+
+    def email_caps(self, count):
+        """Token cap per priority rank: max_email_tokens down to min_email_tokens"""
+        high = min(self.max_email_tokens, self.available)
+        low = min(self.min_email_tokens, high)
+        if count <= 1:
+            return [high]
+        step = (high - low) / (count - 1)
+        return [int(high - step * rank) for rank in range(count)]
+
+    def pack(self, emails, user_id=None):
+        """One user's emails as a list of Call(user_id, ids, text, tokens)"""
+        emails = list(emails)
+        self.stats['users'] += 1
+        self.stats['emails'] += len(emails)
+        kept = self.prepare(emails)
+        count = self.tokenizer.count
+        sections = []
+        for rank, ((email, text), cap) in enumerate(zip(kept, self.email_caps(len(kept)))):
+            email_id = email.get('id', email.get('source_id'))
+            header = self._header(rank + 1, email_id)
+            room = cap - count(header)
+            if count(text) > room:
+                text = self.tokenizer.truncate(text, room) + '\n[truncated]'
+                self.stats['truncated'] += 1
+            section = f"{header}{text}\n\n"
+            sections.append((rank, email_id, section, count(section)))
+
+        # First-fit decreasing: largest sections first, each into the first call with room
+        bins = []
+        for section in sorted(sections, key=lambda s: s[3], reverse=True):
+            for contents in bins:
+                if contents[0] + section[3] <= self.available and (
+                        self.max_emails is None or len(contents[1]) < self.max_emails):
+                    contents[0] += section[3]
+                    contents[1].append(section)
+                    break
+            else:
+                bins.append([section[3], [section]])
+
+        calls = []
+        for _, contents in sorted(bins, key=lambda b: min(s[0] for s in b[1])):
+            contents.sort()
+            text = self.instruction + ''.join(s[2] for s in contents).rstrip('\n')
+            tokens = self.overhead + sum(s[3] for s in contents)
+            calls.append(Call(user_id, [s[1] for s in contents], text, tokens))
+        self.stats['calls'] += len(calls)
+        self.stats['tokens'] += sum(c.tokens for c in calls)
+        return calls
+
+    def pack_users(self, emails):
+        """{user_id: calls} for emails carrying a user_id (None if they don't)"""
+        by_user = {}
+        for email in emails:
+            by_user.setdefault(email.get('user_id'), []).append(email)
+        return {user_id: self.pack(group, user_id) for user_id, group in by_user.items()}
+
+
+def items(calls, instruction=INSTRUCTION):
+    """n8n items for the agent node: the emails go where {{ $json.text }} reads them
+    (the node adds the instruction itself)"""
+    return [{'json': {'text': call.text[len(instruction):], 'ids': call.ids, 'user_id': call.user_id,
+                      'tokens': call.tokens}}
+            for call in calls]
+
+
+def agent_prompt(workflow_path, node_name=DEFAULT_NODE):
+    """(system prompt, instruction) of an agent node, with the {{ }} expression removed"""
+    from workflow_io import unwrap_envelope
+
+    with open(workflow_path) as f:
+        workflow = unwrap_envelope(json.load(f))
+    for node in workflow.get('nodes', []):
+        if node.get('name') == node_name:
+            params = node.get('parameters', {})
+            text = params.get('text', '')
+            text = text[1:] if text.startswith('=') else text
+            return params.get('options', {}).get('systemMessage', ''), _EXPRESSION.sub('', text)
+    raise ValueError(f"no node named {node_name!r} in {workflow_path}")
+
+
+def report(calls_by_user, stats, tokenizer):
+    print(f"Tokenizer: {tokenizer.name}")
+    for user_id, calls in calls_by_user.items():
+        sizes = ', '.join(f"{c.tokens}" for c in calls)
+        print(f"  user {user_id}: {len(calls)} call(s), {sum(len(c.ids) for c in calls)} email(s), "
+              f"tokens per call: {sizes}")
+    users = max(1, stats['users'])
+    print(f"✅ {stats['emails']} emails -> {stats['calls']} calls ({stats['calls'] / users:.1f} per user), "
+          f"{stats['tokens']} tokens; dropped {stats['blank']} blank, {stats['duplicates']} near-duplicate, "
+          f"truncated {stats['truncated']}")
+
+
+def sample_emails(users=20, per_user=60, seed=0):
+    """Synthetic onboarding emails: school/activity mail, newsletters, blanks and re-sends"""
+    rng = random.Random(seed)
+    children = ['Emma', 'Liam', 'Ava', 'Noah', 'Mia', 'Ellora', 'Bill', 'Zara']
+    activities = ['soccer', 'ballet', 'swim team', 'piano', 'robotics club', 'chess', 'Spanish class']
+    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+    vocabulary = ('the a to and of for in on at with please reminder parents students class practice week '
+                  'schedule pickup form due field trip concert library lunch teacher coach room grade '
+                  'school team game snack volunteer sign up permission slip bring water bottle uniform '
+                  'photos picture day early dismissal conference meeting homework project reading math '
+                  'science art music bus late start closed holiday break spring fall winter summer').split()
+    emails = []
+    for user in range(users):
+        user_id = f"00000000-0000-4000-8000-{user:012d}"
+        mailbox = []
+        for i in range(per_user):
+            kind = rng.random()
+            child, activity = rng.choice(children), rng.choice(activities)
+            if kind < 0.1:
+                text = rng.choice(['', ' ', 'Thanks!', 'See attached.'])
+            elif kind < 0.2 and mailbox:
+                # A re-send of an earlier email with a changed date
+                text = mailbox[rng.randrange(len(mailbox))]['text'].replace('Monday', rng.choice(days))
+            else:
+                paragraphs = [f"Hi families, {child} has {activity} on {rng.choice(days)}s at "
+                              f"{rng.randint(3, 6)}:{rng.choice(['00', '15', '30', '45'])}pm "
+                              f"with Coach {rng.choice(['Chen', 'Ortiz', 'Patel', 'Smith'])}."]
+                length = rng.choice([2, 4, 8, 16, 120]) if kind > 0.9 else rng.randint(2, 10)
+                for _ in range(length):
+                    paragraphs.append(' '.join(rng.choice(vocabulary) for _ in range(rng.randint(30, 90))) + '.')
+                text = '\n\n'.join(paragraphs)
+            mailbox.append({'id': f"msg{user:03d}{i:03d}", 'user_id': user_id, 'text': text,
+                            'score': rng.randint(-150, 450)})
+        emails.extend(mailbox)
+    return emails
+
+
+def benchmark(emails, packer):
+    """One call per non-blank email (as the workflow runs it) vs packed calls"""
+    tokenizer = packer.tokenizer
+    started = time.perf_counter()
+    baseline = [packer.overhead + tokenizer.count(email_text(e).strip()) for e in emails
+                if len(email_text(e).strip()) >= MIN_CHARS]
+    baseline_elapsed = time.perf_counter() - started
+    started = time.perf_counter()
+    calls_by_user = packer.pack_users(emails)
+    elapsed = time.perf_counter() - started
+    calls = [c for group in calls_by_user.values() for c in group]
+    users = max(1, len(calls_by_user))
+    stats = packer.stats
+
+    print(f"{len(emails)} emails, {users} users, budget {packer.budget} "
+          f"tokens per call ({tokenizer.name}):")
+    for label, sizes, seconds in (('one call per email', baseline, baseline_elapsed),
+                                  ('packed', [c.tokens for c in calls], elapsed)):
+        print(f"  {label:<20} {len(sizes):5d} calls ({len(sizes) / users:5.1f}/user)  "
+              f"{sum(sizes):9d} tokens  max {max(sizes, default=0):7d} tokens/call  "
+              f"{seconds * 1000:7.1f} ms")
+    print(f"  dropped {stats['blank']} blank, {stats['duplicates']} near-duplicate; "
+          f"truncated {stats['truncated']}")
+
+
+def load_emails(path):
+    """Emails from a JSON array (or n8n items) or NDJSON file ('-' for stdin)"""
+    text = sys.stdin.read() if path == '-' else open(path).read()
+    if text.lstrip().startswith('['):
+        data = json.loads(text)
+    else:
+        data = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [e['json'] if isinstance(e.get('json'), dict) else e for e in data if isinstance(e, dict)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pack emails into token-bounded extraction calls')
+    parser.add_argument('file', nargs='?', help='JSON array/NDJSON of emails with text (or body_text), '
+                                                'id, score and user_id; - for stdin')
+    parser.add_argument('--budget', type=int, default=BUDGET_TOKENS, help='prompt tokens per call')
+    parser.add_argument('--reserve', type=int, default=RESERVE_TOKENS, help='tokens kept for the answer')
+    parser.add_argument('--max-email-tokens', type=int, default=MAX_EMAIL_TOKENS)
+    parser.add_argument('--min-email-tokens', type=int, default=MIN_EMAIL_TOKENS)
+    parser.add_argument('--max-emails', type=int, help='emails per call (1 for the AI Email Processor)')
+    parser.add_argument('--workflow', help='read the system prompt and instruction from this workflow')
+    parser.add_argument('--node', default=DEFAULT_NODE, help='agent node for --workflow')
+    parser.add_argument('--items', action='store_true', help='print n8n items instead of a report')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--users', type=int, default=20, help='synthetic users for --benchmark')
+    args = parser.parse_args(argv)
+
+    system_prompt, instruction = '', INSTRUCTION
+    if args.workflow:
+        system_prompt, instruction = agent_prompt(args.workflow, args.node)
+    try:
+        packer = PromptPacker(args.budget, system_prompt, instruction, args.reserve, args.max_email_tokens,
+                              args.min_email_tokens, args.max_emails)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.benchmark:
+        benchmark(load_emails(args.file) if args.file else sample_emails(args.users), packer)
+        return
+    if not args.file:
+        parser.error('an emails file is required (or --benchmark)')
+    calls_by_user = packer.pack_users(load_emails(args.file))
+    if args.items:
+        print(json.dumps([item for calls in calls_by_user.values() for item in items(calls, packer.instruction)], indent=2))
+    else:
+        report(calls_by_user, packer.stats, packer.tokenizer)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,39 +1,29 @@
 #!/usr/bin/env python3
+"""Save one workflow piped on stdin (API response or bare workflow JSON)
+
+Usage:
+  python3 save_workflow.py [--snapshot] < workflow.json
+
+With --snapshot the workflow is also recorded in the snapshot store
+(workflows/.store, see workflow_store.py), as with n8n_backup.py --snapshot.
+"""
+import argparse
 import json
-import re
 import sys
-import os
 
-def sanitize_filename(name):
-    if not name:
-        return "unknown"
-    name = name.lower()
-    name = re.sub(r'[^a-z0-9]+', '-', name)
-    name = re.sub(r'-+', '-', name)
-    name = name.strip('-')
-    return name or "unknown"
+from workflow_graph import WorkflowGraph
+from workflow_io import save_workflow
+from workflow_store import DEFAULT_STORE, WorkflowStore
 
 if __name__ == "__main__":
-    # Read workflow JSON from stdin
-    # Handle both n8n API response format ({success: true, data: {...}}) and direct workflow format
-    input_data = json.load(sys.stdin)
-    
-    # Extract workflow data if it's an n8n API response
-    if isinstance(input_data, dict) and 'data' in input_data:
-        workflow_data = input_data['data']
-    else:
-        workflow_data = input_data
-    
-    workflow_name = workflow_data.get('name', 'unknown')
-    workflow_id = workflow_data.get('id', 'unknown')
-    
-    filename = sanitize_filename(workflow_name)
-    if not filename or filename == "unknown":
-        filename = f"workflow-{workflow_id}"
-    
-    output_path = f'workflows/{filename}.json'
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w') as f:
-        json.dump(workflow_data, f, indent=2)
-    
-    print(f"Saved: {workflow_name} (ID: {workflow_id}) -> {filename}.json")
+    parser = argparse.ArgumentParser(description='Save one workflow piped on stdin')
+    parser.add_argument('--snapshot', action='store_true', help='also record it in the snapshot store')
+    args = parser.parse_args()
+    try:
+        store = WorkflowStore(DEFAULT_STORE) if args.snapshot else None
+        workflow, path = save_workflow(json.load(sys.stdin), store=store, graph=WorkflowGraph())
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Saved: {workflow.get('name', 'unknown')} (ID: {workflow.get('id', 'unknown')}) -> {path.name}")
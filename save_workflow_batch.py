@@ -2,61 +2,24 @@
 """
 Save multiple n8n workflows from JSON data.
 Reads workflow JSON objects from stdin (one per line, or as JSON array).
+
+Input is parsed incrementally and each workflow is written as soon as it
+is complete, so large exports never have to fit in memory at once. Bad
+items are reported and skipped; the exit status is 1 if any failed.
 """
-import json
-import re
 import sys
-import os
-
-def sanitize_filename(name):
-    if not name:
-        return "unknown"
-    name = name.lower()
-    name = re.sub(r'[^a-z0-9]+', '-', name)
-    name = re.sub(r'-+', '-', name)
-    name = name.strip('-')
-    return name or "unknown"
 
-def save_workflow(workflow_data):
-    """Save a single workflow to a file."""
-    # Extract workflow data if it's an n8n API response
-    if isinstance(workflow_data, dict) and 'data' in workflow_data:
-        workflow = workflow_data['data']
-    else:
-        workflow = workflow_data
-    
-    workflow_name = workflow.get('name', 'unknown')
-    workflow_id = workflow.get('id', 'unknown')
-    
-    filename = sanitize_filename(workflow_name)
-    if not filename or filename == "unknown":
-        filename = f"workflow-{workflow_id}"
-    
-    output_path = f'workflows/{filename}.json'
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w') as f:
-        json.dump(workflow, f, indent=2)
-    
-    print(f"Saved: {workflow_name} (ID: {workflow_id}) -> {filename}.json")
-    return output_path
+from workflow_io import WorkflowWriter, save_stream
 
 if __name__ == "__main__":
-    try:
-        # Try to read as JSON array first
-        input_data = json.load(sys.stdin)
-        
-        if isinstance(input_data, list):
-            # Multiple workflows
-            for workflow_data in input_data:
-                save_workflow(workflow_data)
-        else:
-            # Single workflow
-            save_workflow(input_data)
-    except json.JSONDecodeError:
-        print("Error: Invalid JSON input", file=sys.stderr)
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error: {e}", file=sys.stderr)
+    failed = 0
+    with WorkflowWriter() as writer:
+        for label, workflow, path, written, error in save_stream(sys.stdin, writer):
+            if error:
+                failed += 1
+                print(f"Error ({label}): {error}", file=sys.stderr)
+                continue
+            status = "Saved" if written else "Unchanged"
+            print(f"{status}: {workflow.get('name', 'unknown')} (ID: {workflow.get('id', 'unknown')}) -> {path.name}")
+    if failed:
         sys.exit(1)
-
-
@@ -36,28 +36,12 @@ echo "🔄 Starting workflow backup..."
 echo "Target directory: $WORKFLOWS_DIR"
 echo ""
 
-count=0
-for item in "${WORKFLOW_IDS[@]}"; do
-  IFS=':' read -r id filename <<< "$item"
-  
-  echo "Fetching: $filename ($id)"
-  
-  curl -k -s -X GET "$N8N_URL/api/v1/workflows/$id" \
-    -H "X-N8N-API-KEY: $API_KEY" \
-    -o "$WORKFLOWS_DIR/${filename}.json"
-  
-  if [ $? -eq 0 ]; then
-    echo "✅ Saved: ${filename}.json"
-    ((count++))
-  else
-    echo "❌ Failed: ${filename}.json"
-  fi
-  
-  sleep 0.5  # Rate limiting
-done
+# Fetch concurrently over pooled connections (rate limited, honors Retry-After).
+# --incremental skips workflows whose updatedAt/content hash is unchanged.
+N8N_API_KEY="$API_KEY" N8N_URL="$N8N_URL" python3 "$(dirname "$0")/../n8n_backup.py" \
+  --out "$WORKFLOWS_DIR" --incremental --ids "${WORKFLOW_IDS[@]}"
 
 echo ""
-echo "✅ Backup complete: $count workflows saved"
 echo "Location: $WORKFLOWS_DIR"
 
 
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Sender -> user / family resolution for the Gmail Command Poller.
+
+"Match User by Email" runs a Supabase getAll on users with an ilike
+filter once per command email (up to 50 per 10-minute poll). ilike can't
+use the plain email index, treats "_" in an address as a wildcard, and
+ignores family_members entirely. SenderResolver keeps the lowercased
+sender_directory (migration 010) in memory instead:
+
+  - loaded with one paged query and reloaded every `ttl` seconds, or,
+    with --database-url (psycopg2), only when the sender_directory
+    channel reports a users / family_members change
+  - resolve_many() answers a whole poll batch from memory; addresses
+    not in the map go to rpc/resolve_senders in one call (indexed
+    lower(email) lookups), and unknown senders are remembered for
+    `negative_ttl` so spam doesn't hit the database on every poll
+  - addresses are normalized like the poller's From header handling:
+    display names and angle brackets dropped, trimmed, lowercased
+
+`serve` exposes POST /resolve {"emails": [...]} answering
+{email: {user_id, family_id, role} | null}, so "Match User by Email"
+can become one HTTP Request per poll. Callers send the N8N_API_KEY
+bearer token.
+
+Usage:
+  SUPABASE_SERVICE_ROLE_KEY=... N8N_API_KEY=... python3 sender_resolver.py serve [--port 8793] [--database-url ...]
+  python3 sender_resolver.py --benchmark [--users 2000] [--polls 20]
+"""
+import argparse
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import namedtuple
+from email.utils import parseaddr
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from http_pool import HttpError, JsonClient
+
+SUPABASE_URL = 'https://fvjmzvvcyxsvstlhenwj.supabase.co'
+CHANNEL = 'sender_directory'
+TTL = 120
+NEGATIVE_TTL = 60
+# Supabase's default PostgREST max-rows
+PAGE_SIZE = 1000
+RECONNECT_DELAY = 5
+
+Sender = namedtuple('Sender', 'email user_id family_id role')
+
+
+def normalize(address):
+    """'Jane Doe <Jane.Doe@Example.com> ' -> 'jane.doe@example.com' ('' if there's no address)"""
+    _, addr = parseaddr(address or '')
+    addr = addr.strip().lower()
+    return addr if '@' in addr else ''
+
+
+class SenderResolver:
+    """In-memory lowercased email -> Sender map (thread-safe)"""
+
+    def __init__(self, client, ttl=TTL, negative_ttl=NEGATIVE_TTL):
+        self.client = client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.directory = {}
+        self.unknown = {}
+        self.loaded_at = None
+        self.dirty = True
+        self.listening = False
+        self.stats = {'lookups': 0, 'hits': 0, 'cold_hits': 0, 'unknown': 0, 'refreshes': 0,
+                      'cold_queries': 0, 'queries': 0, 'notifications': 0}
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _stale(self):
+        if self.dirty or self.loaded_at is None:
+            return True
+        return not self.listening and time.monotonic() - self.loaded_at > self.ttl
+
+    def refresh(self):
+        """Reload the whole directory (one query per PAGE_SIZE addresses)"""
+        with self.lock:
+            self.dirty = False
+        directory, offset = {}, 0
+        try:
+            while True:
+                rows = self.client.get('/rest/v1/sender_directory', {
+                    'select': 'email,user_id,family_id,role', 'order': 'email',
+                    'limit': PAGE_SIZE, 'offset': offset,
+                }) or []
+                with self.lock:
+                    self.stats['queries'] += 1
+                for row in rows:
+                    sender = Sender(normalize(row['email']), row.get('user_id'), row.get('family_id'), row.get('role'))
+                    # Keep the row that has an account if an address appears twice
+                    if sender.email and (sender.email not in directory or sender.user_id):
+                        directory[sender.email] = sender
+                if len(rows) < PAGE_SIZE:
+                    break
+                offset += PAGE_SIZE
+        except BaseException:
+            with self.lock:
+                self.dirty = True
+            raise
+        with self.lock:
+            self.directory = directory
+            self.unknown = {}
+            self.loaded_at = time.monotonic()
+            self.stats['refreshes'] += 1
+        return len(directory)
+
+    def resolve_many(self, addresses):
+        """{address: Sender or None} for a batch; at most one database call for addresses not in memory
+
+        Raises HttpError like the underlying client if a query fails.
+        """
+        if self._stale():
+            with self.refresh_lock:
+                if self._stale():
+                    self.refresh()
+        keys = {address: normalize(address) for address in addresses}
+        now = time.monotonic()
+        found, misses = {}, set()
+        with self.lock:
+            self.stats['lookups'] += len(keys)
+            for address, key in keys.items():
+                if key in self.directory:
+                    found[address] = self.directory[key]
+                    self.stats['hits'] += 1
+                elif key and self.unknown.get(key, 0) <= now:
+                    misses.add(key)
+        if misses:
+            rows = self.client.request('POST', '/rest/v1/rpc/resolve_senders', body={'emails': sorted(misses)}) or []
+            with self.lock:
+                self.stats['cold_queries'] += 1
+                self.stats['queries'] += 1
+                for row in rows:
+                    sender = Sender(normalize(row['email']), row.get('user_id'), row.get('family_id'), row.get('role'))
+                    self.directory[sender.email] = sender
+                    self.stats['cold_hits'] += 1
+                for key in misses - {normalize(r['email']) for r in rows}:
+                    self.unknown[key] = now + self.negative_ttl
+        with self.lock:
+            for address, key in keys.items():
+                if address not in found:
+                    found[address] = self.directory.get(key)
+                    self.stats['unknown'] += found[address] is None
+        return found
+
+    def resolve(self, address):
+        return self.resolve_many([address])[address]
+
+    def invalidate(self):
+        """Reload on the next lookup (a users / family_members change)"""
+        with self.lock:
+            self.dirty = True
+            self.stats['notifications'] += 1
+
+    def _listen(self, database_url):
+        from unified_events_writer import connect
+        import select
+
+        while not self.stopped.is_set():
+            conn = None
+            try:
+                conn = connect(database_url)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                with self.lock:
+                    # Changes made while disconnected were missed
+                    self.listening = True
+                    self.dirty = True
+                while not self.stopped.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        if conn.notifies:
+                            conn.notifies.clear()
+                            self.invalidate()
+            except Exception as e:
+                print(f"⚠️  {CHANNEL} listener disconnected: {e}", file=sys.stderr)
+            finally:
+                with self.lock:
+                    self.listening = False
+                if conn is not None:
+                    conn.close()
+            self.stopped.wait(RECONNECT_DELAY)
+
+    def listen(self, database_url):
+        """Reload on change notifications instead of every ttl seconds (needs psycopg2)"""
+        self.thread = threading.Thread(target=self._listen, args=(database_url,), daemon=True)
+        self.thread.start()
+        return self
+
+    def summary(self):
+        with self.lock:
+            return {**self.stats, 'entries': len(self.directory), 'negative_entries': len(self.unknown),
+                    'listening': self.listening}
+
+    def close(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Cache-Control', 'no-store')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/stats':
+            return self._send(200, self.server.resolver.summary())
+        self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if urlsplit(self.path).path != '/resolve':
+            return self._send(404, {'error': 'not found'})
+        api_key = self.server.api_key
+        given = self.headers.get('Authorization', '')
+        if api_key and not hmac.compare_digest(given.encode(), f"Bearer {api_key}".encode()):
+            return self._send(401, {'error': 'Unauthorized'})
+        try:
+            emails = json.loads(raw or b'{}').get('emails')
+        except (ValueError, AttributeError):
+            emails = None
+        if not isinstance(emails, list):
+            return self._send(400, {'error': 'body must be {"emails": [...]}'})
+        try:
+            resolved = self.server.resolver.resolve_many([str(e) for e in emails])
+        except HttpError as e:
+            return self._send(e.status or 502, {'error': str(e)})
+        except OSError as e:
+            return self._send(502, {'error': str(e)})
+        self._send(200, {address: sender._asdict() if sender else None for address, sender in resolved.items()})
+
+
+def benchmark(users=2000, polls=20, batch=50, latency=0.005, seed=0):
+    """Poll batches of command senders: per-message ilike (the poller today) vs SenderResolver"""
+    from mock_services import MockServices
+
+    rng = random.Random(seed)
+    with MockServices(users=users, messages=0, latency=latency, members=2) as mock:
+        addresses = [m['email'] for m in mock.tables['family_members']]
+        client = JsonClient(mock.url, size=4)
+
+        def sender(address):
+            # The From header as mail clients write it
+            local, _, domain = address.partition('@')
+            styled = rng.choice([address, address.upper(), f"{local.title()}@{domain.upper()}"])
+            return rng.choice([styled, f"Parent <{styled}>", f" {styled} "])
+
+        batches = [[sender(rng.choice(addresses)) if rng.random() < 0.9 else f"promo{rng.randrange(20)}@spam.example"
+                    for _ in range(batch)] for _ in range(polls)]
+
+        def ilike(address):
+            # Extract Email Content has already pulled the address out of the From header
+            rows = client.get('/rest/v1/users', {'email': f"ilike.{parseaddr(address)[1].strip()}"}) or []
+            return rows[0]['id'] if rows else None
+
+        def run(resolve_batch):
+            before = sum(v for k, v in mock.counts.items() if k.startswith('rest.'))
+            started = time.perf_counter()
+            results = [resolve_batch(b) for b in batches]
+            elapsed = time.perf_counter() - started
+            return results, sum(v for k, v in mock.counts.items() if k.startswith('rest.')) - before, elapsed
+
+        direct, direct_queries, direct_elapsed = run(lambda b: [ilike(a) for a in b])
+        resolver = SenderResolver(client)
+
+        def resolve_batch(b):
+            # resolve_many is keyed by address, so repeated senders in a poll collapse; map back per message
+            resolved = resolver.resolve_many(b)
+            return [(resolved[a].user_id, resolved[a].family_id) if resolved[a] else None for a in b]
+
+        cached, cached_queries, cached_elapsed = run(resolve_batch)
+
+        # A new sign-up between polls is found by the cold lookup, not a reload
+        mock.tables['users'].append({'id': 'new-user', 'email': 'new.parent@example.com', 'status': 'active'})
+        before = resolver.summary()['refreshes']
+        new = resolver.resolve('New.Parent@Example.com')
+        client.close()
+
+    flat_direct = [r for b in direct for r in b]
+    flat_cached = [r for b in cached for r in b]
+    matched_direct = sum(r is not None for r in flat_direct)
+    matched_users = sum(r is not None and r[0] is not None for r in flat_cached)
+    matched_family = sum(r is not None for r in flat_cached)
+    differ = sum(d != (c[0] if c else None) for d, c in zip(flat_direct, flat_cached))
+    print(f"{polls} polls x {batch} senders, {users} users (+{users} relatives), {latency * 1000:.0f} ms latency:")
+    print(f"  ilike per message  {direct_queries:5d} queries  {direct_elapsed:6.2f}s  "
+          f"{matched_direct} matched a user")
+    print(f"  SenderResolver     {cached_queries:5d} queries  {cached_elapsed:6.2f}s  "
+          f"{matched_users} matched a user, {matched_family} a user or family")
+    print(f"  {'✅' if not differ else '❌'} same user for {len(flat_direct) - differ}/{len(flat_direct)} messages")
+    status = '✅' if new and new.user_id == 'new-user' and resolver.summary()['refreshes'] == before else '❌'
+    print(f"  {status} new sign-up resolved by one cold lookup")
+    print(f"  {json.dumps(resolver.summary())}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Resolve command email senders to users and families')
+    parser.add_argument('command', nargs='?', choices=('serve',))
+    parser.add_argument('--supabase-url', default=os.environ.get('SUPABASE_URL', SUPABASE_URL))
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help=f"LISTEN on {CHANNEL} (needs psycopg2); reloads every --ttl seconds without it")
+    parser.add_argument('--ttl', type=int, default=TTL)
+    parser.add_argument('--port', type=int, default=8793)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--polls', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.users, args.polls)
+        return
+    if not args.command:
+        parser.error('a command is required (or --benchmark)')
+    service_key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY')
+    api_key = os.environ.get('N8N_API_KEY')
+    if not service_key or not api_key:
+        print('Error: SUPABASE_SERVICE_ROLE_KEY and N8N_API_KEY must be set', file=sys.stderr)
+        sys.exit(1)
+
+    client = JsonClient(args.supabase_url, {'apikey': service_key, 'Authorization': f"Bearer {service_key}"},
+                        size=8)
+    resolver = SenderResolver(client, args.ttl)
+    if args.database_url:
+        resolver.listen(args.database_url)
+    server = ThreadingHTTPServer((args.host, args.port), _Handler)
+    server.daemon_threads = True
+    server.resolver = resolver
+    server.api_key = api_key
+    print(f"✅ {resolver.refresh()} sender addresses loaded; serving http://{args.host}:{server.server_address[1]}/resolve")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        resolver.close()
+        client.close()
+        print(json.dumps(resolver.summary()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
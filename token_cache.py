@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Shared OAuth access-token cache for /api/auth/tokens.
+
+Every workflow run calls "Get Token from Supabase" for every user, and
+the Command Processor calls "Get Gmail Token for Reply" again, although a
+Google access token stays valid for an hour. TokenCache sits in front of
+the bippity.boo route:
+
+  - a token is served from memory until `margin` seconds before its
+    expires_at (tokens without one are kept for `fallback_ttl`); errors,
+    is_expired answers and 4xx responses are never cached
+  - concurrent misses for the same user share one upstream request
+    (single-flight)
+  - a background thread refreshes ahead of expiry: once a token that was
+    used recently is within `refresh_ahead` of its deadline, it calls
+    POST /api/auth/refresh-tokens?userId=... for that user and re-reads
+    the token, so callers find a fresh token instead of waiting on a
+    refresh. Idle users are left alone. With bulk_refresh (opt-in) it
+    makes one call without userId instead, at most once per
+    `refresh_ahead`. That refreshes every token expiring within the hour,
+    including idle users, since a Google token only lives an hour.
+  - stats: hits, misses, single-flight joins, hit ratio and upstream /
+    refresh latency percentiles
+
+mailbox_sync.py uses it in-process. For n8n, `serve` exposes the same
+GET /api/auth/tokens?userId=...&provider=... (plus GET /stats and
+DELETE /api/auth/tokens?userId=... to drop an entry) on a TCP port or a
+Unix socket; callers send the same N8N_API_KEY bearer token as upstream.
+Point the "Get Token from Supabase" URLs at it to save one round trip per
+user per run.
+
+Usage:
+  N8N_API_KEY=... python3 token_cache.py serve [--port 8791 | --socket /run/token-cache.sock]
+  python3 token_cache.py --benchmark [--users 200] [--cycles 3]
+"""
+import argparse
+import hmac
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from http_pool import HttpError, JsonClient
+
+BIPPITY_URL = 'https://bippity.boo'
+TOKENS_PATH = '/api/auth/tokens'
+REFRESH_PATH = '/api/auth/refresh-tokens'
+# Stop serving a token this many seconds before expires_at
+MARGIN = 120
+# Start the background refresh this many seconds before that deadline
+REFRESH_AHEAD = 600
+# Lifetime for answers without expires_at
+FALLBACK_TTL = 300
+# Only tokens used within this window are refreshed in the background
+IDLE = 3600
+CHECK_INTERVAL = 15
+LATENCY_SAMPLES = 1000
+
+
+def parse_expires_at(value):
+    """expires_at (ISO 8601 string or epoch seconds) as epoch seconds, or None"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def _percentiles(samples, points=(50, 95, 99)):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    return {f"p{p}": round(ordered[min(len(ordered) - 1, len(ordered) * p // 100)] * 1000, 1) for p in points}
+
+
+class TokenCache:
+    """Per-user token cache with single-flight fetches and refresh-ahead (thread-safe)"""
+
+    def __init__(self, client, margin=MARGIN, refresh_ahead=REFRESH_AHEAD, fallback_ttl=FALLBACK_TTL,
+                 bulk_refresh=False, workers=8):
+        self.client = client
+        self.margin = margin
+        self.refresh_ahead = refresh_ahead
+        self.fallback_ttl = fallback_ttl
+        self.bulk_refresh = bulk_refresh
+        self.lock = threading.Lock()
+        # (user_id, provider) -> [data, deadline, last_used]
+        self.entries = {}
+        self.inflight = {}
+        self.last_bulk_refresh = 0.0
+        self.stats = {'hits': 0, 'misses': 0, 'joined': 0, 'fetches': 0, 'fetch_errors': 0,
+                      'refreshed': 0, 'user_refreshes': 0, 'bulk_refreshes': 0, 'invalidated': 0}
+        self.fetch_latency = deque(maxlen=LATENCY_SAMPLES)
+        self.refresh_latency = deque(maxlen=LATENCY_SAMPLES)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='token-refresh')
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def get(self, user_id, provider='google'):
+        """The route's JSON answer for user_id, from cache when still valid
+
+        Raises HttpError like the underlying client for failed requests.
+        """
+        key = (user_id, provider)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and now < entry[1]:
+                entry[2] = now
+                self.stats['hits'] += 1
+                return entry[0]
+            self.stats['misses'] += 1
+        return self._fetch(key, used=True)
+
+    def _fetch(self, key, used=False):
+        """Fetch key upstream, or wait for the request already in flight
+
+        used marks the token as just used (background refreshes don't).
+        """
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+            else:
+                self.stats['joined'] += 1
+        if not leader:
+            return future.result()
+
+        started = time.perf_counter()
+        try:
+            data = self.client.get(TOKENS_PATH, {'userId': key[0], 'provider': key[1]})
+        except BaseException as e:
+            with self.lock:
+                self.stats['fetch_errors'] += 1
+                del self.inflight[key]
+            future.set_exception(e)
+            raise
+        elapsed = time.perf_counter() - started
+        now = time.time()
+        with self.lock:
+            self.stats['fetches'] += 1
+            self.fetch_latency.append(elapsed)
+            if data and data.get('access_token') and not data.get('error') and not data.get('is_expired'):
+                expires_at = parse_expires_at(data.get('expires_at'))
+                deadline = expires_at - self.margin if expires_at else now + self.fallback_ttl
+                if deadline > now:
+                    last_used = now if used or key not in self.entries else self.entries[key][2]
+                    self.entries[key] = [data, deadline, last_used]
+            else:
+                self.entries.pop(key, None)
+            del self.inflight[key]
+        future.set_result(data)
+        return data
+
+    def invalidate(self, user_id, provider='google'):
+        """Forget a token (e.g. after the API rejected it with 401)"""
+        with self.lock:
+            if self.entries.pop((user_id, provider), None) is not None:
+                self.stats['invalidated'] += 1
+
+    def due(self, now=None):
+        """Keys of recently used tokens within refresh_ahead of their deadline"""
+        now = time.time() if now is None else now
+        with self.lock:
+            return [key for key, (_, deadline, last_used) in self.entries.items()
+                    if deadline - now < self.refresh_ahead and now - last_used < IDLE]
+
+    def refresh_due(self):
+        """One refresh-ahead pass; returns how many tokens were re-read"""
+        keys = self.due()
+        if not keys:
+            return 0
+        started = time.perf_counter()
+        # The route takes whole hours; due tokens expire within refresh_ahead + margin
+        hours = max(1, -(-int(self.refresh_ahead + self.margin) // 3600))
+        bulk = self.bulk_refresh and time.time() - self.last_bulk_refresh >= self.refresh_ahead
+        if bulk:
+            self.last_bulk_refresh = time.time()
+            try:
+                self.client.request('POST', REFRESH_PATH, params={'hoursBeforeExpiry': hours, 'provider': 'google'})
+                self.stats['bulk_refreshes'] += 1
+            except (HttpError, OSError) as e:
+                print(f"⚠️  Bulk token refresh failed: {e}", file=sys.stderr)
+
+        def refresh(key):
+            try:
+                if not bulk:
+                    self.client.request('POST', REFRESH_PATH, params={
+                        'userId': key[0], 'provider': key[1], 'hoursBeforeExpiry': hours})
+                    with self.lock:
+                        self.stats['user_refreshes'] += 1
+                self._fetch(key)
+                return True
+            except (HttpError, OSError):
+                return False
+
+        refreshed = sum(self.pool.map(refresh, keys))
+        with self.lock:
+            self.stats['refreshed'] += refreshed
+            self.refresh_latency.append(time.perf_counter() - started)
+        return refreshed
+
+    def _refresh_loop(self, interval):
+        while not self.stopped.wait(interval):
+            try:
+                self.refresh_due()
+            except Exception as e:
+                print(f"⚠️  Token refresh pass failed: {e}", file=sys.stderr)
+
+    def start(self, interval=CHECK_INTERVAL):
+        """Start the background refresh-ahead thread"""
+        self.thread = threading.Thread(target=self._refresh_loop, args=(interval,), daemon=True)
+        self.thread.start()
+        return self
+
+    def summary(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats, 'entries': len(self.entries),
+                'hit_ratio': round(self.stats['hits'] / lookups, 3) if lookups else None,
+                'fetch_latency_ms': _percentiles(self.fetch_latency),
+                'refresh_latency_ms': _percentiles(self.refresh_latency),
+            }
+
+    def close(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+        self.pool.shutdown(wait=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def address_string(self):
+        # client_address is '' on a Unix socket
+        return str(self.client_address or 'unix')
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Cache-Control', 'no-store')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        api_key = self.server.api_key
+        given = self.headers.get('Authorization', '')
+        return not api_key or hmac.compare_digest(given.encode(), f"Bearer {api_key}".encode())
+
+    def _user(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        return url.path, params.get('userId'), params.get('provider') or 'google'
+
+    def do_GET(self):
+        cache = self.server.cache
+        path, user_id, provider = self._user()
+        if path == '/stats':
+            return self._send(200, cache.summary())
+        if path != TOKENS_PATH:
+            return self._send(404, {'error': 'not found'})
+        if not self._authorized():
+            return self._send(401, {'error': 'Unauthorized'})
+        if not user_id:
+            return self._send(400, {'error': 'userId query parameter required when using API key'})
+        try:
+            self._send(200, cache.get(user_id, provider))
+        except HttpError as e:
+            self._send(e.status or 502, {'error': str(e)})
+        except OSError as e:
+            self._send(502, {'error': str(e)})
+
+    def do_DELETE(self):
+        path, user_id, provider = self._user()
+        if path != TOKENS_PATH or not user_id:
+            return self._send(404, {'error': 'not found'})
+        if not self._authorized():
+            return self._send(401, {'error': 'Unauthorized'})
+        self.server.cache.invalidate(user_id, provider)
+        self._send(200, {'invalidated': user_id})
+
+
+class _UnixHandler(_Handler):
+    # TCP_NODELAY doesn't apply to Unix sockets
+    disable_nagle_algorithm = False
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(cache, api_key, port=8791, host='127.0.0.1', socket_path=None):
+    """HTTP server for the cache on host:port, or on a Unix socket"""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = _UnixHTTPServer(socket_path, _UnixHandler)
+        os.chmod(socket_path, 0o660)
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+    server.cache = cache
+    server.api_key = api_key
+    return server
+
+
+def benchmark(users=200, cycles=3, latency=0.02, workers=16):
+    """Sync-style cycles of per-user token lookups: direct route calls vs TokenCache"""
+    from mock_services import MockServices
+
+    with MockServices(users=users, messages=0, latency=latency) as mock:
+        user_ids = [u['id'] for u in mock.tables['users']]
+        client = JsonClient(mock.url, size=workers)
+
+        def run(lookup):
+            timings = []
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for _ in range(cycles):
+                    started = time.perf_counter()
+                    list(pool.map(lookup, user_ids))
+                    timings.append(time.perf_counter() - started)
+            return timings
+
+        before = mock.counts['tokens']
+        direct = run(lambda u: client.get(TOKENS_PATH, {'userId': u, 'provider': 'google'}))
+        direct_calls = mock.counts['tokens'] - before
+
+        cache = TokenCache(client)
+        before = mock.counts['tokens']
+        cached = run(cache.get)
+        cached_calls = mock.counts['tokens'] - before
+
+        # 50 concurrent lookups for one cold user share one request
+        cache.invalidate(user_ids[0])
+        before = mock.counts['tokens']
+        with ThreadPoolExecutor(max_workers=50) as pool:
+            list(pool.map(lambda _: cache.get(user_ids[0]), range(50)))
+        burst_calls = mock.counts['tokens'] - before
+
+        # Refresh ahead: pretend every token is about to expire
+        for entry in cache.entries.values():
+            entry[1] = time.time() + 60
+        started = time.perf_counter()
+        refreshed = cache.refresh_due()
+        refresh_elapsed = time.perf_counter() - started
+        cache.close()
+        client.close()
+
+    print(f"{users} users x {cycles} cycles, {latency * 1000:.0f} ms route latency, {workers} workers:")
+    print(f"  direct      {direct_calls:5d} route calls  cycles " + ' '.join(f"{t * 1000:6.0f}ms" for t in direct))
+    print(f"  TokenCache  {cached_calls:5d} route calls  cycles " + ' '.join(f"{t * 1000:6.0f}ms" for t in cached))
+    print(f"  50 concurrent cold lookups for one user: {burst_calls} route call(s)")
+    print(f"  refresh ahead: {refreshed} tokens re-read in {refresh_elapsed * 1000:.0f} ms "
+          f"({mock.counts['refresh']} refresh call(s))")
+    print(f"  {json.dumps(cache.summary())}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cache OAuth access tokens in front of /api/auth/tokens')
+    parser.add_argument('command', nargs='?', choices=('serve',))
+    parser.add_argument('--upstream', default=os.environ.get('BIPPITY_URL', BIPPITY_URL))
+    parser.add_argument('--port', type=int, default=8791)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--socket', help='listen on this Unix socket instead of a TCP port')
+    parser.add_argument('--margin', type=int, default=MARGIN, help='seconds before expires_at to stop serving')
+    parser.add_argument('--refresh-ahead', type=int, default=REFRESH_AHEAD)
+    parser.add_argument('--bulk-refresh', action='store_true',
+                        help='refresh every token expiring within the hour in one call, '
+                             'instead of only the due users one by one')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--cycles', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.users, args.cycles)
+        return
+    if not args.command:
+        parser.error('a command is required (or --benchmark)')
+    api_key = os.environ.get('N8N_API_KEY')
+    if not api_key:
+        print('Error: N8N_API_KEY not set', file=sys.stderr)
+        sys.exit(1)
+
+    client = JsonClient(args.upstream, {'Authorization': f"Bearer {api_key}"}, size=16)
+    cache = TokenCache(client, args.margin, args.refresh_ahead, bulk_refresh=args.bulk_refresh).start()
+    server = make_server(cache, api_key, args.port, args.host, args.socket)
+    print(f"Caching {args.upstream}{TOKENS_PATH} on "
+          f"{args.socket or f'http://{args.host}:{server.server_address[1]}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        cache.close()
+        client.close()
+        print(json.dumps(cache.summary()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
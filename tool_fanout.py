@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Concurrent tool execution for one AI agent turn.
+
+When Stage 2 of the AI Email Processor decides on several actions, the
+agent node runs its toolWorkflow tools one after another, and every
+Calendar_* tool is a sub-workflow making its own HTTPS request (two for
+Calendar_Update). A turn that searches twice and creates four events
+pays six round trips in sequence. ToolExecutor runs a turn's tool calls
+(OpenAI tool_calls, as the model returns them) the way they'd run
+sequentially, but:
+
+  - calls are grouped into waves: reads on a service wait for earlier
+    writes to it and writes wait for earlier reads, and writes to the
+    same event / task id keep their order; everything in a wave runs
+    concurrently on a thread pool over one pooled JsonClient
+  - Calendar_Create calls in a wave go out as events.insert parts of
+    one /batch/calendar/v3 request (up to 50 per batch); parts answered
+    429 are resent, other failures are reported per call (a 5xx part
+    may still have been inserted, so it is never resent). Inserts and
+    batch requests are sent idempotent=False for the same reason: only
+    a 429 or a refused connection is retried, never a 5xx or a dropped
+    connection
+  - results have the shape of each sub-workflow's Format Results node,
+    so the agent sees what it sees today; tools without a built-in
+    implementation (the Tasks_* sub-workflows) plug in as handlers
+
+Usage:
+  python3 tool_fanout.py --token ACCESS_TOKEN tool_calls.json   # or - for stdin
+  python3 tool_fanout.py --benchmark [--turns 20] [--latency 0.05]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+from gmail_batch import build_batch, parse_batch
+from http_pool import HttpError, JsonClient, parse_retry_after
+
+CALENDAR_URL = 'https://www.googleapis.com'
+EVENTS_PATH = '/calendar/v3/calendars/primary/events'
+BATCH_PATH = '/batch/calendar/v3'
+MAX_BATCH = 50
+TIME_ZONE = 'America/Los_Angeles'
+SEARCH_LIMIT = 20
+# Dropped from Calendar_Search results by its Filter Calendar Results node
+SEARCH_OMIT = ('htmlLink', 'attendees', 'conferenceData', 'extendedProperties', 'creator', 'organizer',
+               'reminders', 'eventType', 'transparency', 'visibility', 'ownership', 'kind', 'locked', 'source',
+               'workingLocationProperties')
+READ_TOOLS = ('Calendar_Search', 'Calendar_By_Date', 'Tasks_Search')
+
+Call = namedtuple('Call', 'id name args')
+
+
+def tool_name(name):
+    """Canonical tool name: "Calendar_Search _Tool" and "Calendar_By_Date_Tool'" -> Calendar_Search / _By_Date"""
+    name = re.sub(r'[^A-Za-z_]', '', name or '')
+    return name[:-len('_Tool')] if name.endswith('_Tool') else name
+
+
+def parse_calls(tool_calls):
+    """Calls from OpenAI tool_calls ({id, function: {name, arguments}}) or {id, name, arguments} dicts"""
+    calls = []
+    for i, call in enumerate(tool_calls):
+        function = call.get('function', call)
+        args = function.get('arguments') or {}
+        if isinstance(args, str):
+            args = json.loads(args) if args.strip() else {}
+        calls.append(Call(call.get('id') or f"call-{i}", tool_name(function.get('name')), args))
+    return calls
+
+
+def plan(calls):
+    """Wave number for each call; calls in one wave don't depend on each other
+
+    Two calls on the same service (the tool name's prefix) conflict when
+    one reads and the other writes, or when both write the same
+    event_id / task_id. A call goes one wave after the last earlier
+    call it conflicts with.
+    """
+    waves = []
+    for i, call in enumerate(calls):
+        service, reads = call.name.partition('_')[0], call.name in READ_TOOLS
+        target = call.args.get('event_id') or call.args.get('task_id')
+        wave = 0
+        for earlier, earlier_wave in zip(calls[:i], waves):
+            if earlier.name.partition('_')[0] != service:
+                continue
+            earlier_reads = earlier.name in READ_TOOLS
+            if reads and earlier_reads:
+                continue
+            if reads != earlier_reads or (target and target == (earlier.args.get('event_id')
+                                                                 or earlier.args.get('task_id'))):
+                wave = max(wave, earlier_wave + 1)
+        waves.append(wave)
+    return waves
+
+
+def _rrule(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    return value if value.startswith('RRULE:') else f"RRULE:{value}"
+
+
+def _is_all_day(start, end):
+    """Build Event Body's rule: both times 00:00:00 and end exactly one day after start"""
+    midnight = re.compile(r'T00:00:00')
+    if not (midnight.search(start) and midnight.search(end)):
+        return False
+    try:
+        return date.fromisoformat(end[:10]) - date.fromisoformat(start[:10]) == timedelta(days=1)
+    except ValueError:
+        return False
+
+
+def event_body(args):
+    """events.insert body for Calendar_Create arguments (the Build Event Body node)"""
+    start, end = args.get('start') or '', args.get('end') or ''
+    event = {'summary': args.get('summary'), 'description': args.get('description') or '',
+             'location': args.get('location') or ''}
+    if _is_all_day(start, end):
+        event['start'], event['end'] = {'date': start[:10]}, {'date': end[:10]}
+    else:
+        event['start'] = {'dateTime': start, 'timeZone': TIME_ZONE}
+        event['end'] = {'dateTime': end, 'timeZone': TIME_ZONE}
+    rule = _rrule(args.get('rrule'))
+    if rule:
+        event['recurrence'] = [rule]
+    return event
+
+
+def merge_update(args, existing):
+    """events.patch body for Calendar_Update arguments over the stored event (the Merge Updates node)"""
+    body = {'summary': args.get('summary') or existing.get('summary'),
+            'start': existing.get('start'), 'end': existing.get('end')}
+    for key in ('start', 'end'):
+        if args.get(key):
+            body[key] = {'dateTime': args[key], 'timeZone': (existing.get(key) or {}).get('timeZone') or TIME_ZONE}
+    for key in ('description', 'location'):
+        if args.get(key):
+            body[key] = args[key]
+        elif existing.get(key):
+            body[key] = existing[key]
+    rule = _rrule(args.get('rrule'))
+    if rule or existing.get('recurrence'):
+        body['recurrence'] = [rule] if rule else existing['recurrence']
+    return body
+
+
+def _failure(status, body):
+    """Format Results' error shape for an error response"""
+    error = body.get('error') if isinstance(body, dict) else None
+    if isinstance(error, dict):
+        return {'success': False, 'error': error.get('message') or error, 'code': error.get('code', status)}
+    return {'success': False, 'error': error or body or f"HTTP {status}", 'code': status}
+
+
+def _http_failure(e):
+    """_failure for an HttpError raised by JsonClient (its message holds the start of the body)"""
+    text = e.message
+    match = re.search(r'"message":\s*"((?:[^"\\]|\\.)*)"', text)
+    return {'success': False, 'error': match.group(1) if match else text, 'code': e.status}
+
+
+def _event_result(event, fields=('summary', 'start', 'end', 'htmlLink')):
+    """Calendar_Create / Calendar_Update Format Results for a returned event"""
+    if not isinstance(event, dict) or not event.get('id'):
+        return {'success': False, 'error': 'Unexpected response format', 'raw_response': json.dumps(event)[:500]}
+    return {'success': True, 'event_id': event['id'], **{f: event.get(f) for f in fields},
+            'recurrence': event.get('recurrence') or None}
+
+
+class CalendarClient:
+    """The Calendar_* sub-workflows' requests over one pooled JsonClient
+
+    Every method returns the sub-workflow's output dict; API errors come
+    back as {success: false, error, code} rather than raising, as the
+    nodes use neverError.
+    """
+
+    def __init__(self, client, batch_size=MAX_BATCH, max_attempts=4):
+        self.client = client
+        self.batch_size = min(batch_size, MAX_BATCH)
+        self.max_attempts = max_attempts
+        self.stats = {'batches': 0, 'parts': 0, 'retried': 0}
+
+    def _call(self, token, method, path='', params=None, body=None):
+        return self.client.request(method, EVENTS_PATH + path, params, body,
+                                   headers={'Authorization': f"Bearer {token}"}, idempotent=method != 'POST')
+
+    def _list(self, token, params):
+        try:
+            return True, (self._call(token, 'GET', params=params) or {}).get('items') or []
+        except HttpError as e:
+            return False, _http_failure(e)
+
+    def search(self, token, query, now=None):
+        now = now or datetime.now(timezone.utc)
+        ok, items = self._list(token, {
+            'q': query, 'timeMin': (now - timedelta(days=365)).isoformat(),
+            'timeMax': (now + timedelta(days=365)).isoformat(), 'singleEvents': 'false',
+            'maxResults': SEARCH_LIMIT,
+        })
+        if not ok:
+            return items
+        events = [{k: v for k, v in e.items() if k not in SEARCH_OMIT} for e in items[:SEARCH_LIMIT]]
+        if not events:
+            return {'success': True, 'message': f"No events found for '{query}'", 'results': []}
+        return {'success': True, 'count': len(events), 'events': events}
+
+    def by_date(self, token, start_date, end_date):
+        ok, items = self._list(token, {'timeMin': start_date, 'timeMax': end_date,
+                                       'singleEvents': 'true', 'orderBy': 'startTime'})
+        if not ok:
+            return items
+        if not items:
+            return {'success': True, 'message': f"No events found between {start_date} and {end_date}",
+                    'results': []}
+        return {'success': True, 'count': len(items), 'events': items}
+
+    def create(self, token, args):
+        try:
+            return _event_result(self._call(token, 'POST', body=event_body(args)))
+        except HttpError as e:
+            return _http_failure(e)
+
+    def _send_batch(self, token, calls):
+        boundary = f"batch_{uuid.uuid4().hex}"
+        headers, data = self.client.send(
+            'POST', BATCH_PATH, build_batch(calls, boundary),
+            {'Authorization': f"Bearer {token}", 'Content-Type': f"multipart/mixed; boundary={boundary}"},
+            idempotent=False,
+        )
+        self.stats['batches'] += 1
+        self.stats['parts'] += len(calls)
+        return parse_batch(headers.get('Content-Type', ''), data)
+
+    def create_many(self, token, calls):
+        """Calendar_Create for each arguments dict, batched; results in input order"""
+        if len(calls) < 2:
+            return [self.create(token, args) for args in calls]
+        bodies = [event_body(args) for args in calls]
+        results = [None] * len(bodies)
+        pending = list(range(len(bodies)))
+
+        for attempt in range(self.max_attempts):
+            retry, delay = [], 0.0
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                try:
+                    parts = self._send_batch(token, [(f"item-{i}", EVENTS_PATH, 'POST', bodies[i]) for i in chunk])
+                except HttpError as e:
+                    for i in chunk:
+                        results[i] = _http_failure(e)
+                    continue
+                for i in chunk:
+                    status, headers, body = parts.get(f"item-{i}", (None, {}, None))
+                    if status == 429:
+                        # Rejected before the insert, so resending can't duplicate the event
+                        retry.append(i)
+                        wait = parse_retry_after(headers.get('retry-after'))
+                        delay = max(delay, wait if wait is not None else 0.5 * 2 ** attempt)
+                    elif status is None:
+                        results[i] = {'success': False, 'error': 'No response for this event in the batch',
+                                      'code': None}
+                    elif status < 300:
+                        results[i] = _event_result(body)
+                    else:
+                        results[i] = _failure(status, body)
+            pending = retry
+            if not pending:
+                break
+            self.stats['retried'] += len(pending)
+            if attempt + 1 < self.max_attempts:
+                time.sleep(delay)
+
+        for i in pending:
+            results[i] = {'success': False, 'error': f"giving up after {self.max_attempts} attempts", 'code': 429}
+        return results
+
+    def update(self, token, args):
+        event_id = args.get('event_id') or ''
+        try:
+            existing = self._call(token, 'GET', f"/{event_id}") or {}
+            event = self._call(token, 'PATCH', f"/{event_id}", body=merge_update(args, existing))
+        except HttpError as e:
+            return _http_failure(e)
+        return _event_result(event, ('summary', 'start', 'end', 'description', 'location', 'htmlLink'))
+
+    def delete(self, token, event_id):
+        try:
+            self._call(token, 'DELETE', f"/{event_id}")
+        except HttpError as e:
+            return {**_http_failure(e), 'event_id': event_id}
+        return {'success': True, 'message': 'Event deleted successfully', 'event_id': event_id}
+
+
+class ToolExecutor:
+    """Run one agent turn's tool calls wave by wave, concurrently within a wave
+
+    handlers maps extra tool names (without the _Tool suffix) to
+    callables (token, args) -> output dict, e.g. the Tasks_* tools.
+    """
+
+    def __init__(self, calendar, handlers=None, workers=8):
+        self.calendar = calendar
+        handlers = {tool_name(name): handler for name, handler in (handlers or {}).items()}
+        # A custom Calendar_Create handler opts out of batching
+        self.batch_creates = 'Calendar_Create' not in handlers
+        self.handlers = {
+            'Calendar_Search': lambda token, args: calendar.search(token, args.get('query') or ''),
+            'Calendar_By_Date': lambda token, args: calendar.by_date(token, args.get('start_date'),
+                                                                     args.get('end_date')),
+            'Calendar_Create': calendar.create,
+            'Calendar_Update': calendar.update,
+            'Calendar_Delete': lambda token, args: calendar.delete(token, args.get('event_id') or ''),
+            **handlers,
+        }
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tool')
+        self.stats = {'turns': 0, 'calls': 0, 'waves': 0, 'batched': 0}
+
+    def execute(self, token, call):
+        """Output for one call; a failing handler becomes an error result, not an exception"""
+        handler = self.handlers.get(call.name)
+        if handler is None:
+            return {'success': False, 'error': f"Unknown tool: {call.name}"}
+        try:
+            return handler(token, call.args)
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    def run(self, token, tool_calls):
+        """Execute a turn; returns [{tool_call_id, name, output}] in the order the model asked"""
+        calls = parse_calls(tool_calls)
+        waves = plan(calls)
+        outputs = [None] * len(calls)
+        for wave in sorted(set(waves)):
+            members = [i for i, w in enumerate(waves) if w == wave]
+            creates = [i for i in members if calls[i].name == 'Calendar_Create']
+            if len(creates) < 2 or not self.batch_creates:
+                creates = []
+            futures = [(i, self.pool.submit(self.execute, token, calls[i])) for i in members if i not in creates]
+            if creates:
+                batch = self.pool.submit(self.calendar.create_many, token, [calls[i].args for i in creates])
+                for i, output in zip(creates, batch.result()):
+                    outputs[i] = output
+                self.stats['batched'] += len(creates)
+            for i, future in futures:
+                outputs[i] = future.result()
+        self.stats['turns'] += 1
+        self.stats['calls'] += len(calls)
+        self.stats['waves'] += len(set(waves))
+        return [{'tool_call_id': call.id, 'name': call.name, 'output': output}
+                for call, output in zip(calls, outputs)]
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+
+def _turn_calls(events, turn, now):
+    """A Stage 2 style turn: look around, then create four events, update one and delete one"""
+    day = (now + timedelta(days=turn % 20 + 1)).date().isoformat()
+
+    def call(name, **args):
+        return {'id': f"call_{uuid.uuid4().hex[:12]}", 'type': 'function',
+                'function': {'name': name, 'arguments': json.dumps(args)}}
+
+    return [
+        call('Calendar_Search _Tool', query='soccer'),
+        call('Calendar_Search _Tool', query='dental'),
+        call("Calendar_By_Date_Tool'", start_date=now.isoformat(), end_date=(now + timedelta(days=7)).isoformat()),
+        call('Calendar_Create_Tool', summary=f"Field trip {turn}", start=f"{day}T09:00:00-08:00",
+             end=f"{day}T15:00:00-08:00", description='Email: Field trip | model D1', location='Science Museum'),
+        call('Calendar_Create_Tool', summary=f"Picture day {turn}", start=f"{day}T00:00:00-08:00",
+             end=f"{(date.fromisoformat(day) + timedelta(days=1)).isoformat()}T00:00:00-08:00"),
+        call('Calendar_Create_Tool', summary=f"Piano lessons {turn}", start=f"{day}T16:00:00-08:00",
+             end=f"{day}T16:45:00-08:00", rrule='FREQ=WEEKLY;COUNT=10'),
+        call('Calendar_Create_Tool', summary=f"Book fair {turn}", start=f"{day}T08:00:00-08:00",
+             end=f"{day}T12:00:00-08:00", location='Lincoln Elementary gym'),
+        call('Calendar_Update_Tool', event_id=events[0]['id'], location=f"Field {turn}"),
+        call('Calendar_Delete_Tool', event_id=events[-1]['id']),
+    ]
+
+
+def benchmark(turns=20, latency=0.05, workers=8):
+    """Stage 2 turns run one tool at a time (as the agent node does) vs ToolExecutor, against mock_services"""
+    from mock_services import MockServices
+
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    with MockServices(users=2, messages=0, latency=latency, calendar=6) as mock:
+        sequential_user, fanout_user = list(mock.calendars)
+        client = JsonClient(mock.url, size=workers)
+        executor = ToolExecutor(CalendarClient(client), workers=workers)
+
+        def run(user_id, execute_turn):
+            token = f"tok-{user_id}"
+            before = client.stats['requests']
+            started = time.perf_counter()
+            outputs = [execute_turn(token, _turn_calls(list(mock.calendars[user_id].values()), turn, now))
+                       for turn in range(turns)]
+            return outputs, client.stats['requests'] - before, time.perf_counter() - started
+
+        sequential, sequential_requests, sequential_elapsed = run(
+            sequential_user, lambda token, tool_calls: [executor.execute(token, c) for c in parse_calls(tool_calls)])
+        fanout, fanout_requests, fanout_elapsed = run(
+            fanout_user, lambda token, tool_calls: [r['output'] for r in executor.run(token, tool_calls)])
+
+        def state(user_id):
+            return sorted(json.dumps({k: e.get(k) for k in ('summary', 'start', 'end', 'location', 'recurrence')},
+                                     sort_keys=True) for e in mock.calendars[user_id].values())
+
+        def shape(output):
+            return output.get('success'), output.get('count'), output.get('summary'), output.get('start')
+
+        same_state = state(sequential_user) == state(fanout_user)
+        same_outputs = [[shape(o) for o in t] for t in sequential] == [[shape(o) for o in t] for t in fanout]
+
+        # A search after a create in the same turn must see the new event
+        fair = (now + timedelta(days=30)).date().isoformat()
+        ordered = executor.run(f"tok-{fanout_user}", [
+            {'name': 'Calendar_Create_Tool', 'arguments': {'summary': 'Science fair', 'start': f"{fair}T18:00:00-08:00",
+                                                             'end': f"{fair}T20:00:00-08:00"}},
+            {'name': 'Calendar_Search _Tool', 'arguments': {'query': 'science fair'}},
+        ])
+        executor.close()
+        client.close()
+
+    calls = turns * len(_turn_calls([{'id': ''}], 0, now))
+    print(f"{turns} turns x {calls // turns} tool calls, {latency * 1000:.0f} ms per round trip:")
+    print(f"  one at a time  {sequential_requests:5d} requests  {sequential_elapsed:6.2f}s")
+    print(f"  ToolExecutor   {fanout_requests:5d} requests  {fanout_elapsed:6.2f}s  "
+          f"({sequential_elapsed / fanout_elapsed:.1f}x)")
+    print(f"  {'✅' if same_state else '❌'} calendars identical after both runs")
+    print(f"  {'✅' if same_outputs else '❌'} tool outputs match call for call")
+    print(f"  {'✅' if ordered[1]['output'].get('count') == 1 else '❌'} search after a create in one turn sees it")
+    print(f"  {json.dumps({**executor.stats, **executor.calendar.stats})}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run an agent turn's tool calls concurrently")
+    parser.add_argument('calls', nargs='?', help='JSON file of tool_calls (- for stdin)')
+    parser.add_argument('--token', default=os.environ.get('GOOGLE_ACCESS_TOKEN'))
+    parser.add_argument('--url', default=os.environ.get('CALENDAR_URL', CALENDAR_URL))
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--benchmark', action='store_true', help='compare against one call at a time on a mock')
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark(args.turns, args.latency, args.workers)
+        return
+    if not args.token or not args.calls:
+        parser.error('--token (or GOOGLE_ACCESS_TOKEN) and a tool_calls file are required')
+
+    with (sys.stdin if args.calls == '-' else open(args.calls)) as f:
+        tool_calls = json.load(f)
+    client = JsonClient(args.url, size=args.workers)
+    executor = ToolExecutor(CalendarClient(client), workers=args.workers)
+    try:
+        results = executor.run(args.token, tool_calls)
+    finally:
+        executor.close()
+        client.close()
+    json.dump(results, sys.stdout, indent=2)
+    print()
+    failed = [r for r in results if not r['output'].get('success')]
+    for r in failed:
+        print(f"❌ {r['name']} ({r['tool_call_id']}): {r['output'].get('error')}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Batched unified_events writer.
+
+Replaces the "Save to Unified Events" postgres node, which builds one
+INSERT per email with hand-escaped string literals, with bound-parameter
+writes of many rows per round trip:
+
+  - insert: one multi-row INSERT ... VALUES (...), (...) per batch
+  - copy:   COPY into a session temp table, then a single
+            INSERT ... SELECT (psycopg2 connections only)
+
+Both end in ON CONFLICT (user_id, channel, source_id) DO NOTHING, so
+duplicates are dropped by the database's unique key rather than by the
+"Dedupe Messages" code node. Rows are the dicts mailbox_sync.parse_message
+returns.
+
+The writer takes any DB-API connection; paramstyle='qmark' lets it run on
+sqlite3 (3.24+) for local checks.
+
+Usage:
+  DATABASE_URL=postgres://... python3 unified_events_writer.py rows.ndjson [--method copy]
+  DATABASE_URL=postgres://... python3 unified_events_writer.py --benchmark [--rows 500]
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+COLUMNS = (
+    'user_id', 'channel', 'source_id', 'source_thread_id', 'event_type', 'subject', 'snippet',
+    'body_text', 'from_email', 'received_at', 'is_processed', 'processing_status',
+)
+CONFLICT_KEY = ('user_id', 'channel', 'source_id')
+BATCH_SIZE = 500
+# Postgres caps a statement at 65535 bind parameters, SQLite at 32766
+MAX_PARAMS = 32766
+PLACEHOLDERS = {'format': '%s', 'qmark': '?'}
+METHODS = ('insert', 'copy')
+LOAD_TABLE = 'unified_events_load'
+
+
+class UnifiedEventsError(Exception):
+    """A batch write failed and was rolled back"""
+
+
+def _copy_value(value):
+    """Encode one value for COPY ... FROM STDIN (text format)"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_payload(rows, columns=COLUMNS):
+    """Tab-separated COPY text for a list of row dicts"""
+    return ''.join('\t'.join(_copy_value(row.get(c)) for c in columns) + '\n' for row in rows)
+
+
+class UnifiedEventsWriter:
+    """Buffer rows and write them with one statement per batch (thread-safe)"""
+
+    def __init__(self, conn, batch_size=BATCH_SIZE, method='insert', paramstyle='format',
+                 table='unified_events'):
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {', '.join(METHODS)}")
+        if paramstyle not in PLACEHOLDERS:
+            raise ValueError(f"paramstyle must be one of {', '.join(PLACEHOLDERS)}")
+        if method == 'copy' and not hasattr(conn.cursor(), 'copy_expert'):
+            raise ValueError('method copy needs a psycopg2 connection')
+        self.conn = conn
+        self.method = method
+        self.table = table
+        self.placeholder = PLACEHOLDERS[paramstyle]
+        self.batch_size = max(1, min(batch_size, MAX_PARAMS // len(COLUMNS)))
+        self.buffer = {}
+        self.lock = threading.Lock()
+        self.load_table_ready = False
+        self.stats = {'rows': 0, 'inserted': 0, 'duplicates': 0, 'statements': 0}
+
+    def _insert_sql(self, count):
+        row = f"({', '.join([self.placeholder] * len(COLUMNS))})"
+        return (f"INSERT INTO {self.table} ({', '.join(COLUMNS)}) VALUES {', '.join([row] * count)} "
+                f"ON CONFLICT ({', '.join(CONFLICT_KEY)}) DO NOTHING")
+
+    def _write_insert(self, cur, rows):
+        inserted = 0
+        for start in range(0, len(rows), self.batch_size):
+            chunk = rows[start:start + self.batch_size]
+            cur.execute(self._insert_sql(len(chunk)), [row.get(c) for row in chunk for c in COLUMNS])
+            self.stats['statements'] += 1
+            inserted += max(cur.rowcount, 0)
+        return inserted
+
+    def _write_copy(self, cur, rows):
+        columns = ', '.join(COLUMNS)
+        if not self.load_table_ready:
+            cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {LOAD_TABLE} AS "
+                        f"SELECT {columns} FROM {self.table} WITH NO DATA")
+            self.stats['statements'] += 1
+            self.load_table_ready = True
+        cur.copy_expert(f"COPY {LOAD_TABLE} ({columns}) FROM STDIN", io.StringIO(copy_payload(rows)))
+        # Moving the rows out with DELETE ... RETURNING leaves the load table
+        # empty for the next batch whether or not the caller commits
+        cur.execute(f"WITH moved AS (DELETE FROM {LOAD_TABLE} RETURNING {columns}) "
+                    f"INSERT INTO {self.table} ({columns}) SELECT {columns} FROM moved "
+                    f"ON CONFLICT ({', '.join(CONFLICT_KEY)}) DO NOTHING")
+        self.stats['statements'] += 2
+        return max(cur.rowcount, 0)
+
+    def insert(self, rows):
+        """Write rows now and commit; returns how many were new
+
+        Rows sharing a conflict key are collapsed first (last one wins).
+        Raises UnifiedEventsError (after rolling back) if the write fails.
+        """
+        rows = list({tuple(row.get(c) for c in CONFLICT_KEY): row for row in rows}.values())
+        if not rows:
+            return 0
+        with self.lock:
+            cur = self.conn.cursor()
+            try:
+                write = self._write_copy if self.method == 'copy' else self._write_insert
+                inserted = write(cur, rows)
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                self.load_table_ready = False
+                raise UnifiedEventsError(f"{len(rows)} row(s) not written: {e}") from e
+            finally:
+                cur.close()
+            self.stats['rows'] += len(rows)
+            self.stats['inserted'] += inserted
+            self.stats['duplicates'] += len(rows) - inserted
+        return inserted
+
+    def add(self, row):
+        """Buffer one row, flushing once batch_size rows are waiting"""
+        self.buffer[tuple(row.get(c) for c in CONFLICT_KEY)] = row
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        """Write the buffered rows; they stay buffered if the write fails"""
+        rows = list(self.buffer.values())
+        inserted = self.insert(rows)
+        self.buffer.clear()
+        return inserted
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+
+def connect(database_url):
+    """psycopg2 connection for DATABASE_URL (psycopg2 is only needed here)"""
+    try:
+        import psycopg2
+    except ImportError:
+        print('Error: psycopg2 is required (pip install psycopg2-binary)', file=sys.stderr)
+        sys.exit(1)
+    return psycopg2.connect(database_url)
+
+
+def load_rows(path):
+    """Rows from a JSON array or NDJSON file ('-' for stdin)"""
+    text = sys.stdin.read() if path == '-' else open(path).read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def benchmark(conn, rows=500, batch_size=BATCH_SIZE):
+    """Per-row INSERTs (as the n8n node does them) vs batched INSERT vs COPY on a temp table"""
+    table = 'unified_events_bench'
+    cur = conn.cursor()
+    cur.execute(f"""CREATE TEMP TABLE {table} (
+        id bigserial PRIMARY KEY, user_id uuid NOT NULL, channel text NOT NULL,
+        source_id text NOT NULL, source_thread_id text, event_type text, subject text,
+        snippet text, body_text text, from_email text, received_at timestamptz,
+        is_processed boolean DEFAULT false, processing_status text,
+        UNIQUE (user_id, channel, source_id))""")
+    conn.commit()
+    user_id = '00000000-0000-4000-8000-000000000001'
+    sample = [{
+        'user_id': user_id, 'channel': 'gmail', 'source_id': f"msg{i:06d}", 'source_thread_id': f"thr{i:06d}",
+        'event_type': 'email', 'subject': f"Field trip permission slip #{i}", 'snippet': "Don't forget",
+        'body_text': "Hi parents,\n\tPlease sign O'Brien's form.\n" * 40, 'from_email': 'teacher@school.org',
+        'received_at': '2026-01-15T08:00:00Z', 'is_processed': False, 'processing_status': 'pending',
+    } for i in range(rows)]
+
+    timings = {}
+    per_row = UnifiedEventsWriter(conn, batch_size=1, table=table)
+    started = time.perf_counter()
+    for row in sample:
+        per_row.insert([row])
+    timings['per-row INSERT'] = time.perf_counter() - started
+
+    for method in METHODS:
+        cur.execute(f"TRUNCATE {table}")
+        conn.commit()
+        writer = UnifiedEventsWriter(conn, batch_size, method, table=table)
+        started = time.perf_counter()
+        writer.insert(sample)
+        timings[f"batched {method}"] = time.perf_counter() - started
+        assert writer.stats['inserted'] == rows
+        started = time.perf_counter()
+        writer.insert(sample)
+        timings[f"batched {method} (all dupes)"] = time.perf_counter() - started
+        assert writer.stats['duplicates'] == rows
+    cur.execute(f"DROP TABLE {table}")
+    conn.commit()
+
+    print(f"{rows} rows, batch size {batch_size}:")
+    for label, elapsed in timings.items():
+        print(f"  {label:<28} {elapsed:7.3f}s")
+    for method in METHODS:
+        print(f"  {method} speedup: {timings['per-row INSERT'] / timings[f'batched {method}']:.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk-load parsed emails into unified_events')
+    parser.add_argument('file', nargs='?', help='JSON array or NDJSON of unified_events rows (- for stdin)')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--method', choices=METHODS, default='insert')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--benchmark', action='store_true', help='compare against per-row INSERTs on a temp table')
+    parser.add_argument('--rows', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    if not args.database_url:
+        parser.error('--database-url (or DATABASE_URL) is required')
+    if not args.benchmark and not args.file:
+        parser.error('a rows file is required (or --benchmark)')
+
+    conn = connect(args.database_url)
+    try:
+        if args.benchmark:
+            benchmark(conn, args.rows, args.batch_size)
+            return
+        writer = UnifiedEventsWriter(conn, args.batch_size, args.method)
+        try:
+            with writer:
+                writer.extend(load_rows(args.file))
+        except UnifiedEventsError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            sys.exit(1)
+        stats = writer.stats
+        print(f"✅ {stats['inserted']} inserted, {stats['duplicates']} duplicates skipped "
+              f"({stats['statements']} statements)")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Structural diff of n8n workflows.
+
+Nodes are aligned by id (falling back to name), so reordering nodes or
+dragging them around the canvas produces no output. Parameters are
+compared field by field; multi-line strings such as jsCode and agent
+prompts are diffed line by line; connections are compared as sets of
+edges.
+
+Usage:
+  python3 workflow_diff.py OLD NEW            # files, or directories
+  python3 workflow_diff.py HEAD~3:workflows/x.json workflows/x.json
+  python3 workflow_diff.py --format json OLD NEW
+
+Directory arguments are paired by file name first, so copies of one
+workflow saved under different names (processor_import.json and
+processor_ready.json) each diff against their own file; leftover files
+are then matched by workflow id, so a renamed backup file is still
+diffed against its previous version. Arguments of the form REV:PATH that don't exist on disk are read
+with `git show`. Exits 1 if there are differences.
+"""
+import argparse
+import difflib
+import json
+import subprocess
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+from workflow_io import unwrap_envelope
+
+Change = namedtuple('Change', 'kind node path old new lines')
+
+# Layout and bookkeeping fields that never change behaviour (node ids are
+# only used for alignment; re-imports regenerate them)
+COSMETIC_NODE_KEYS = frozenset(['id', 'position', 'webhookId'])
+COSMETIC_WORKFLOW_KEYS = frozenset([
+    'updatedAt', 'createdAt', 'versionId', 'meta', 'pinData', 'staticData',
+    'shared', 'triggerCount', 'activeVersion', 'activeVersionId',
+    'nodes', 'connections', 'id',
+])
+
+
+def _strip(node):
+    return {k: v for k, v in node.items() if k not in COSMETIC_NODE_KEYS}
+
+
+def _diff_values(old, new, path, node, changes):
+    """Append Changes for every differing leaf between old and new"""
+    stack = [(old, new, path)]
+    while stack:
+        a, b, path = stack.pop()
+        if a == b:
+            continue
+        if isinstance(a, dict) and isinstance(b, dict):
+            for key in sorted(set(a) | set(b), key=str, reverse=True):
+                stack.append((a.get(key), b.get(key), f"{path}.{key}" if path else key))
+        elif isinstance(a, list) and isinstance(b, list) and a and b:
+            for i in reversed(range(max(len(a), len(b)))):
+                stack.append((a[i] if i < len(a) else None, b[i] if i < len(b) else None, f"{path}[{i}]"))
+        elif isinstance(a, str) and isinstance(b, str) and ('\n' in a or '\n' in b):
+            lines = list(difflib.unified_diff(a.splitlines(), b.splitlines(), lineterm='', n=2))[2:]
+            changes.append(Change('text-changed', node, path, None, None, lines))
+        else:
+            changes.append(Change('field-changed', node, path, a, b, None))
+
+
+def _edges(connections):
+    edges = set()
+    for source, outputs in (connections or {}).items():
+        for conn_type, slots in (outputs or {}).items():
+            for index, targets in enumerate(slots or []):
+                for target in targets or []:
+                    edges.add((source, conn_type, index, target.get('node'), target.get('index', 0)))
+    return edges
+
+
+def _align(old_nodes, new_nodes):
+    """Yield (old, new) node pairs; either side is None for adds/removes
+
+    Nodes are matched by id first, then by name among the nodes left over
+    (re-imported workflows get fresh node ids but keep their names).
+    """
+    new_by_id = {n['id']: i for i, n in enumerate(new_nodes) if n.get('id')}
+    pairs = [new_by_id.get(n.get('id')) if n.get('id') else None for n in old_nodes]
+    taken = {i for i in pairs if i is not None}
+    new_by_name = {}
+    for i, n in enumerate(new_nodes):
+        if i not in taken:
+            new_by_name.setdefault(n.get('name'), i)
+    for k, old in enumerate(old_nodes):
+        if pairs[k] is None:
+            i = new_by_name.pop(old.get('name'), None)
+            if i is not None:
+                pairs[k] = i
+                taken.add(i)
+    for old, i in zip(old_nodes, pairs):
+        yield old, (new_nodes[i] if i is not None else None)
+    for i, new in enumerate(new_nodes):
+        if i not in taken:
+            yield None, new
+
+
+def diff_workflows(old, new):
+    """Return a list of Changes between two workflow dicts"""
+    changes = []
+
+    for old_node, new_node in _align(old.get('nodes', []), new.get('nodes', [])):
+        if new_node is None:
+            changes.append(Change('node-removed', old_node.get('name'), '', old_node.get('type'), None, None))
+            continue
+        if old_node is None:
+            changes.append(Change('node-added', new_node.get('name'), '', None, new_node.get('type'), None))
+            continue
+        a, b = _strip(old_node), _strip(new_node)
+        if a == b:
+            continue
+        name = new_node.get('name')
+        if old_node.get('name') != name:
+            changes.append(Change('node-renamed', name, 'name', old_node.get('name'), name, None))
+            a.pop('name', None)
+            b.pop('name', None)
+        _diff_values(a, b, '', name, changes)
+
+    old_edges, new_edges = _edges(old.get('connections')), _edges(new.get('connections'))
+    for edge in sorted(old_edges - new_edges, key=str):
+        changes.append(Change('edge-removed', edge[0], f"{edge[1]}[{edge[2]}]", edge[3], None, None))
+    for edge in sorted(new_edges - old_edges, key=str):
+        changes.append(Change('edge-added', edge[0], f"{edge[1]}[{edge[2]}]", None, edge[3], None))
+
+    a = {k: v for k, v in old.items() if k not in COSMETIC_WORKFLOW_KEYS}
+    b = {k: v for k, v in new.items() if k not in COSMETIC_WORKFLOW_KEYS}
+    if a != b:
+        _diff_values(a, b, '', None, changes)
+    return changes
+
+
+def load_workflow(ref):
+    """Load a workflow from a path, or from REV:PATH via git show"""
+    path = Path(ref)
+    if path.exists():
+        with open(path) as f:
+            data = json.load(f)
+    elif ':' in ref:
+        output = subprocess.run(['git', 'show', ref], capture_output=True, text=True, check=True).stdout
+        data = json.loads(output)
+    else:
+        raise FileNotFoundError(ref)
+    workflow = unwrap_envelope(data)
+    if 'nodes' not in workflow and isinstance(workflow.get('workflow'), dict):
+        workflow = workflow['workflow']
+    return workflow
+
+
+def _index_dir(directory):
+    """Map file name -> (path, workflow) for the workflows in a directory"""
+    index = {}
+    for path in sorted(Path(directory).glob('*.json')):
+        try:
+            workflow = load_workflow(str(path))
+        except (ValueError, OSError):
+            continue
+        if isinstance(workflow.get('nodes'), list):
+            index[path.name] = (path, workflow)
+    return index
+
+
+def diff_dirs(old_dir, new_dir):
+    """Yield (label, changes) for every workflow that differs between dirs
+
+    Files are paired by name, then leftover files by workflow id so a
+    renamed backup file is still diffed against its previous version.
+    """
+    old_index, new_index = _index_dir(old_dir), _index_dir(new_dir)
+    pairs = [(name, name) for name in sorted(set(old_index) & set(new_index))]
+    old_left = {old_index[n][1].get('id') or n: n for n in old_index if n not in new_index}
+    new_left = {new_index[n][1].get('id') or n: n for n in new_index if n not in old_index}
+    for key in sorted(set(old_left) | set(new_left), key=str):
+        pairs.append((old_left.get(key), new_left.get(key)))
+
+    for old_name, new_name in pairs:
+        old_path, old = old_index.get(old_name, (None, {}))
+        new_path, new = new_index.get(new_name, (None, {}))
+        changes = diff_workflows(old, new)
+        if changes:
+            yield str(new_path or old_path), changes
+
+
+def format_change(change):
+    where = f"{change.node}" if change.node else "workflow"
+    if change.path:
+        where += f" {change.path}"
+    if change.kind == 'text-changed':
+        return '\n'.join([f"~ {where}:"] + [f"    {line}" for line in change.lines])
+    if change.kind in ('node-added', 'node-removed'):
+        sign = '+' if change.kind == 'node-added' else '-'
+        return f"{sign} node {change.node} ({change.new or change.old})"
+    if change.kind in ('edge-added', 'edge-removed'):
+        sign = '+' if change.kind == 'edge-added' else '-'
+        return f"{sign} edge {change.node} {change.path} -> {change.new or change.old}"
+    return f"~ {where}: {json.dumps(change.old)} -> {json.dumps(change.new)}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Structural diff of n8n workflows')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--format', choices=['text', 'json'], default='text')
+    args = parser.parse_args(argv)
+
+    try:
+        if Path(args.old).is_dir() and Path(args.new).is_dir():
+            results = list(diff_dirs(args.old, args.new))
+        else:
+            results = [(args.new, diff_workflows(load_workflow(args.old), load_workflow(args.new)))]
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(2)
+    results = [(label, changes) for label, changes in results if changes]
+
+    if args.format == 'json':
+        json.dump({label: [c._asdict() for c in changes] for label, changes in results}, sys.stdout, indent=2)
+        print()
+    else:
+        for label, changes in results:
+            print(f"=== {label}")
+            for change in changes:
+                print(format_change(change))
+
+    if results:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
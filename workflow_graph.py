@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Cross-workflow dependency index for the workflows/ backup directory.
+
+Records, per saved file, which workflows it calls (executeWorkflow and
+toolWorkflow nodes), which credentials it uses, and which error workflow
+it reports to. The per-file records are persisted in
+workflows/.workflow_graph.json and only re-parsed when a file's size or
+mtime changes (WorkflowWriter also updates them on every save); reverse
+maps are built once on load so every query is a dict lookup.
+
+Usage:
+  python3 workflow_graph.py callers <workflow id or name>
+  python3 workflow_graph.py credential <credential id or name>
+  python3 workflow_graph.py impact <workflow id or name>   # what breaks if archived
+  python3 workflow_graph.py build                          # refresh and print totals
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict, deque
+from pathlib import Path
+
+from workflow_io import WORKFLOWS_DIR, atomic_write_json, unwrap_envelope, workflow_key
+
+GRAPH_NAME = '.workflow_graph.json'
+CALL_NODE_TYPES = {
+    'n8n-nodes-base.executeWorkflow': 'executeWorkflow',
+    '@n8n/n8n-nodes-langchain.toolWorkflow': 'toolWorkflow',
+}
+
+
+def _workflow_ref(value):
+    """Target workflow id of a workflowId parameter (plain or resource locator)"""
+    if isinstance(value, dict):
+        value = value.get('value')
+    if not isinstance(value, str) or not value:
+        return None
+    return value
+
+
+def extract_dependencies(workflow):
+    """Return the graph record for one workflow"""
+    calls, credentials = [], []
+    for node in workflow.get('nodes', []):
+        kind = CALL_NODE_TYPES.get(node.get('type'))
+        params = node.get('parameters') or {}
+        if kind and params.get('source', 'database') == 'database':
+            target = _workflow_ref(params.get('workflowId'))
+            if target:
+                calls.append({'target': target, 'node': node.get('name'), 'kind': kind})
+        for cred_type, cred in (node.get('credentials') or {}).items():
+            if isinstance(cred, dict):
+                credentials.append({
+                    'type': cred_type,
+                    'id': cred.get('id'),
+                    'name': cred.get('name'),
+                    'node': node.get('name'),
+                })
+    return {
+        'key': workflow_key(workflow),
+        'name': workflow.get('name', ''),
+        'calls': calls,
+        'credentials': credentials,
+        'error_workflow': (workflow.get('settings') or {}).get('errorWorkflow'),
+    }
+
+
+def _load_workflow(path):
+    with open(path) as f:
+        workflow = unwrap_envelope(json.load(f))
+    if 'nodes' not in workflow and isinstance(workflow.get('workflow'), dict):
+        workflow = workflow['workflow']
+    return workflow if isinstance(workflow.get('nodes'), list) else None
+
+
+class WorkflowGraph:
+    """Persisted per-file dependency records plus in-memory reverse maps"""
+
+    def __init__(self, workflows_dir=WORKFLOWS_DIR):
+        self.workflows_dir = Path(workflows_dir)
+        self.path = self.workflows_dir / GRAPH_NAME
+        self.files = {}
+        try:
+            with open(self.path) as f:
+                self.files = json.load(f).get('files', {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        self._dirty = False
+        self._reverse = None
+
+    def refresh(self):
+        """Re-parse files that changed on disk; returns how many were re-read"""
+        seen, reparsed = set(), 0
+        for path in self.workflows_dir.glob('*.json'):
+            if path.name.startswith('.'):
+                continue
+            seen.add(path.name)
+            st = path.stat()
+            record = self.files.get(path.name)
+            if record and record.get('mtime_ns') == st.st_mtime_ns and record.get('size') == st.st_size:
+                continue
+            try:
+                workflow = _load_workflow(path)
+            except (OSError, ValueError):
+                workflow = None
+            self._set(path.name, workflow, st)
+            reparsed += 1
+        for name in set(self.files) - seen:
+            del self.files[name]
+            self._dirty = True
+        return reparsed
+
+    def update(self, path, workflow):
+        """Record a workflow that was just written to path"""
+        path = Path(path)
+        self._set(path.name, workflow, path.stat())
+
+    def remove(self, filename):
+        """Forget a file that was deleted, or whose workflow was deleted upstream
+
+        A file still on disk keeps a keyless record for its current size and
+        mtime, so refresh() doesn't bring it back until it changes.
+        """
+        path = self.workflows_dir / filename
+        if path.exists():
+            st = path.stat()
+            self.files[filename] = {'key': None, 'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+        elif self.files.pop(filename, None) is None:
+            return
+        self._dirty = True
+        self._reverse = None
+
+    def _set(self, filename, workflow, st):
+        record = extract_dependencies(workflow) if workflow else {'key': None}
+        record.update({'mtime_ns': st.st_mtime_ns, 'size': st.st_size})
+        self.files[filename] = record
+        self._dirty = True
+        self._reverse = None
+
+    def save(self):
+        if self._dirty:
+            atomic_write_json(self.path, {'files': self.files})
+            self._dirty = False
+
+    @property
+    def reverse(self):
+        """Lazily built lookup tables keyed by workflow / credential"""
+        if self._reverse is None:
+            callers = defaultdict(list)
+            cred_users = defaultdict(list)
+            error_users = defaultdict(list)
+            names = defaultdict(set)
+            labels = {}
+            for filename, record in self.files.items():
+                key = record.get('key')
+                if not key:
+                    continue
+                names[record['name']].add(key)
+                names[key].add(key)
+                labels[key] = record['name']
+                for call in record['calls']:
+                    callers[call['target']].append({'caller': key, 'file': filename, **call})
+                for cred in record['credentials']:
+                    use = {'workflow': key, 'file': filename, **cred}
+                    for cred_key in {cred['id'], cred['name']} - {None}:
+                        cred_users[cred_key].append(use)
+                if record['error_workflow']:
+                    error_users[record['error_workflow']].append({'workflow': key, 'file': filename})
+            self._reverse = {
+                'callers': callers,
+                'credentials': cred_users,
+                'error_handlers': error_users,
+                'names': names,
+                'labels': labels,
+            }
+        return self._reverse
+
+    def label(self, key):
+        name = self.reverse['labels'].get(key)
+        return f"{name} ({key})" if name else key
+
+    def resolve(self, ref):
+        """Workflow ids matching an id or a workflow name"""
+        return self.reverse['names'].get(ref) or {ref}
+
+    def callers(self, ref):
+        return [c for key in self.resolve(ref) for c in self.reverse['callers'].get(key, [])]
+
+    def credential_users(self, ref):
+        return self.reverse['credentials'].get(ref, [])
+
+    def impact(self, ref):
+        """Everything affected if ref is archived: direct and transitive callers
+        plus workflows that use it as their error workflow"""
+        direct = self.resolve(ref)
+        affected, queue = {}, deque(direct)
+        seen = set(direct)
+        while queue:
+            key = queue.popleft()
+            for call in self.reverse['callers'].get(key, []):
+                caller = call['caller']
+                reason = f"{call['kind']} via '{call['node']}' -> {key}"
+                reasons = affected.setdefault(caller, [])
+                if reason not in reasons:
+                    reasons.append(reason)
+                if caller not in seen:
+                    seen.add(caller)
+                    queue.append(caller)
+            for use in self.reverse['error_handlers'].get(key, []):
+                reasons = affected.setdefault(use['workflow'], [])
+                if f"errorWorkflow -> {key}" not in reasons:
+                    reasons.append(f"errorWorkflow -> {key}")
+        return affected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Query the cross-workflow dependency index')
+    parser.add_argument('--dir', default=str(WORKFLOWS_DIR))
+    parser.add_argument('--format', choices=['text', 'json'], default='text')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in [('callers', 'workflows that call a workflow'),
+                            ('credential', 'workflows that use a credential'),
+                            ('impact', 'what breaks if a workflow is archived')]:
+        sub.add_parser(name, help=help_text).add_argument('ref')
+    sub.add_parser('build', help='refresh the index')
+    args = parser.parse_args(argv)
+
+    graph = WorkflowGraph(args.dir)
+    reparsed = graph.refresh()
+    graph.save()
+
+    if args.command == 'build':
+        result = {'files': len(graph.files), 'reparsed': reparsed}
+    elif args.command == 'callers':
+        result = graph.callers(args.ref)
+    elif args.command == 'credential':
+        result = graph.credential_users(args.ref)
+    else:
+        result = graph.impact(args.ref)
+
+    if args.format == 'json':
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    elif args.command == 'build':
+        print(f"{result['files']} files indexed, {result['reparsed']} re-parsed")
+    elif args.command == 'callers':
+        for c in result:
+            print(f"{graph.label(c['caller'])} [{c['file']}]: {c['kind']} node '{c['node']}'")
+    elif args.command == 'credential':
+        for u in result:
+            print(f"{graph.label(u['workflow'])} [{u['file']}]: {u['type']} on node '{u['node']}'")
+    else:
+        for key, reasons in result.items():
+            print(f"{graph.label(key)}:")
+            for reason in reasons:
+                print(f"  {reason}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Shared workflow file I/O for the backup and save scripts.
+
+Every script that writes workflows/*.json goes through this module so the
+same workflow name always maps to the same file:
+
+  - sanitize_filename(): the one filename mapper (precompiled, memoized)
+  - unwrap_envelope(): the one {success, data} API response unwrapper
+  - WorkflowIndex: ID-keyed index of saved files, persisted in
+    workflows/.workflow_list_backup.json; two workflows whose names
+    sanitize to the same filename get distinct files instead of
+    overwriting each other, and a renamed workflow moves its file.
+    Workflows missing from the index are matched to files already in
+    the directory (by ID) so they keep their existing file
+  - WorkflowWriter: atomic temp-file + rename writes that skip files whose
+    content hash is unchanged and only create each directory once
+  - iter_json_items() / save_stream(): parse a JSON array or NDJSON stream
+    one workflow at a time and hand each to a small writer pool, so batch
+    saves hold about one workflow in memory and report per-item errors
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+WORKFLOWS_DIR = Path(__file__).parent / 'workflows'
+MANIFEST_NAME = '.workflow_list_backup.json'
+# Bumped by n8n on every save even when nothing else changed
+VOLATILE_KEYS = ('updatedAt', 'versionId')
+
+_UNSAFE_CHARS = re.compile(r'[^a-z0-9]+')
+_UNSAFE_KEY_CHARS = re.compile(r'[^A-Za-z0-9_-]+')
+_ARRAY_SEPARATORS = re.compile(r'[\s,]*')
+_DECODER = json.JSONDecoder()
+
+
+@lru_cache(maxsize=4096)
+def sanitize_filename(name):
+    """Lowercase name with every run of non-alphanumerics collapsed to '-'"""
+    if not name:
+        return "unknown"
+    return _UNSAFE_CHARS.sub('-', name.lower()).strip('-') or "unknown"
+
+
+def workflow_key(workflow):
+    """Index key: the n8n ID, or the sanitized name for local-only files"""
+    return workflow.get('id') or f"name-{sanitize_filename(workflow.get('name'))}"
+
+
+def unwrap_envelope(payload):
+    """Return the workflow from an API response or a bare workflow dict
+
+    Raises ValueError for failed responses ({success: false, error: ...})
+    and for payloads that are not a workflow object.
+    """
+    if isinstance(payload, dict) and 'success' in payload:
+        if not payload.get('success') or not isinstance(payload.get('data'), dict):
+            raise ValueError(payload.get('error') or 'No data or success false')
+        return payload['data']
+    if isinstance(payload, dict) and isinstance(payload.get('data'), dict):
+        return payload['data']
+    if not isinstance(payload, dict):
+        raise ValueError(f"Expected a workflow object, got {type(payload).__name__}")
+    return payload
+
+
+def canonical_json(obj):
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def content_hash(workflow):
+    """SHA-256 of the workflow's canonical JSON, ignoring volatile keys"""
+    stable = {k: v for k, v in workflow.items() if k not in VOLATILE_KEYS}
+    return hashlib.sha256(canonical_json(stable).encode('utf-8')).hexdigest()
+
+
+def atomic_write_text(path, text):
+    """Write text to path via a temp file in the same directory + rename"""
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+
+def atomic_write_json(path, obj):
+    return atomic_write_text(path, json.dumps(obj, indent=2))
+
+
+def summary_entry(wf):
+    entry = {
+        'id': workflow_key(wf),
+        'name': wf.get('name', ''),
+        'active': wf.get('active', False),
+        'isArchived': wf.get('isArchived', False),
+        'updatedAt': wf.get('updatedAt', ''),
+    }
+    # Summaries without nodes keep the count recorded from the last full fetch
+    if 'nodeCount' in wf or 'nodes' in wf:
+        entry['nodeCount'] = wf.get('nodeCount', len(wf.get('nodes', [])))
+    return entry
+
+
+class WorkflowIndex:
+    """ID -> saved file index backed by the workflow list manifest"""
+
+    def __init__(self, workflows_dir=WORKFLOWS_DIR):
+        self.workflows_dir = Path(workflows_dir)
+        self.path = self.workflows_dir / MANIFEST_NAME
+        self.entries = {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.entries = {wf['id']: wf for wf in data.get('workflows', []) if wf.get('id')}
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        self.by_file = {e['file']: key for key, e in self.entries.items() if e.get('file')}
+        self._seeded = False
+
+    def _seed(self):
+        """Index workflow files on disk that no entry points at (once, on the first miss)"""
+        self._seeded = True
+        found = {}
+        for path in sorted(self.workflows_dir.glob('*.json')):
+            if path.name in self.by_file:
+                continue
+            try:
+                with open(path) as f:
+                    workflow = unwrap_envelope(json.load(f))
+            except (OSError, ValueError):
+                continue
+            key = workflow_key(workflow)
+            self.by_file.setdefault(path.name, key)
+            # Several copies of one workflow: prefer the file named after it
+            if key not in found or path.stem.lower() == sanitize_filename(workflow.get('name')):
+                found[key] = (path.name, workflow.get('name', ''))
+        for key, (filename, name) in found.items():
+            if key not in self.entries:
+                self.entries[key] = {'id': key, 'name': name, 'file': filename}
+                self.by_file[filename] = key
+
+    def get(self, key):
+        if key not in self.entries and not self._seeded:
+            self._seed()
+        return self.entries.get(key)
+
+    def retain(self, keys):
+        """Drop entries not in keys (after an authoritative full listing); returns their files"""
+        keys = set(keys)
+        dropped = [e['file'] for k, e in self.entries.items() if k not in keys and e.get('file')]
+        self.entries = {k: e for k, e in self.entries.items() if k in keys}
+        self.by_file = {f: k for f, k in self.by_file.items() if k in keys}
+        return dropped
+
+    def is_unchanged(self, summary):
+        """True if the index already has this exact updatedAt on disk"""
+        entry = self.entries.get(workflow_key(summary))
+        return bool(
+            entry and entry.get('sha256') and entry.get('file')
+            and summary.get('updatedAt') and entry.get('updatedAt') == summary['updatedAt']
+            and (self.workflows_dir / entry['file']).exists()
+        )
+
+    def update_summary(self, summary):
+        key = workflow_key(summary)
+        self.entries[key] = {**self.entries.get(key, {}), **summary_entry(summary)}
+
+    def filename_for(self, workflow, name=None, filename=None):
+        """Collision-safe filename for workflow (name/filename override the default)"""
+        key = workflow_key(workflow)
+        entry = self.get(key)
+        if not filename and not name and entry and entry.get('file') \
+                and entry.get('name') == workflow.get('name') and (self.workflows_dir / entry['file']).exists():
+            # Not renamed: keep the existing file, whatever mapper named it
+            return entry['file']
+        if not filename:
+            filename = sanitize_filename(name or workflow.get('name'))
+            if filename == "unknown":
+                filename = f"workflow-{workflow.get('id', 'unknown')}"
+        candidate = f"{filename}.json"
+        owner = self.by_file.get(candidate)
+        if owner is not None and owner != key:
+            candidate = f"{filename}-{_UNSAFE_KEY_CHARS.sub('-', key)}.json"
+        return candidate
+
+    def record(self, workflow, filename, digest):
+        """Point workflow's entry at filename; returns the file it replaced"""
+        key = workflow_key(workflow)
+        entry = self.entries.get(key, {})
+        previous = entry.get('file')
+        self.entries[key] = {**entry, **summary_entry(workflow), 'sha256': digest, 'file': filename}
+        self.by_file[filename] = key
+        if previous and previous != filename and self.by_file.get(previous) == key:
+            del self.by_file[previous]
+            return previous
+        return None
+
+    def save(self):
+        self.workflows_dir.mkdir(parents=True, exist_ok=True)
+        return atomic_write_json(self.path, {
+            'backup_date': datetime.now().isoformat(),
+            'total_workflows': len(self.entries),
+            'workflows': list(self.entries.values()),
+        })
+
+
+class WorkflowWriter:
+    """Saves workflows into one directory, updating a shared index
+
+    Safe to share between threads. Call close() (or use as a context
+    manager) to persist the index.
+    """
+
+    def __init__(self, workflows_dir=WORKFLOWS_DIR, index=None, store=None, graph=None):
+        self.workflows_dir = Path(workflows_dir)
+        self.index = index or WorkflowIndex(self.workflows_dir)
+        self.store = store
+        self.graph = graph
+        self._dir_ready = False
+        self._lock = threading.Lock()
+
+    def save(self, payload, name=None, filename=None, force=False):
+        """Save one workflow; returns (path, written)
+
+        payload may be an API envelope or a bare workflow. The file is only
+        rewritten if its content hash differs from the index (or force).
+        """
+        workflow = unwrap_envelope(payload)
+        key = workflow_key(workflow)
+        digest = content_hash(workflow)
+
+        with self._lock:
+            target = self.index.filename_for(workflow, name, filename)
+            path = self.workflows_dir / target
+            entry = self.index.get(key) or {}
+            if not force and entry.get('sha256') == digest and entry.get('file') == target and path.exists():
+                return path, False
+            if not self._dir_ready:
+                self.workflows_dir.mkdir(parents=True, exist_ok=True)
+                self._dir_ready = True
+            # Reserve the name so a concurrent save can't pick the same file
+            self.index.by_file.setdefault(target, key)
+
+        atomic_write_json(path, workflow)
+
+        with self._lock:
+            replaced = self.index.record(workflow, target, digest)
+            if replaced:
+                # The workflow was renamed; don't leave its old file behind
+                (self.workflows_dir / replaced).unlink(missing_ok=True)
+                if self.graph is not None:
+                    self.graph.remove(replaced)
+            if self.store is not None and 'nodes' in workflow:
+                self.store.save(workflow)
+            if self.graph is not None:
+                self.graph.update(path, workflow)
+        return path, True
+
+    def close(self):
+        self.index.save()
+        if self.graph is not None:
+            self.graph.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def save_workflow(payload, workflows_dir=WORKFLOWS_DIR, name=None, store=None, graph=None):
+    """Save a single workflow and persist the index; returns (workflow, path)"""
+    with WorkflowWriter(workflows_dir, store=store, graph=graph) as writer:
+        path, _ = writer.save(payload, name=name)
+    return unwrap_envelope(payload), path
+
+
+def _iter_array(buf, stream, chunk_size):
+    """Yield (label, item, error) for each element of a streamed JSON array"""
+    pos, count, eof = 0, 0, False
+    while True:
+        pos = _ARRAY_SEPARATORS.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        if pos < len(buf):
+            try:
+                item, end = _DECODER.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if eof:
+                    # No way to resync inside a malformed array
+                    yield f"item {count + 1}", None, e
+                    return
+            else:
+                count += 1
+                yield f"item {count}", item, None
+                buf, pos = buf[end:], 0
+                continue
+        elif eof:
+            yield f"item {count + 1}", None, ValueError('Unterminated JSON array')
+            return
+        # Need more input: grow geometrically so re-parsing a large item stays linear
+        chunk = stream.read(max(chunk_size, len(buf) - pos))
+        buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+
+
+def iter_json_items(stream, chunk_size=1 << 16):
+    """Yield (label, item, error) for each value in a text stream
+
+    Accepts a top-level JSON array (parsed element by element), NDJSON
+    (one value per line; a bad line is reported and skipped), or a single
+    pretty-printed document.
+    """
+    first = stream.readline()
+    while first and not first.strip():
+        first = stream.readline()
+    if not first:
+        return
+    head = first.lstrip()
+    if head.startswith('['):
+        yield from _iter_array(head[1:], stream, chunk_size)
+        return
+
+    try:
+        yield "line 1", json.loads(first), None
+    except json.JSONDecodeError as e:
+        if head.startswith('{'):
+            # Not NDJSON: one document spread over several lines
+            text = first + stream.read()
+            try:
+                yield "item 1", json.loads(text), None
+            except json.JSONDecodeError as e:
+                yield "item 1", None, e
+            return
+        yield "line 1", None, e
+
+    for lineno, line in enumerate(stream, 2):
+        if line.strip():
+            try:
+                yield f"line {lineno}", json.loads(line), None
+            except json.JSONDecodeError as e:
+                yield f"line {lineno}", None, e
+
+
+def save_stream(stream, writer, workers=4):
+    """Save each workflow from a JSON array / NDJSON stream as soon as it parses
+
+    Yields (label, workflow, path, written, error) in input order. At most
+    2 * workers parsed workflows are held in memory at once, and an invalid
+    item only fails that item.
+    """
+    pending = deque()
+
+    def save_one(payload):
+        workflow = unwrap_envelope(payload)
+        return (workflow,) + writer.save(workflow)
+
+    def result(label, future, error):
+        try:
+            if error:
+                raise error
+            workflow, path, written = future.result()
+        except (ValueError, OSError) as e:
+            return label, None, None, False, e
+        return label, workflow, path, written, None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for label, payload, error in iter_json_items(stream):
+            future = None if error else pool.submit(save_one, payload)
+            pending.append((label, future, error))
+            while len(pending) > 2 * workers:
+                yield result(*pending.popleft())
+        while pending:
+            yield result(*pending.popleft())
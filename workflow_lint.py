@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Lint n8n workflow JSON files.
+
+Walks every node with an explicit stack (no recursion) and only builds the
+human-readable path of a field when a rule actually fires. Rules are
+registered with @rule and come in two kinds:
+
+  - field rules: called with (key, value) for every dict entry in a node
+  - workflow rules: called once with the whole workflow, yield (path, message)
+
+Usage:
+  python3 workflow_lint.py [FILE ...]          # default: workflows/*.json
+  python3 workflow_lint.py --format json       # machine-readable output
+  python3 workflow_lint.py --rules empty-key,empty-value
+
+Exits 1 if any error-severity issue is found.
+"""
+import argparse
+import json
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from workflow_io import WORKFLOWS_DIR, unwrap_envelope
+
+Issue = namedtuple('Issue', 'file rule severity path message')
+Rule = namedtuple('Rule', 'name kind severity check')
+
+RULES = {}
+
+# Empty strings are legitimate for these keys
+ALLOWED_EMPTY = frozenset(['description', 'notes', 'text', 'value'])
+
+# Node types that can legitimately return zero items (an empty query result,
+# a search with no hits, everything filtered out). Without alwaysOutputData
+# such a node silently stops the branch below it. Triggers, webhooks and
+# plain transform nodes always emit what they receive, so they are not listed.
+ZERO_ITEM_TYPES = frozenset([
+    'n8n-nodes-base.filter',
+    'n8n-nodes-base.gmail',
+    'n8n-nodes-base.httpRequest',
+    'n8n-nodes-base.postgres',
+    'n8n-nodes-base.supabase',
+])
+
+# Below this many files, forking worker processes costs more than it saves
+PARALLEL_THRESHOLD = 16
+
+
+def rule(name, kind='workflow', severity='warning'):
+    """Register a lint rule under name"""
+    def register(check):
+        RULES[name] = Rule(name, kind, severity, check)
+        return check
+    return register
+
+
+@rule('empty-key', kind='field', severity='error')
+def check_empty_key(key, value):
+    if key == "":
+        return "Empty field name"
+
+
+@rule('empty-value', kind='field')
+def check_empty_value(key, value):
+    if value == "" and key not in ALLOWED_EMPTY:
+        return f"Empty string value for '{key}'"
+
+
+def _main_targets(connections):
+    """Yield (source, output_index, target_node) for every 'main' edge"""
+    for source, outputs in connections.items():
+        for output_index, targets in enumerate((outputs or {}).get('main') or []):
+            for target in targets or []:
+                yield source, output_index, target.get('node')
+
+
+@rule('missing-always-output-data')
+def check_always_output_data(workflow):
+    sources = {source for source, _, _ in _main_targets(workflow.get('connections') or {})}
+    for i, node in enumerate(workflow.get('nodes', [])):
+        if (node.get('type') in ZERO_ITEM_TYPES and node.get('name') in sources
+                and not node.get('alwaysOutputData')):
+            yield f"nodes[{i}].{node.get('name', 'unnamed')}", \
+                "Node can return zero items and feeds downstream nodes, but alwaysOutputData is not set"
+
+
+@rule('dangling-connection', severity='error')
+def check_dangling_connections(workflow):
+    names = {node.get('name') for node in workflow.get('nodes', [])}
+    connections = workflow.get('connections') or {}
+    for source in connections:
+        if source not in names:
+            yield f"connections.{source}", f"Connection source '{source}' is not a node"
+    for source, output_index, target in _main_targets(connections):
+        if target not in names:
+            yield f"connections.{source}.main[{output_index}]", \
+                f"Connection target '{target}' is not a node"
+
+
+@rule('unset-error-workflow')
+def check_error_workflow(workflow):
+    if not (workflow.get('settings') or {}).get('errorWorkflow'):
+        yield "settings.errorWorkflow", "No error workflow configured"
+
+
+def _format_path(link):
+    """Turn a (parent, key) linked path into 'a.b[0].c'"""
+    parts = []
+    while link is not None:
+        link, key = link
+        parts.append(f"[{key}]" if isinstance(key, int) else f".{key}")
+    return ''.join(reversed(parts)).lstrip('.')
+
+
+def lint_workflow(workflow, filename='<stdin>', rules=None):
+    """Run rules (default: all) over one workflow and return a list of Issues"""
+    rules = [RULES[name] for name in rules] if rules else list(RULES.values())
+    field_rules = [r for r in rules if r.kind == 'field']
+    issues = []
+
+    if field_rules:
+        for i, node in enumerate(workflow.get('nodes', [])):
+            root = ((None, 'nodes'), i)
+            stack = [(node, (root, node.get('name', 'unnamed')) if isinstance(node, dict) else root)]
+            while stack:
+                obj, link = stack.pop()
+                if isinstance(obj, dict):
+                    for key, value in obj.items():
+                        for r in field_rules:
+                            message = r.check(key, value)
+                            if message:
+                                path = _format_path((link, key) if key else link)
+                                issues.append(Issue(filename, r.name, r.severity, path, message))
+                        if isinstance(value, (dict, list)):
+                            stack.append((value, (link, key)))
+                else:
+                    for j, item in enumerate(obj):
+                        if isinstance(item, (dict, list)):
+                            stack.append((item, (link, j)))
+
+    for r in rules:
+        if r.kind == 'workflow':
+            for path, message in r.check(workflow):
+                issues.append(Issue(filename, r.name, r.severity, path, message))
+    return issues
+
+
+def load_workflow(path):
+    """Read a workflow file; returns None for JSON that is not a workflow"""
+    with open(path) as f:
+        data = json.load(f)
+    try:
+        workflow = unwrap_envelope(data)
+    except ValueError:
+        return None
+    if 'nodes' not in workflow and isinstance(workflow.get('workflow'), dict):
+        workflow = workflow['workflow']
+    return workflow if isinstance(workflow.get('nodes'), list) else None
+
+
+def lint_file(path, rules=None):
+    try:
+        workflow = load_workflow(path)
+    except (OSError, json.JSONDecodeError) as e:
+        return [Issue(str(path), 'invalid-json', 'error', '', str(e))]
+    if workflow is None:
+        return []
+    return lint_workflow(workflow, str(path), rules)
+
+
+def _lint_file_job(args):
+    return lint_file(*args)
+
+
+def lint_files(paths, rules=None, jobs=None):
+    """Lint many files, across processes when there are enough of them"""
+    jobs_args = [(str(p), rules) for p in paths]
+    if jobs == 1 or len(jobs_args) < PARALLEL_THRESHOLD:
+        results = map(_lint_file_job, jobs_args)
+        return [issue for issues in results for issue in issues]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(_lint_file_job, jobs_args, chunksize=4)
+        return [issue for issues in results for issue in issues]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lint n8n workflow JSON files')
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--format', choices=['text', 'json'], default='text')
+    parser.add_argument('--rules', help=f"comma-separated subset of: {', '.join(RULES)}")
+    parser.add_argument('--jobs', type=int, help='worker processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    rules = args.rules.split(',') if args.rules else None
+    unknown = [name for name in rules or [] if name not in RULES]
+    if unknown:
+        parser.error(f"unknown rule(s): {', '.join(unknown)}")
+
+    paths = args.files or sorted(WORKFLOWS_DIR.glob('*.json'))
+    issues = lint_files(paths, rules, args.jobs)
+
+    if args.format == 'json':
+        json.dump([issue._asdict() for issue in issues], sys.stdout, indent=2)
+        print()
+    else:
+        for issue in issues:
+            print(f"{issue.file}: {issue.severity}: {issue.path}: {issue.message} [{issue.rule}]")
+        print(f"{len(issues)} issue(s) in {len(paths)} file(s)", file=sys.stderr)
+
+    if any(issue.severity == 'error' for issue in issues):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
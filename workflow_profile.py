@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Per-node execution profiler for n8n workflows.
+
+Reads n8n execution records (GET /api/v1/executions/{id}?includeData=true,
+a list of them, or the flatted `data` column of an execution_data export)
+and attributes wall time and output item counts to every node. Sub-node
+time (chat models, tools) is subtracted from the agent that called it, so
+nothing is counted twice.
+
+The critical path is the longest chain through the workflow's main
+`connections`, weighted by each node's mean time per execution. n8n's v1
+executor runs branches one after another, so wall time is roughly the sum
+of all node times; the critical path is what would remain if every
+independent branch ran in parallel.
+
+A local fixture format is accepted for tests and what-if estimates
+(the workflow path may be relative to the fixture file):
+  {"workflow": "../workflows/parallelized-onboarding-supabase.json",
+   "expect_critical_path": ["Supabase OAuth Webhook", ...],
+   "executions": [{"id": "before", "runs": {
+       "Filter and Score Emails": [{"ms": 260000, "items": 60}],
+       "Convert To Readable Email": [{"ms": 2400, "items": 60}]}}]}
+
+fixtures/onboarding_execution.json holds two existing-user onboarding
+runs; --check exits 1 unless the computed critical path matches each
+fixture's expect_critical_path.
+
+Usage:
+  python3 workflow_profile.py EXECUTION.json [...] [--workflow FILE]
+  python3 workflow_profile.py fixtures/onboarding_execution.json --check
+  N8N_API_KEY=... python3 workflow_profile.py --execution 1234 --execution 1235
+  python3 workflow_profile.py EXECUTION.json --format collapsed > onboarding.folded
+      # flamegraph.pl onboarding.folded > onboarding.svg  (or load in speedscope)
+"""
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict, deque, namedtuple
+from datetime import datetime
+from pathlib import Path
+
+from workflow_io import unwrap_envelope
+
+NodeRun = namedtuple('NodeRun', 'node start ms items status')
+Execution = namedtuple('Execution', 'id runs workflow wall_ms edges')
+
+
+def _unflatten(text):
+    """Decode the `flatted` serialization n8n uses for stored execution data"""
+    values = json.loads(text)
+    revived = set()
+
+    def revive(index):
+        value = values[index]
+        if isinstance(value, (dict, list)) and index not in revived:
+            revived.add(index)
+            keys = value.keys() if isinstance(value, dict) else range(len(value))
+            for key in keys:
+                if isinstance(value[key], str):
+                    value[key] = revive(int(value[key]))
+        return value
+
+    return revive(0)
+
+
+def _parse_time(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000
+        except ValueError:
+            return None
+    return None
+
+
+def _count_items(data):
+    return sum(len(output or []) for outputs in (data or {}).values() for output in outputs or [])
+
+
+def _load_workflow_file(path):
+    with open(path) as f:
+        return unwrap_envelope(json.load(f))
+
+
+def _from_execution(record):
+    """Execution from an n8n API execution record"""
+    data = record.get('data') or {}
+    if isinstance(data, str):
+        data = _unflatten(data)
+    run_data = (data.get('resultData') or {}).get('runData') or {}
+    runs, edges = [], set()
+    for node, node_runs in run_data.items():
+        for run in node_runs or []:
+            runs.append(NodeRun(
+                node,
+                run.get('startTime'),
+                float(run.get('executionTime') or 0),
+                _count_items(run.get('data')),
+                run.get('executionStatus') or ('error' if run.get('error') else 'success'),
+            ))
+            for source in run.get('source') or []:
+                if source and source.get('previousNode'):
+                    edges.add((source['previousNode'], node))
+    started, stopped = _parse_time(record.get('startedAt')), _parse_time(record.get('stoppedAt'))
+    if started is not None and stopped is not None:
+        wall_ms = stopped - started
+    else:
+        starts = [r.start for r in runs if r.start is not None]
+        ends = [r.start + r.ms for r in runs if r.start is not None]
+        wall_ms = max(ends) - min(starts) if starts else sum(r.ms for r in runs)
+    return Execution(str(record.get('id', '')), runs, record.get('workflowData'), wall_ms, edges)
+
+
+def _from_fixture(record, workflow):
+    runs = [
+        NodeRun(node, run.get('start'), float(run.get('ms', 0)), int(run.get('items', 0)),
+                run.get('status', 'success'))
+        for node, node_runs in record['runs'].items() for run in node_runs
+    ]
+    # Without a recorded wall time, Profile uses the execution's node time
+    return Execution(str(record.get('id', '')), runs, workflow, record.get('wall_ms'), set())
+
+
+def load_executions(path):
+    """Return the Executions recorded in a file (any supported format)"""
+    with open(path) as f:
+        data = json.load(f)
+
+    if isinstance(data, dict) and ('runs' in data or 'executions' in data):
+        workflow = None
+        if data.get('workflow'):
+            workflow_path = Path(data['workflow'])
+            if not workflow_path.is_absolute() and not workflow_path.exists():
+                workflow_path = Path(path).parent / workflow_path
+            workflow = _load_workflow_file(workflow_path)
+        records = data.get('executions') or [data]
+        return [_from_fixture(r, workflow) for r in records]
+
+    if isinstance(data, dict) and 'success' in data:
+        data = unwrap_envelope(data)
+    if isinstance(data, dict) and isinstance(data.get('data'), list):
+        data = data['data']  # GET /executions list response
+    records = data if isinstance(data, list) else [data]
+    return [_from_execution(r) for r in records]
+
+
+def expected_critical_path(path):
+    """A fixture's expect_critical_path node list, or None"""
+    with open(path) as f:
+        data = json.load(f)
+    return data.get('expect_critical_path') if isinstance(data, dict) else None
+
+
+def fetch_executions(client, ids):
+    return [_from_execution(client.get_json(f"/api/v1/executions/{eid}", {'includeData': 'true'}))
+            for eid in ids]
+
+
+class Profile:
+    """Aggregated per-node timings over one or more executions of a workflow"""
+
+    def __init__(self, executions, workflow=None):
+        self.executions = executions
+        self.workflow = workflow or next((e.workflow for e in executions if e.workflow), None)
+        self.main_edges, self.sub_parents = self._edges()
+        self._aggregate()
+
+    def _edges(self):
+        """(main edge set, sub-node -> parent node) from connections or run sources"""
+        if not self.workflow:
+            return set().union(*(e.edges for e in self.executions)), {}
+        main, parents = set(), {}
+        for source, outputs in (self.workflow.get('connections') or {}).items():
+            for conn_type, slots in (outputs or {}).items():
+                for targets in slots or []:
+                    for target in targets or []:
+                        if conn_type == 'main':
+                            main.add((source, target['node']))
+                        else:
+                            # ai_languageModel / ai_tool / ...: source runs inside target
+                            parents.setdefault(source, target['node'])
+        return main, parents
+
+    def _aggregate(self):
+        count = len(self.executions) or 1
+        stats = {}
+        wall_ms = 0.0
+        for execution in self.executions:
+            sub_ms = defaultdict(float)
+            for run in execution.runs:
+                if run.node in self.sub_parents:
+                    sub_ms[self.sub_parents[run.node]] += run.ms
+            for run in execution.runs:
+                s = stats.setdefault(run.node, {
+                    'node': run.node, 'runs': 0, 'total_ms': 0.0, 'self_ms': 0.0,
+                    'max_ms': 0.0, 'items': 0, 'errors': 0,
+                })
+                s['runs'] += 1
+                s['total_ms'] += run.ms
+                s['max_ms'] = max(s['max_ms'], run.ms)
+                s['items'] += run.items
+                s['errors'] += run.status not in ('success', 'running')
+            for node, ms in sub_ms.items():
+                if node in stats:
+                    stats[node]['self_ms'] -= ms
+            if execution.wall_ms is None:
+                wall_ms += sum(r.ms for r in execution.runs if r.node not in self.sub_parents)
+            else:
+                wall_ms += execution.wall_ms
+        node_total = 0.0
+        for s in stats.values():
+            s['self_ms'] = max(0.0, s['self_ms'] + s['total_ms'])
+            s['mean_ms'] = s['total_ms'] / count
+            node_total += s['self_ms']
+        for s in stats.values():
+            s['share'] = s['self_ms'] / node_total if node_total else 0.0
+        self.nodes = stats
+        self.node_ms = node_total / count
+        self.wall_ms = wall_ms / count
+
+    def _forward_graph(self):
+        """Adjacency over executed nodes with loop back-edges removed"""
+        executed = set(self.nodes) - set(self.sub_parents)
+        children = defaultdict(list)
+        indegree = defaultdict(int)
+        for a, b in sorted(self.main_edges):
+            if a in executed and b in executed:
+                children[a].append(b)
+                indegree[b] += 1
+        roots = sorted(n for n in executed if not indegree[n]) or sorted(executed)[:1]
+
+        # Iterative DFS; an edge to a node still on the stack closes a loop
+        state, forward = {}, defaultdict(list)
+        for root in roots:
+            if root in state:
+                continue
+            stack = [(root, iter(children[root]))]
+            state[root] = 'open'
+            while stack:
+                node, it = stack[-1]
+                child = next(it, None)
+                if child is None:
+                    state[node] = 'done'
+                    stack.pop()
+                elif state.get(child) != 'open':
+                    forward[node].append(child)
+                    if child not in state:
+                        state[child] = 'open'
+                        stack.append((child, iter(children[child])))
+        return roots, forward
+
+    def critical_path(self):
+        """(nodes, mean ms) of the heaviest path through main connections"""
+        roots, forward = self._forward_graph()
+        weight = {n: s['self_ms'] / (len(self.executions) or 1) for n, s in self.nodes.items()}
+        for sub, parent in self.sub_parents.items():
+            if sub in weight and parent in weight:
+                weight[parent] += weight[sub]
+
+        order, seen = [], set()
+        for root in roots:
+            stack = [(root, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if expanded:
+                    order.append(node)
+                elif node not in seen:
+                    seen.add(node)
+                    stack.append((node, True))
+                    stack.extend((child, False) for child in forward[node])
+        best, nxt = {}, {}
+        for node in order:  # post-order: children first
+            tail = max(forward[node], key=lambda c: best[c], default=None)
+            best[node] = weight.get(node, 0.0) + (best[tail] if tail else 0.0)
+            nxt[node] = tail
+        if not best:
+            return [], 0.0
+        node = max(roots, key=lambda r: best.get(r, 0.0))
+        total, path = best[node], []
+        while node:
+            path.append((node, weight.get(node, 0.0)))
+            node = nxt[node]
+        return path, total
+
+    def collapsed_stacks(self):
+        """Folded stacks (flamegraph.pl / speedscope), values in microseconds
+
+        Each node's frame sits under its path from the trigger in the
+        connections tree (first discovery wins) and sub-nodes sit under the
+        node that called them, so a frame's width is the time spent in that
+        node plus everything downstream of it.
+        """
+        roots, forward = self._forward_graph()
+        parent = {}
+        queue = deque(roots)
+        seen = set(roots)
+        while queue:
+            node = queue.popleft()
+            for child in forward[node]:
+                if child not in seen:
+                    seen.add(child)
+                    parent[child] = node
+                    queue.append(child)
+        parent.update({sub: p for sub, p in self.sub_parents.items() if sub in self.nodes})
+
+        lines = []
+        for node, s in self.nodes.items():
+            stack, cursor, guard = [], node, set()
+            while cursor is not None and cursor not in guard:
+                guard.add(cursor)
+                stack.append(cursor.replace(';', ','))
+                cursor = parent.get(cursor)
+            value = int(round(s['self_ms'] * 1000))
+            if value:
+                lines.append(f"{';'.join(reversed(stack))} {value}")
+        return sorted(lines)
+
+    def to_dict(self):
+        path, total = self.critical_path()
+        return {
+            'executions': [e.id for e in self.executions],
+            'wall_ms': self.wall_ms,
+            'node_ms': self.node_ms,
+            'nodes': sorted(self.nodes.values(), key=lambda s: -s['self_ms']),
+            'critical_path': {'ms': total, 'nodes': [{'node': n, 'ms': ms} for n, ms in path]},
+        }
+
+
+def _ms(value):
+    return f"{value / 1000:.1f} s" if value >= 1000 else f"{value:.1f} ms"
+
+
+def print_report(profile, top=None):
+    report = profile.to_dict()
+    print(f"{len(report['executions'])} execution(s), mean wall time {_ms(report['wall_ms'])}, "
+          f"node time {_ms(report['node_ms'])}\n")
+    width = max([len(s['node']) for s in report['nodes']] + [4])
+    print(f"{'node':<{width}}  {'runs':>5}  {'mean/exec':>10}  {'max run':>10}  {'items':>7}  share")
+    for s in report['nodes'][:top]:
+        print(f"{s['node']:<{width}}  {s['runs']:>5}  {_ms(s['mean_ms']):>10}  {_ms(s['max_ms']):>10}  "
+              f"{s['items']:>7}  {s['share'] * 100:5.1f}%" + (f"  ({s['errors']} failed)" if s['errors'] else ''))
+    critical = report['critical_path']
+    print(f"\nCritical path: {_ms(critical['ms'])} of {_ms(report['node_ms'])} node time")
+    for step in critical['nodes']:
+        print(f"  {_ms(step['ms']):>10}  {step['node']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-node timing and critical path from n8n executions')
+    parser.add_argument('files', nargs='*', help='execution JSON files or local fixtures')
+    parser.add_argument('--execution', action='append', default=[], help='execution ID to fetch from the API')
+    parser.add_argument('--workflow', help='workflow JSON for connections (default: from the execution)')
+    parser.add_argument('--url', default=os.environ.get('N8N_URL'))
+    parser.add_argument('--format', choices=['text', 'json', 'collapsed'], default='text')
+    parser.add_argument('--top', type=int, help='only list the N slowest nodes')
+    parser.add_argument('--check', action='store_true',
+                        help="exit 1 unless the critical path matches each fixture's expect_critical_path")
+    args = parser.parse_args(argv)
+    if not args.files and not args.execution:
+        parser.error('give execution files or --execution IDs')
+
+    executions = []
+    try:
+        for path in args.files:
+            executions.extend(load_executions(path))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.execution:
+        from n8n_backup import DEFAULT_URL, N8nApiError, N8nClient
+        api_key = os.environ.get('N8N_API_KEY')
+        if not api_key:
+            print("Error: N8N_API_KEY is not set", file=sys.stderr)
+            sys.exit(1)
+        client = N8nClient(args.url or DEFAULT_URL, api_key, workers=2)
+        try:
+            executions.extend(fetch_executions(client, args.execution))
+        except N8nApiError as e:
+            print(f"Error fetching executions: {e}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            client.close()
+
+    profile = Profile(executions, _load_workflow_file(args.workflow) if args.workflow else None)
+    if args.format == 'json':
+        json.dump(profile.to_dict(), sys.stdout, indent=2)
+        print()
+    elif args.format == 'collapsed':
+        print('\n'.join(profile.collapsed_stacks()))
+    else:
+        print_report(profile, args.top)
+
+    if args.check:
+        actual = [node for node, _ in profile.critical_path()[0]]
+        failed = False
+        for path in args.files:
+            expected = expected_critical_path(path)
+            if expected is None:
+                print(f"⚠️  {path}: no expect_critical_path", file=sys.stderr)
+            elif expected == actual:
+                print(f"✅ {path}: critical path matches ({len(actual)} nodes)", file=sys.stderr)
+            else:
+                failed = True
+                step = next((i for i, (e, a) in enumerate(zip(expected, actual)) if e != a),
+                            min(len(expected), len(actual)))
+                want = expected[step] if step < len(expected) else '(end)'
+                got = actual[step] if step < len(actual) else '(end)'
+                print(f"❌ {path}: critical path differs at step {step + 1}: expected '{want}', got '{got}'",
+                      file=sys.stderr)
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,757 @@
+#!/usr/bin/env python3
+"""
+Offline n8n workflow simulator.
+
+Runs a saved workflow locally with executionOrder v1 semantics: each
+branch runs to completion before the next one starts, and sibling
+branches run top to bottom, then left to right, by canvas position.
+Logic nodes (if, switch, merge, set, splitOut, splitInBatches, wait,
+noOp) are evaluated here. ={{ }} expressions and code nodes run in one
+long-lived `node` subprocess (plain $json.field lookups skip it). Nodes
+that talk to the outside world (supabase, postgres, httpRequest, gmail,
+LLM agents, executeWorkflow, ...) are served from recorded fixtures, and
+their resolved parameters are kept so tests can assert on the query or
+request that would have been sent.
+
+Fixtures map node names to output items:
+  {"Get Active Users": [{"id": "u1"}, {"id": "u2"}],          # every run
+   "Search Gmail": {"runs": [[{"id": "m1"}], []]},            # per run
+   "Get Token": {"error": "401 Unauthorized"}}                # node fails
+
+Test cases are JSON files:
+  {"workflow": "workflows/Bippity-Scheduled-Email-Check.json",
+   "input": [{}], "fixtures": {...}, "now": "2026-01-15T12:00:00Z",
+   "expect": {"Dedupe Messages": {"count": 2, "items": [{"id": "m1"}]}},
+   "expect_not_run": ["Mark Needs Reauth"]}
+
+Usage:
+  python3 workflow_sim.py run WORKFLOW [--input FILE] [--fixtures FILE] [--start NODE]
+  python3 workflow_sim.py test CASE.json [CASE.json ...]
+  python3 workflow_sim.py test sim_cases/*.json
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from workflow_io import unwrap_envelope
+
+MAX_STEPS = 10000
+
+JS_RUNTIME = r"""
+const vm = require('vm');
+const readline = require('readline');
+const pad = (n) => String(n).padStart(2, '0');
+function makeNow(iso) {
+  const d = iso ? new Date(iso) : new Date();
+  const fmt = (f) => f.replace(/yyyy|MM|dd|HH|mm|ss/g, (t) => ({
+    yyyy: d.getUTCFullYear(), MM: pad(d.getUTCMonth() + 1), dd: pad(d.getUTCDate()),
+    HH: pad(d.getUTCHours()), mm: pad(d.getUTCMinutes()), ss: pad(d.getUTCSeconds()),
+  })[t]);
+  return {
+    toISO: () => d.toISOString(), toISOString: () => d.toISOString(), toMillis: () => d.getTime(),
+    format: fmt, toFormat: fmt, toJSDate: () => d, toString: () => d.toISOString(),
+    valueOf: () => d.getTime(), toJSON: () => d.toISOString(),
+  };
+}
+function unexecuted(name) {
+  const fail = () => { throw new Error(`Referenced node '${name}' is unexecuted`); };
+  return { all: fail, first: fail, last: fail, get item() { return fail(); }, get json() { return fail(); }, isExecuted: false };
+}
+function accessor(list, index) {
+  const items = (list || []).map((json) => ({ json }));
+  return {
+    all: () => items, first: () => items[0], last: () => items[items.length - 1],
+    item: items[index] || items[0], get json() { return (items[index] || items[0] || {}).json; },
+    isExecuted: list !== undefined && list !== null,
+  };
+}
+// Node globals n8n's Code node sandbox passes through
+const NODE_GLOBALS = {
+  Buffer, URL, URLSearchParams, TextEncoder, TextDecoder, AbortController, structuredClone,
+  atob, btoa, setTimeout, clearTimeout, setInterval, clearInterval, setImmediate, clearImmediate,
+  queueMicrotask,
+};
+function context(req) {
+  const index = req.index || 0;
+  const input = accessor(req.items, index);
+  const nodes = req.nodes || {};
+  const $ = (name) => (nodes[name] == null ? unexecuted(name) : accessor(nodes[name], index));
+  return {
+    ...NODE_GLOBALS,
+    $input: input, $json: input.item ? input.item.json : {}, items: input.all(), item: input.item,
+    $, $node: new Proxy({}, { get: (_, name) => $(name) }),
+    $now: makeNow(req.now), $today: makeNow(req.now),
+    $execution: { id: 'simulated', mode: 'manual' }, $workflow: req.workflow || {},
+    $env: req.env || {}, $vars: req.env || {}, $runIndex: 0, $itemIndex: index,
+    console: { log() {}, warn() {}, error() {} },
+  };
+}
+const rl = readline.createInterface({ input: process.stdin });
+let chain = Promise.resolve();
+rl.on('line', (line) => {
+  chain = chain.then(async () => {
+    const req = JSON.parse(line);
+    let reply;
+    try {
+      const ctx = vm.createContext(context(req));
+      const source = req.op === 'code' ? `(async () => {\n${req.code}\n})()` : `(${req.code})`;
+      const result = await vm.runInContext(source, ctx, { timeout: req.timeout || 5000 });
+      reply = { ok: true, result: result === undefined ? null : result };
+    } catch (e) {
+      reply = { ok: false, error: String(e && e.message ? e.message : e) };
+    }
+    process.stdout.write(JSON.stringify(reply) + '\n');
+  });
+});
+"""
+
+_EXPRESSION = re.compile(r'\{\{(.*?)\}\}', re.S)
+_SIMPLE_JSON_PATH = re.compile(r'^\s*\$json((?:\.[A-Za-z_$][\w$]*)*)\s*$')
+_NODE_REFERENCE = re.compile(r'''\$(?:\(\s*|node\[\s*)(['"])(.+?)\1''')
+
+PASSTHROUGH_TYPES = frozenset([
+    'n8n-nodes-base.noOp',
+    'n8n-nodes-base.wait',
+    'n8n-nodes-base.respondToWebhook',
+])
+
+
+class SimulationError(Exception):
+    """Raised when a workflow can't be simulated (or a node fails)"""
+
+
+class JsRuntime:
+    """Persistent node.js process that evaluates expressions and code nodes"""
+
+    def __init__(self, command='node'):
+        self.command = command
+        self.proc = None
+        self.calls = 0
+
+    def call(self, op, code, **context):
+        if self.proc is None:
+            self.proc = subprocess.Popen(
+                [self.command, '-e', JS_RUNTIME],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+            )
+        self.calls += 1
+        self.proc.stdin.write(json.dumps({'op': op, 'code': code, **context}) + '\n')
+        self.proc.stdin.flush()
+        line = self.proc.stdout.readline()
+        if not line:
+            raise SimulationError('JS runtime exited unexpectedly')
+        reply = json.loads(line)
+        if not reply['ok']:
+            raise SimulationError(reply['error'])
+        return reply['result']
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _normalize_items(result):
+    """Turn a code node's return value into a list of json dicts"""
+    if result is None:
+        return []
+    if not isinstance(result, list):
+        result = [result]
+    items = []
+    for item in result:
+        if isinstance(item, dict) and isinstance(item.get('json'), dict):
+            items.append(item['json'])
+        elif isinstance(item, dict):
+            items.append(item)
+        else:
+            raise SimulationError(f"Code node returned a non-object item: {item!r}")
+    return items
+
+
+def _to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_datetime(value):
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return None
+
+
+def _is_empty(value):
+    return value is None or value == '' or value == [] or value == {}
+
+
+def compare(operator, left, right, case_sensitive=True):
+    """Evaluate one filter condition the way n8n's filter parameter does"""
+    kind = operator.get('type', 'string')
+    op = operator.get('operation', 'equals')
+
+    if op == 'exists':
+        return left is not None
+    if op == 'notExists':
+        return left is None
+    if op == 'empty':
+        return _is_empty(left)
+    if op == 'notEmpty':
+        return not _is_empty(left)
+
+    if kind == 'string':
+        left = '' if left is None else str(left)
+        right = '' if right is None else str(right)
+        if not case_sensitive:
+            left, right = left.lower(), right.lower()
+        checks = {
+            'equals': lambda: left == right,
+            'notEquals': lambda: left != right,
+            'contains': lambda: right in left,
+            'notContains': lambda: right not in left,
+            'startsWith': lambda: left.startswith(right),
+            'notStartsWith': lambda: not left.startswith(right),
+            'endsWith': lambda: left.endswith(right),
+            'notEndsWith': lambda: not left.endswith(right),
+            'regex': lambda: re.search(right, left) is not None,
+            'notRegex': lambda: re.search(right, left) is None,
+        }
+    elif kind == 'number':
+        left, right = _to_number(left), _to_number(right)
+        numeric = left is not None and right is not None
+        checks = {
+            'equals': lambda: left == right,
+            'notEquals': lambda: left != right,
+            'gt': lambda: numeric and left > right,
+            'lt': lambda: numeric and left < right,
+            'gte': lambda: numeric and left >= right,
+            'lte': lambda: numeric and left <= right,
+        }
+    elif kind == 'boolean':
+        truthy = left is True or (isinstance(left, str) and left.lower() == 'true')
+        checks = {
+            'true': lambda: truthy,
+            'false': lambda: not truthy,
+            'equals': lambda: left == right,
+            'notEquals': lambda: left != right,
+        }
+    elif kind == 'array':
+        left = left if isinstance(left, list) else []
+        length = len(left)
+        size = _to_number(right)
+        checks = {
+            'contains': lambda: right in left,
+            'notContains': lambda: right not in left,
+            'lengthEquals': lambda: length == size,
+            'lengthNotEquals': lambda: length != size,
+            'lengthGt': lambda: size is not None and length > size,
+            'lengthLt': lambda: size is not None and length < size,
+            'lengthGte': lambda: size is not None and length >= size,
+            'lengthLte': lambda: size is not None and length <= size,
+        }
+    elif kind == 'dateTime':
+        left, right = _to_datetime(left), _to_datetime(right)
+        known = left is not None and right is not None
+        checks = {
+            'equals': lambda: known and left == right,
+            'notEquals': lambda: known and left != right,
+            'after': lambda: known and left > right,
+            'before': lambda: known and left < right,
+            'afterOrEquals': lambda: known and left >= right,
+            'beforeOrEquals': lambda: known and left <= right,
+        }
+    else:
+        checks = {
+            'equals': lambda: left == right,
+            'notEquals': lambda: left != right,
+        }
+
+    if op not in checks:
+        raise SimulationError(f"Unsupported condition {kind}.{op}")
+    return bool(checks[op]())
+
+
+class SimulationResult:
+    """Per-node runs, execution order and recorded external requests"""
+
+    def __init__(self):
+        self.order = []
+        self.runs = defaultdict(list)
+        self.requests = defaultdict(list)
+        self.elapsed = 0.0
+
+    def items(self, node, output=0, run=-1):
+        runs = self.runs.get(node)
+        if not runs:
+            return []
+        outputs = runs[run]
+        return outputs[output] if output < len(outputs) else []
+
+    def summary(self):
+        lines = []
+        for i, name in enumerate(self.order):
+            counts = '/'.join(str(len(o)) for o in self.runs[name][self.order[:i + 1].count(name) - 1])
+            lines.append(f"{i + 1:3d}. {name} -> {counts or '0'}")
+        return lines
+
+
+class Simulator:
+    """Execute one workflow against fixtures"""
+
+    def __init__(self, workflow, fixtures=None, runtime=None, now=None, env=None):
+        self.workflow = workflow
+        self.nodes = {n['name']: n for n in workflow.get('nodes', [])}
+        self.connections = {
+            source: outputs.get('main') or []
+            for source, outputs in (workflow.get('connections') or {}).items()
+        }
+        self.input_counts = defaultdict(set)
+        for outputs in self.connections.values():
+            for targets in outputs:
+                for target in targets or []:
+                    self.input_counts[target['node']].add(target.get('index', 0))
+        self.fixtures = fixtures or {}
+        self.runtime = runtime or JsRuntime()
+        self.now = now
+        self.env = env or {}
+        self.fixture_runs = defaultdict(int)
+        self.state = {}
+        self.last_output = {}
+
+    # -- expressions -----------------------------------------------------
+
+    def _js_context(self, code, items, index):
+        referenced = {m.group(2) for m in _NODE_REFERENCE.finditer(code)}
+        return {
+            'items': items,
+            'index': index,
+            'nodes': {name: self.last_output.get(name) for name in referenced},
+            'now': self.now,
+            'env': self.env,
+            'workflow': {'id': self.workflow.get('id'), 'name': self.workflow.get('name')},
+        }
+
+    def evaluate(self, expression, items, index):
+        match = _SIMPLE_JSON_PATH.match(expression)
+        if match:
+            value = items[index] if index < len(items) else {}
+            for key in filter(None, match.group(1).split('.')):
+                value = value.get(key) if isinstance(value, dict) else None
+            return value
+        return self.runtime.call('expr', expression, **self._js_context(expression, items, index))
+
+    def resolve(self, value, items, index=0):
+        """Resolve ={{ }} expressions anywhere inside a parameter value"""
+        if isinstance(value, dict):
+            return {k: self.resolve(v, items, index) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.resolve(v, items, index) for v in value]
+        if not isinstance(value, str) or not value.startswith('='):
+            return value
+        template = value[1:]
+        parts = _EXPRESSION.split(template)
+        if len(parts) == 3 and not parts[0].strip() and not parts[2].strip():
+            return self.evaluate(parts[1], items, index)
+        rendered = []
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                rendered.append(part)
+                continue
+            result = self.evaluate(part, items, index)
+            if result is None:
+                rendered.append('')
+            elif isinstance(result, (dict, list)):
+                rendered.append(json.dumps(result))
+            elif isinstance(result, bool):
+                rendered.append('true' if result else 'false')
+            else:
+                rendered.append(str(result))
+        return ''.join(rendered)
+
+    def _filter_matches(self, spec, items, index):
+        options = spec.get('options') or {}
+        case_sensitive = options.get('caseSensitive', True)
+        results = (
+            compare(
+                cond.get('operator') or {},
+                self.resolve(cond.get('leftValue'), items, index),
+                self.resolve(cond.get('rightValue'), items, index),
+                case_sensitive,
+            )
+            for cond in spec.get('conditions', [])
+        )
+        return any(results) if spec.get('combinator') == 'or' else all(results)
+
+    # -- node handlers ---------------------------------------------------
+
+    def _run_code(self, node, inputs):
+        params = node.get('parameters') or {}
+        code = params.get('jsCode')
+        if code is None:
+            raise SimulationError(f"Code node '{node['name']}' has no jsCode (only JavaScript is supported)")
+        items = inputs.get(0, [])
+        if params.get('mode') == 'runOnceForEachItem':
+            out = []
+            for i in range(len(items)):
+                result = self.runtime.call('code', code, **self._js_context(code, items, i))
+                out.extend(_normalize_items(result))
+            return [out]
+        return [_normalize_items(self.runtime.call('code', code, **self._js_context(code, items, 0)))]
+
+    def _run_if(self, node, inputs):
+        spec = (node.get('parameters') or {}).get('conditions') or {}
+        if 'conditions' not in spec:
+            raise SimulationError(f"IF node '{node['name']}' uses an unsupported (v1) condition format")
+        items = inputs.get(0, [])
+        true_items, false_items = [], []
+        for i, item in enumerate(items):
+            (true_items if self._filter_matches(spec, items, i) else false_items).append(item)
+        return [true_items, false_items]
+
+    def _run_switch(self, node, inputs):
+        params = node.get('parameters') or {}
+        items = inputs.get(0, [])
+        if params.get('mode') == 'expression':
+            outputs = [[] for _ in range(int(params.get('numberOutputs', 4)))]
+            for i, item in enumerate(items):
+                index = int(self.resolve(params.get('output'), items, i))
+                if 0 <= index < len(outputs):
+                    outputs[index].append(item)
+            return outputs
+
+        rules = (params.get('rules') or {}).get('values') or []
+        options = params.get('options') or {}
+        fallback = options.get('fallbackOutput', 'none')
+        all_matches = options.get('allMatchingOutputs', False)
+        outputs = [[] for _ in range(len(rules) + (1 if fallback == 'extra' else 0))]
+        for i, item in enumerate(items):
+            matched = False
+            for r, spec in enumerate(rules):
+                conditions = dict(spec.get('conditions') or {})
+                if 'caseSensitive' in options:
+                    conditions['options'] = {**(conditions.get('options') or {}),
+                                             'caseSensitive': options['caseSensitive']}
+                if self._filter_matches(conditions, items, i):
+                    outputs[r].append(item)
+                    matched = True
+                    if not all_matches:
+                        break
+            if not matched:
+                if fallback == 'extra':
+                    outputs[-1].append(item)
+                elif isinstance(fallback, str) and fallback.startswith('output_'):
+                    outputs[int(fallback[len('output_'):])].append(item)
+                elif isinstance(fallback, int):
+                    outputs[fallback].append(item)
+        return outputs
+
+    def _run_merge(self, node, inputs):
+        params = node.get('parameters') or {}
+        mode = params.get('mode', 'append')
+        count = max(int(params.get('numberInputs', 2)), max(inputs, default=0) + 1)
+        streams = [inputs.get(i, []) for i in range(count)]
+        if mode == 'append':
+            return [[item for stream in streams for item in stream]]
+        if mode == 'chooseBranch':
+            return [streams[int(params.get('useDataOfInput', 1)) - 1]]
+        if mode == 'combine':
+            combine_by = params.get('combineBy', 'combineByFields')
+            first, second = streams[0], streams[1]
+            if combine_by == 'combineByPosition':
+                return [[{**a, **b} for a, b in zip(first, second)]]
+            if combine_by == 'combineAll':
+                return [[{**a, **b} for a in first for b in second]]
+            fields = [f.strip() for f in str(params.get('fieldsToMatchString', '')).split(',') if f.strip()]
+            index = defaultdict(list)
+            for b in second:
+                index[tuple(b.get(f) for f in fields)].append(b)
+            return [[{**a, **b} for a in first for b in index.get(tuple(a.get(f) for f in fields), [])]]
+        raise SimulationError(f"Merge node '{node['name']}' uses unsupported mode '{mode}'")
+
+    def _run_set(self, node, inputs):
+        params = node.get('parameters') or {}
+        items = inputs.get(0, [])
+        out = []
+        for i, item in enumerate(items):
+            if params.get('mode') == 'raw':
+                value = self.resolve(params.get('jsonOutput'), items, i)
+                out.append(json.loads(value) if isinstance(value, str) else value)
+                continue
+            new = dict(item) if params.get('includeOtherFields') else {}
+            for assignment in (params.get('assignments') or {}).get('assignments', []):
+                target = new
+                *parents, leaf = str(assignment.get('name', '')).split('.')
+                for part in parents:
+                    target = target.setdefault(part, {})
+                target[leaf] = self.resolve(assignment.get('value'), items, i)
+            out.append(new)
+        return [out]
+
+    def _run_split_out(self, node, inputs):
+        params = node.get('parameters') or {}
+        fields = [f.strip() for f in str(params.get('fieldToSplitOut', '')).split(',') if f.strip()]
+        out = []
+        for item in inputs.get(0, []):
+            for field in fields:
+                values = item.get(field)
+                for value in values if isinstance(values, list) else ([values] if values is not None else []):
+                    out.append(value if isinstance(value, dict) else {field: value})
+        return [out]
+
+    def _run_split_in_batches(self, node, inputs):
+        size = int((node.get('parameters') or {}).get('batchSize', 1))
+        state = self.state.get(node['name'])
+        if state is None or state['done']:
+            state = {'pending': list(inputs.get(0, [])), 'processed': [], 'done': False}
+            self.state[node['name']] = state
+        else:
+            # Items coming back around the loop
+            state['processed'].extend(inputs.get(0, []))
+        if state['pending']:
+            batch, state['pending'] = state['pending'][:size], state['pending'][size:]
+            return [[], batch]
+        state['done'] = True
+        return [state['processed'], []]
+
+    def _run_fixture(self, node, inputs, result):
+        name = node['name']
+        items = inputs.get(0, [])
+        for i in range(max(1, len(items))):
+            try:
+                result.requests[name].append(self.resolve(node.get('parameters') or {}, items, i))
+            except SimulationError as e:
+                result.requests[name].append({'_unresolved': str(e)})
+
+        fixture = self.fixtures[name]
+        run = self.fixture_runs[name]
+        self.fixture_runs[name] += 1
+        if isinstance(fixture, dict) and 'error' in fixture:
+            raise SimulationError(fixture['error'])
+        if isinstance(fixture, dict) and 'runs' in fixture:
+            runs = fixture['runs']
+            output = runs[min(run, len(runs) - 1)] if runs else []
+        else:
+            output = fixture
+        return [list(output)]
+
+    HANDLERS = {
+        'n8n-nodes-base.code': _run_code,
+        'n8n-nodes-base.if': _run_if,
+        'n8n-nodes-base.switch': _run_switch,
+        'n8n-nodes-base.merge': _run_merge,
+        'n8n-nodes-base.set': _run_set,
+        'n8n-nodes-base.splitOut': _run_split_out,
+        'n8n-nodes-base.splitInBatches': _run_split_in_batches,
+    }
+
+    def _execute(self, name, inputs, result):
+        node = self.nodes[name]
+        node_type = node.get('type', '')
+        try:
+            if name in self.fixtures:
+                outputs = self._run_fixture(node, inputs, result)
+            elif node.get('disabled') or node_type in PASSTHROUGH_TYPES or _is_trigger(node_type):
+                outputs = [inputs.get(0, [])]
+            elif node_type in self.HANDLERS:
+                outputs = self.HANDLERS[node_type](self, node, inputs)
+            else:
+                raise SimulationError(f"No fixture for node '{name}' ({node_type})")
+        except SimulationError as e:
+            on_error = node.get('onError')
+            error_items = [{'error': str(e)}]
+            if on_error == 'continueErrorOutput':
+                outputs = [[] for _ in self.connections.get(name, [[], []])]
+                outputs[-1] = error_items
+            elif on_error == 'continueRegularOutput' or node.get('continueOnFail'):
+                outputs = [error_items]
+            else:
+                raise SimulationError(f"Node '{name}' failed: {e}") from None
+
+        if node.get('alwaysOutputData') and not any(outputs):
+            outputs = [[{}]] + outputs[1:]
+        result.order.append(name)
+        result.runs[name].append(outputs)
+        # $('Node') sees the branch that fired (a splitInBatches loop item is on output 1)
+        self.last_output[name] = next((o for o in outputs if o), outputs[0] if outputs else [])
+        return outputs
+
+    def _children(self, name, outputs):
+        children = []
+        for output_index, items in enumerate(outputs):
+            if not items or output_index >= len(self.connections.get(name, [])):
+                continue
+            for target in self.connections[name][output_index] or []:
+                children.append((target['node'], target.get('index', 0), items))
+        # v1: sibling branches run top to bottom, then left to right
+        children.sort(key=lambda c: tuple(reversed(self.nodes[c[0]].get('position', [0, 0]))))
+        return children
+
+    def _expected_inputs(self, name):
+        node = self.nodes[name]
+        if node.get('type') == 'n8n-nodes-base.merge':
+            return int((node.get('parameters') or {}).get('numberInputs', 2))
+        return len(self.input_counts.get(name, ())) or 1
+
+    def run(self, input_items=None, start=None):
+        """Run from start (default: the first trigger node)"""
+        if start is None:
+            triggers = [n['name'] for n in self.workflow.get('nodes', []) if _is_trigger(n.get('type', ''))]
+            if not triggers:
+                raise SimulationError('Workflow has no trigger node; pass start=')
+            start = triggers[0]
+        if start not in self.nodes:
+            raise SimulationError(f"Unknown start node '{start}'")
+
+        result = SimulationResult()
+        started = time.perf_counter()
+        stack = [(start, 0, list(input_items if input_items is not None else [{}]))]
+        waiting = {}
+        steps = 0
+        while stack or waiting:
+            steps += 1
+            if steps > MAX_STEPS:
+                raise SimulationError(f"Gave up after {MAX_STEPS} node executions (infinite loop?)")
+            if stack:
+                name, input_index, items = stack.pop()
+                if self._expected_inputs(name) > 1:
+                    received = waiting.setdefault(name, {})
+                    received.setdefault(input_index, []).extend(items)
+                    if len(received) < self._expected_inputs(name):
+                        continue
+                    inputs = waiting.pop(name)
+                else:
+                    inputs = {0: items}
+            else:
+                # Nothing else can feed the waiting nodes; run them with what they have
+                name = next(iter(waiting))
+                inputs = waiting.pop(name)
+            outputs = self._execute(name, inputs, result)
+            stack.extend(reversed(self._children(name, outputs)))
+
+        result.elapsed = time.perf_counter() - started
+        return result
+
+
+def _is_trigger(node_type):
+    return node_type.lower().endswith('trigger') or node_type == 'n8n-nodes-base.webhook'
+
+
+def load_workflow(path):
+    with open(path) as f:
+        return unwrap_envelope(json.load(f))
+
+
+def _subset(expected, actual):
+    if isinstance(expected, dict):
+        return isinstance(actual, dict) and all(k in actual and _subset(v, actual[k]) for k, v in expected.items())
+    if isinstance(expected, list):
+        return isinstance(actual, list) and len(expected) == len(actual) and all(
+            _subset(e, a) for e, a in zip(expected, actual))
+    return expected == actual
+
+
+def check_case(case, result):
+    """Compare a result with a test case's expectations; returns failure messages"""
+    failures = []
+    for name, expect in (case.get('expect') or {}).items():
+        if name not in result.runs:
+            failures.append(f"{name}: did not run")
+            continue
+        items = result.items(name, expect.get('output', 0), expect.get('run', -1))
+        if 'count' in expect and len(items) != expect['count']:
+            failures.append(f"{name}: expected {expect['count']} items, got {len(items)}")
+        if 'items' in expect and not _subset(expect['items'], items):
+            failures.append(f"{name}: items differ: {json.dumps(items)[:300]}")
+    for name in case.get('expect_not_run') or []:
+        if name in result.runs:
+            failures.append(f"{name}: ran but should not have")
+    return failures
+
+
+def run_case(path, runtime):
+    with open(path) as f:
+        case = json.load(f)
+    workflow_path = Path(case['workflow'])
+    if not workflow_path.is_absolute() and not workflow_path.exists():
+        workflow_path = Path(path).parent / workflow_path
+    sim = Simulator(load_workflow(workflow_path), case.get('fixtures'), runtime, case.get('now'), case.get('env'))
+    try:
+        result = sim.run(case.get('input'), case.get('start'))
+    except SimulationError as e:
+        return [str(e)], None
+    return check_case(case, result), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run n8n workflows offline against fixtures')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_cmd = sub.add_parser('run', help='run one workflow and print the execution trace')
+    run_cmd.add_argument('workflow')
+    run_cmd.add_argument('--input', help='JSON file with the trigger items')
+    run_cmd.add_argument('--fixtures', help='JSON file mapping node names to output items')
+    run_cmd.add_argument('--start', help='start node (default: first trigger)')
+    run_cmd.add_argument('--now', help='ISO timestamp for $now')
+    run_cmd.add_argument('--json', action='store_true', help='print every node output as JSON')
+    test_cmd = sub.add_parser('test', help='run regression case files')
+    test_cmd.add_argument('cases', nargs='+')
+    args = parser.parse_args(argv)
+
+    with JsRuntime() as runtime:
+        if args.command == 'run':
+            input_items, fixtures = None, {}
+            if args.input:
+                with open(args.input) as f:
+                    input_items = json.load(f)
+            if args.fixtures:
+                with open(args.fixtures) as f:
+                    fixtures = json.load(f)
+            sim = Simulator(load_workflow(args.workflow), fixtures, runtime, args.now)
+            try:
+                result = sim.run(input_items, args.start)
+            except SimulationError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+            if args.json:
+                json.dump({'order': result.order, 'runs': result.runs, 'requests': result.requests},
+                          sys.stdout, indent=2)
+                print()
+            else:
+                print('\n'.join(result.summary()))
+                print(f"\n{len(result.order)} node executions in {result.elapsed * 1000:.1f} ms")
+            return
+
+        started = time.perf_counter()
+        failed = 0
+        for path in args.cases:
+            failures, result = run_case(path, runtime)
+            if failures:
+                failed += 1
+                print(f"FAIL {path}")
+                for failure in failures:
+                    print(f"  {failure}")
+            else:
+                print(f"ok   {path} ({result.elapsed * 1000:.1f} ms)")
+        elapsed = time.perf_counter() - started
+        print(f"\n{len(args.cases) - failed} passed, {failed} failed in {elapsed:.2f}s")
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
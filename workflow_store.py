@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Content-addressed, deduplicated snapshot store for n8n workflows.
+
+Each workflow is split into one blob per node plus one blob for everything
+else (connections, settings, ...). Blobs are keyed by the SHA-256 of their
+canonical JSON and stored once under workflows/.store/objects, zlib
+compressed, so identical nodes shared by copies like processor_import.json
+and processor_ready.json, or by consecutive hourly backups, cost nothing
+extra. A snapshot is a small tree blob listing those hashes, and each
+workflow has an append-only history of (saved_at, tree) lines.
+
+Restoring a snapshot only reads the blobs that are not already in the
+caller's cache, so walking a workflow's history reads O(changed nodes)
+per step.
+
+Usage:
+  python3 workflow_store.py save workflows/*.json
+  python3 workflow_store.py history <workflow_id>
+  python3 workflow_store.py restore <workflow_id> [--at ISO_TIME] [-o FILE]
+  python3 workflow_store.py stats
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+from workflow_io import WORKFLOWS_DIR, canonical_json, unwrap_envelope, workflow_key
+
+DEFAULT_STORE = WORKFLOWS_DIR / '.store'
+
+
+class WorkflowStore:
+    """Blob + tree store rooted at a directory (default workflows/.store)"""
+
+    def __init__(self, root=DEFAULT_STORE):
+        self.root = Path(root)
+        self.objects = self.root / 'objects'
+        self.history_dir = self.root / 'history'
+        self._known = set()
+
+    def _blob_path(self, digest):
+        return self.objects / digest[:2] / digest[2:]
+
+    def put(self, obj):
+        """Store obj once and return its hash"""
+        data = canonical_json(obj).encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self._known:
+            return digest
+        path = self._blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(data))
+            os.replace(tmp_path, path)
+        self._known.add(digest)
+        return digest
+
+    def get(self, digest, cache=None):
+        if cache is not None and digest in cache:
+            return cache[digest]
+        with open(self._blob_path(digest), 'rb') as f:
+            obj = json.loads(zlib.decompress(f.read()))
+        if cache is not None:
+            cache[digest] = obj
+        return obj
+
+    def history(self, key):
+        """List snapshot entries for a workflow, oldest first"""
+        path = self.history_dir / f"{key}.jsonl"
+        if not path.exists():
+            return []
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def last(self, key):
+        """The newest history entry for a workflow (reads only the file's tail), or None"""
+        path = self.history_dir / f"{key}.jsonl"
+        try:
+            with open(path, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                tail = b''
+                while size:
+                    step = min(size, 4096)
+                    size -= step
+                    f.seek(size)
+                    tail = f.read(step) + tail
+                    lines = tail.rstrip(b'\n').split(b'\n')
+                    if len(lines) > 1 or not size:
+                        return json.loads(lines[-1]) if lines[-1].strip() else None
+        except FileNotFoundError:
+            pass
+        return None
+
+    def save(self, workflow, saved_at=None):
+        """Snapshot a workflow; returns the history entry (None if unchanged)"""
+        meta = {k: v for k, v in workflow.items() if k != 'nodes'}
+        tree = {
+            'meta': self.put(meta),
+            'nodes': [self.put(node) for node in workflow.get('nodes', [])],
+        }
+        tree_hash = self.put(tree)
+
+        key = workflow_key(workflow)
+        last = self.last(key)
+        if last and last['tree'] == tree_hash:
+            return None
+
+        entry = {
+            'saved_at': saved_at or datetime.now(timezone.utc).isoformat(),
+            'tree': tree_hash,
+            'name': workflow.get('name', ''),
+            'updatedAt': workflow.get('updatedAt', ''),
+        }
+        self.history_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.history_dir / f"{key}.jsonl", 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        return entry
+
+    def find(self, key, at=None):
+        """Latest history entry for key saved at or before `at` (ISO string)"""
+        candidates = [e for e in self.history(key) if at is None or e['saved_at'] <= at]
+        return candidates[-1] if candidates else None
+
+    def restore(self, tree_hash, cache=None):
+        """Rebuild a workflow from its tree hash"""
+        if cache is None:
+            cache = {}
+        tree = self.get(tree_hash, cache)
+        workflow = dict(self.get(tree['meta'], cache))
+        workflow['nodes'] = [self.get(h, cache) for h in tree['nodes']]
+        return workflow
+
+    def stats(self):
+        blobs, stored = 0, 0
+        for path in self.objects.glob('*/*'):
+            if not path.name.endswith('.tmp'):
+                blobs += 1
+                stored += path.stat().st_size
+        snapshots = sum(len(self.history(p.stem)) for p in self.history_dir.glob('*.jsonl'))
+        return {'blobs': blobs, 'bytes': stored, 'snapshots': snapshots}
+
+
+def load_workflow_file(path):
+    """Read a workflow file, unwrapping the {success, data} API envelope"""
+    with open(path) as f:
+        return unwrap_envelope(json.load(f))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Deduplicated workflow snapshot store')
+    parser.add_argument('--store', default=str(DEFAULT_STORE))
+    sub = parser.add_subparsers(dest='command', required=True)
+    save_cmd = sub.add_parser('save', help='snapshot workflow JSON files')
+    save_cmd.add_argument('files', nargs='+')
+    history_cmd = sub.add_parser('history', help='list snapshots of a workflow')
+    history_cmd.add_argument('key')
+    restore_cmd = sub.add_parser('restore', help='rebuild a workflow snapshot')
+    restore_cmd.add_argument('key')
+    restore_cmd.add_argument('--at', help='latest snapshot at or before this ISO time')
+    restore_cmd.add_argument('-o', '--output')
+    sub.add_parser('stats', help='show blob and snapshot counts')
+    args = parser.parse_args(argv)
+
+    store = WorkflowStore(args.store)
+
+    if args.command == 'save':
+        raw = 0
+        for path in args.files:
+            try:
+                workflow = load_workflow_file(path)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {path}: {e}", file=sys.stderr)
+                continue
+            if not isinstance(workflow, dict) or 'nodes' not in workflow:
+                print(f"Skipping {path}: not a workflow", file=sys.stderr)
+                continue
+            raw += os.path.getsize(path)
+            entry = store.save(workflow)
+            status = f"snapshot {entry['tree'][:12]}" if entry else "unchanged"
+            print(f"{path}: {status}")
+        stats = store.stats()
+        print(f"\n{stats['blobs']} blobs, {stats['bytes'] / 1024:.0f} KB stored "
+              f"for {raw / 1024:.0f} KB of input, {stats['snapshots']} snapshots")
+
+    elif args.command == 'history':
+        for entry in store.history(args.key):
+            print(f"{entry['saved_at']}  {entry['tree'][:12]}  {entry['name']}")
+
+    elif args.command == 'restore':
+        entry = store.find(args.key, args.at)
+        if not entry:
+            print(f"Error: no snapshot for {args.key}", file=sys.stderr)
+            sys.exit(1)
+        workflow = store.restore(entry['tree'])
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(workflow, f, indent=2)
+            print(f"Restored {entry['saved_at']} -> {args.output}")
+        else:
+            json.dump(workflow, sys.stdout, indent=2)
+
+    elif args.command == 'stats':
+        stats = store.stats()
+        print(f"{stats['blobs']} blobs, {stats['bytes'] / 1024:.0f} KB, {stats['snapshots']} snapshots")
+
+
+if __name__ == '__main__':
+    main()